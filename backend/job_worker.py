@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+F3 Job Worker
+=============
+Runs async /api/chat jobs from the SQLite job queue (JOB_BACKEND=sqlite)
+in separate processes, so long generations don't share the API server's
+event loop and a crashed worker only costs a retry.
+
+Start it from the same directory as the API server (both must use the
+same f3_platform.db):
+    JOB_BACKEND=sqlite python start_server.py
+    python job_worker.py --processes 4 --concurrency 2
+
+Each process claims jobs with a lease it renews while the job runs. A
+process that dies is restarted, and its job is claimed again once the
+lease expires (JOB_VISIBILITY_TIMEOUT_SECONDS). Progress and the
+pipeline's WebSocket messages are written to the queue's event table;
+the API process delivers them to the connected clients.
+
+Provider limits: every process (the API and each worker) has its own
+rate limiter, LLM scheduler and circuit breaker, so the configured
+limits are split between them. LLM_RATE_LIMIT_RPM / _BURST,
+LLM_TENANT_RATE_LIMIT_RPM / _BURST, LLM_MAX_CONCURRENCY and
+LLM_INITIAL_CONCURRENCY are divided by LLM_LIMIT_PROCESSES, which
+defaults to --processes + 1 here and, with JOB_BACKEND=sqlite, to
+JOB_WORKER_PROCESSES + 1 in the API process. Start both with the same
+JOB_WORKER_PROCESSES (or LLM_LIMIT_PROCESSES) so the shares add up to
+the configured limits. Each process's circuit breaker still opens on
+its own failures: during an outage every process makes up to
+LLM_BREAKER_FAILURE_THRESHOLD failing calls before it stops.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run /api/chat jobs from the SQLite job queue")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("JOB_WORKER_PROCESSES", "2")),
+                        help="Worker processes to run (restarted if they die)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOB_WORKER_CONCURRENCY", "2")),
+                        help="Jobs each process runs at the same time")
+    parser.add_argument("--poll-interval", type=float, default=0.5,
+                        help="Seconds between queue checks while idle")
+    return parser.parse_args()
+
+
+async def run_job(job, payload, lease):
+    from server.coordinator.agent_coordinator import agent_coordinator
+    from server.coordinator.chat_pipeline import process_chat, persist_chat, to_chat_response
+    from server.models.message_models import ChatRequest
+    from server.services.job_manager import JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED
+    from server.services.conversation_store import conversation_store
+    from server.services.job_queue import job_queue
+
+    request = ChatRequest(**payload)
+    try:
+        print(f" Running job {job.job_id} (attempt {job.attempts}): {request.message[:50]}")
+        job_queue.update_stage(job, lease, "analyzing")
+        work = asyncio.create_task(process_chat(
+            request, job.job_id, on_stage=lambda stage: job_queue.update_stage(job, lease, stage), background=True
+        ))
+
+        # Renew the lease while the pipeline runs; this is also where cancel requests are noticed
+        heartbeat_interval = min(2.0, job_queue.visibility_timeout / 3)
+        lease_lost = cancelling = False
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=heartbeat_interval)
+            if done:
+                break
+            cancel_requested = job_queue.heartbeat(job, lease)
+            if cancel_requested is None and not lease_lost:
+                lease_lost = True
+                print(f" Lost the lease on job {job.job_id}, another worker owns it now")
+                await agent_coordinator.cancel_request(job.job_id, "job lease lost")
+            elif cancel_requested and not cancelling:
+                cancelling = True
+                await agent_coordinator.cancel_request(job.job_id, "job cancelled")
+
+        try:
+            response = work.result()
+        except Exception as e:
+            print(f" Job {job.job_id} failed: {e}")
+            job_queue.finish(job, lease, JOB_FAILED, error=str(e))
+            return
+        if lease_lost:
+            return
+
+        persist_chat(request, response, job.job_id)
+        status = JOB_CANCELLED if response.error == "cancelled" else JOB_COMPLETED
+        job_queue.finish(job, lease, status, result=asdict(to_chat_response(response)))
+        print(f" Job {job.job_id} {status}")
+    finally:
+        # The next message may go to another worker: load it from the database then, not from a stale copy
+        conversation_store.release(request.conversation_id)
+
+
+async def work(worker_id: str, concurrency: int, poll_interval: float):
+    from server.services.job_queue import job_queue
+    from server.services.usage_tracker import usage_tracker
+    from server.services.tracing import tracer
+    from server.services.websocket_service import f3_websocket_manager
+
+    # No clients connect here: everything the pipeline sends goes to the API process
+    f3_websocket_manager.manager.set_relay(job_queue.relay)
+
+    async def flush_events():
+        while True:
+            await asyncio.sleep(job_queue.poll_interval)
+            job_queue.flush_events()
+
+    flusher = asyncio.create_task(flush_events())
+    slots = asyncio.Semaphore(max(1, concurrency))
+    running = set()
+
+    def job_done(task: asyncio.Task):
+        running.discard(task)
+        slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            print(f" Job task crashed: {task.exception()}")
+
+    print(f" Worker {worker_id} waiting for jobs (concurrency: {concurrency})")
+    try:
+        while True:
+            await slots.acquire()
+            claimed = job_queue.claim(worker_id)
+            if claimed is None:
+                slots.release()
+                await asyncio.sleep(poll_interval)
+                continue
+            task = asyncio.create_task(run_job(*claimed))
+            running.add(task)
+            task.add_done_callback(job_done)
+    finally:
+        flusher.cancel()
+        job_queue.flush_events()
+        usage_tracker.flush()
+        tracer.flush()
+
+
+def worker_main(concurrency: int, poll_interval: float):
+    """Entry point of one worker process."""
+    sys.path.insert(0, str(Path(__file__).parent))
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        asyncio.run(work(worker_id, concurrency, poll_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise(processes: int, concurrency: int, poll_interval: float):
+    """Run `processes` workers and restart any that exit."""
+    # Inherited by the spawned workers: they and the API process split the provider limits
+    os.environ.setdefault("LLM_LIMIT_PROCESSES", str(max(1, processes) + 1))
+    context = multiprocessing.get_context("spawn")
+
+    def spawn(index: int):
+        process = context.Process(
+            target=worker_main, args=(concurrency, poll_interval), name=f"f3-job-worker-{index}", daemon=True
+        )
+        process.start()
+        return process
+
+    workers = {index: spawn(index) for index in range(max(1, processes))}
+    print(f" Started {len(workers)} job worker process(es)")
+    try:
+        while True:
+            time.sleep(1.0)
+            for index, process in list(workers.items()):
+                if not process.is_alive():
+                    print(f" Worker {process.name} exited with code {process.exitcode}, restarting it")
+                    workers[index] = spawn(index)
+    except KeyboardInterrupt:
+        print("\n Stopping job workers (running jobs are retried after their lease expires)")
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    supervise(args.processes, args.concurrency, args.poll_interval)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+F3 Cassette Replay Benchmark
+============================
+Replays a recorded session through AgentCoordinator.process_message and
+reports how much of each message's wall time was spent outside the LLM
+(our own pipeline overhead).
+
+Record a cassette first by running the server with:
+    LLM_CASSETTE_MODE=record LLM_CASSETTE_PATH=cassettes/session.jsonl.gz
+
+Then replay it:
+    python replay_cassette.py cassettes/session.jsonl.gz --timing-scale 1.0 --runs 3
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay an LLM cassette through the agent pipeline")
+    parser.add_argument("cassette", help="Path to a .jsonl.gz cassette recorded with LLM_CASSETTE_MODE=record")
+    parser.add_argument("--timing-scale", type=float, default=1.0,
+                        help="Multiply recorded chunk timing (1.0 = real time, 0 = instant)")
+    parser.add_argument("--runs", type=int, default=1, help="How many times to replay the session")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Keep the production rate limits (by default they are lifted so only pipeline time is measured)")
+    return parser.parse_args()
+
+
+async def replay(cassette_path: str, timing_scale: float, runs: int):
+    from server.coordinator.agent_coordinator import agent_coordinator
+    from server.services.ai_service import ai_service
+    from server.services.llm_cassettes import ReplayProvider, load_cassette, KIND_CALL
+
+    entries = load_cassette(cassette_path)
+    recorded_llm_time = {}
+    for entry in entries:
+        if entry.get("kind") == KIND_CALL:
+            conversation_id = entry.get("conversation_id")
+            recorded_llm_time[conversation_id] = recorded_llm_time.get(conversation_id, 0.0) + entry["duration"]
+
+    overheads = []
+    for run in range(1, runs + 1):
+        # Fresh provider (and fresh conversations) for every run
+        provider = ReplayProvider(cassette_path, timing_scale=timing_scale)
+        ai_service.set_provider(provider)
+        for message in provider.messages:
+            agent_coordinator.clear_conversation(message["conversation_id"])
+
+        print(f"\n Run {run}/{runs}: {len(provider.messages)} messages")
+        run_start = time.perf_counter()
+        for message in provider.messages:
+            start = time.perf_counter()
+            response = await agent_coordinator.process_message(
+                message=message["message"],
+                conversation_id=message["conversation_id"],
+                project_context=message.get("project_context") or None
+            )
+            elapsed = time.perf_counter() - start
+            status = "error" if response.error else "ok"
+            print(f"   [{status}] {elapsed:.3f}s  {message['message'][:60]}")
+
+        run_elapsed = time.perf_counter() - run_start
+        llm_time = sum(recorded_llm_time.values()) * timing_scale
+        overhead = max(0.0, run_elapsed - llm_time)
+        overheads.append(overhead)
+        print(f"   Wall time: {run_elapsed:.3f}s  scaled LLM time: {llm_time:.3f}s  overhead: {overhead:.3f}s")
+        print(f"   Replay: {provider.get_stats()}")
+
+    if len(overheads) > 1:
+        print(f"\n Overhead over {runs} runs: median {statistics.median(overheads):.3f}s, "
+              f"min {min(overheads):.3f}s, max {max(overheads):.3f}s")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not Path(args.cassette).exists():
+        print(f" Cassette not found: {args.cassette}")
+        sys.exit(1)
+
+    # Replay never talks to a real model, so no API key is needed
+    os.environ["LLM_CASSETTE_MODE"] = "replay"
+    os.environ["LLM_CASSETTE_PATH"] = args.cassette
+    os.environ["LLM_CASSETTE_TIMING_SCALE"] = str(args.timing_scale)
+    if not args.keep_rate_limits:
+        os.environ.setdefault("LLM_RATE_LIMIT_RPM", "100000")
+        os.environ.setdefault("LLM_RATE_LIMIT_BURST", "1000")
+        os.environ.setdefault("LLM_TENANT_RATE_LIMIT_RPM", "100000")
+        os.environ.setdefault("LLM_TENANT_RATE_LIMIT_BURST", "1000")
+    sys.path.insert(0, str(Path(__file__).parent))
+
+    asyncio.run(replay(args.cassette, args.timing_scale, args.runs))
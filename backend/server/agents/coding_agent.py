@@ -7,16 +7,23 @@ Think of it as the "builder" that implements the architect's blueprint.
 SERVER SIDE FILE
 """
 
-from typing import Dict, Any, List, Optional
+import asyncio
+import os
+import time
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 from ..models.message_models import (
     ExecutionPlan,
     ActionStep,
     CodeChange,
-    CodeGenerationResult
+    CodeGenerationResult,
+    LLMCallType
 )
 from ..services.ai_service import ai_service
+from ..services.request_deadline import deadline_policy
+from ..services.llm_scheduler import llm_scheduler
+from ..services.tracing import tracer, OUTCOME_ERROR, OUTCOME_SKIPPED
 from ..utils.prompt_templates import (
-    CODING_AGENT_SYSTEM,
+    CODING_AGENT_INSTRUCTIONS,
     build_coding_prompt
 )
 from .planning_agent import planning_agent  # Import planning agent for optimization
@@ -36,6 +43,8 @@ class CodingAgent:
     def __init__(self):
         """Initialize the Coding Agent."""
         self.name = "CodingAgent"
+        # Independent plan steps generated at the same time (also bounded by the LLM scheduler)
+        self.max_parallel_steps = int(os.getenv("CODING_MAX_PARALLEL_STEPS", "3"))
         print(f"  {self.name} initialized")
     
     async def _silent_callback(self, stream_data: Dict):
@@ -68,51 +77,169 @@ class CodingAgent:
         optimized_plan = planning_agent.optimize_plan(plan)
         print(f"   Optimized steps: {len(optimized_plan.steps)}")
         
+        async def planned_steps():
+            for step in optimized_plan.steps:
+                yield step
+        
+        return await self.execute_plan_stream(
+            planned_steps(),
+            project_context,
+            websocket_callback,
+            conversation_id
+        )
+    
+    
+    async def execute_plan_stream(
+        self,
+        steps: AsyncIterator[ActionStep],
+        project_context: Dict[str, Any],
+        websocket_callback=None,
+        conversation_id: Optional[str] = None
+    ) -> CodeGenerationResult:
+        """
+        Execute plan steps as they arrive (e.g. while the plan is still streaming).
+        
+        Applies the same optimizations as optimize_plan incrementally:
+        duplicate file creations are skipped and at most max_plan_steps run.
+        With a request deadline, later steps are dropped once one more
+        step would not fit in the time left.
+        
+        Steps that don't depend on each other (see
+        planning_agent.step_dependencies) run at the same time, at most
+        max_parallel_steps at once; a step whose prerequisite failed is
+        skipped. Changes are returned in plan order; when a step fails
+        or the steps can't be read, the changes of the steps that did
+        finish are returned with the failure.
+        
+        Args:
+            steps: Plan steps, in plan order
+            project_context: Current project state
+        
+        Returns:
+            CodeGenerationResult with all changes made
+        """
+        seen_files = set()
+        executed = 0
+        accepted: List[ActionStep] = []
+        step_tasks: List[asyncio.Task] = []
+        parallel = asyncio.Semaphore(max(1, min(self.max_parallel_steps, llm_scheduler.concurrency_limit)))
+        failure = None
+        
+        try:
+            try:
+                async for step in steps:
+                    if planning_agent.is_redundant_step(step, seen_files):
+                        continue
+                    if executed >= planning_agent.max_plan_steps or not deadline_policy.allow_step(executed):
+                        continue  # Keep draining so the producer can finish
+                    
+                    issues = planning_agent.validate_step(step)
+                    if issues:
+                        failure = f"Invalid plan step: {', '.join(issues)}"
+                        break
+                    
+                    executed += 1
+                    step.step_number = executed
+                    prerequisites = [
+                        (accepted[index].step_number, step_tasks[index])
+                        for index in planning_agent.step_dependencies(step, accepted)
+                    ]
+                    print(f"   Scheduling step {executed}: {step.description}"
+                          + (f" (after step {', '.join(str(number) for number, _ in prerequisites)})" if prerequisites else ""))
+                    
+                    accepted.append(step)
+                    step_tasks.append(asyncio.create_task(self._run_step(
+                        step, prerequisites, parallel, project_context, websocket_callback, conversation_id
+                    )))
+            except Exception as e:
+                print(f" [{self.name}] Plan execution failed: {str(e)}")
+                failure = f"Execution error: {str(e)}"
+            
+            if failure:
+                # Stop the steps still running; the ones that finished keep their changes
+                for task in step_tasks:
+                    task.cancel()
+            results = await asyncio.gather(*step_tasks, return_exceptions=True)
+        
+        finally:
+            for task in step_tasks:
+                if not task.done():
+                    task.cancel()
+        
         all_changes = []
         warnings = []
+        for step, result in zip(accepted, results):
+            if isinstance(result, CodeGenerationResult) and result.success:
+                all_changes.extend(result.changes)
+                if result.warnings:
+                    warnings.extend(result.warnings)
+            elif failure is None:
+                message = result.message if isinstance(result, CodeGenerationResult) else (str(result) or type(result).__name__)
+                failure = f"Failed at step {step.step_number}: {message}"
+        
+        if failure:
+            return CodeGenerationResult(
+                success=False,
+                changes=all_changes,
+                message=failure,
+                warnings=warnings
+            )
         
-        try:
-            # Execute each step in sequence
-            for i, step in enumerate(optimized_plan.steps, 1):
-                print(f"   Executing step {i}/{len(optimized_plan.steps)}: {step.description}")
-                
+        # All steps completed successfully
+        print(f"  [{self.name}] Plan executed successfully")
+        return CodeGenerationResult(
+            success=True,
+            changes=all_changes,
+            message=self._generate_success_message(all_changes),
+            warnings=warnings if warnings else None
+        )
+    
+    
+    async def _run_step(
+        self,
+        step: ActionStep,
+        prerequisites: List[Tuple[int, "asyncio.Task"]],
+        parallel: asyncio.Semaphore,
+        project_context: Dict[str, Any],
+        websocket_callback=None,
+        conversation_id: Optional[str] = None
+    ) -> CodeGenerationResult:
+        """
+        Run one step once the steps it depends on have succeeded.
+        The step's span counts waiting for them and for a free slot as queue wait.
+        """
+        with tracer.span(
+            "coding.step", step=step.step_number, action=step.action_type, target_file=step.target_file or "unknown"
+        ) as span:
+            waiting_since = time.perf_counter()
+            for step_number, prerequisite in prerequisites:
+                prerequisite_result = await prerequisite
+                if not prerequisite_result.success:
+                    print(f"   Skipping step {step.step_number}: step {step_number} failed")
+                    span.set_outcome(OUTCOME_SKIPPED, f"step {step_number} failed")
+                    return CodeGenerationResult(
+                        success=False,
+                        changes=[],
+                        message=f"Skipped because step {step_number} failed",
+                        warnings=None
+                    )
+            
+            async with parallel:
+                print(f"   Executing step {step.step_number}: {step.description}")
+                step_started = time.perf_counter()
+                span.set(queue_wait_seconds=step_started - waiting_since)
                 result = await self.execute_step(
                     step, 
                     project_context, 
                     websocket_callback, 
                     conversation_id
                 )
-                
-                if result.success:
-                    all_changes.extend(result.changes)
-                    if result.warnings:
-                        warnings.extend(result.warnings)
-                else:
-                    # Stop execution on first failure
-                    return CodeGenerationResult(
-                        success=False,
-                        changes=all_changes,
-                        message=f"Failed at step {i}: {result.message}",
-                        warnings=warnings
-                    )
             
-            # All steps completed successfully
-            print(f"  [{self.name}] Plan executed successfully")
-            return CodeGenerationResult(
-                success=True,
-                changes=all_changes,
-                message=self._generate_success_message(all_changes),
-                warnings=warnings if warnings else None
-            )
-        
-        except Exception as e:
-            print(f" [{self.name}] Plan execution failed: {str(e)}")
-            return CodeGenerationResult(
-                success=False,
-                changes=all_changes,
-                message=f"Execution error: {str(e)}",
-                warnings=warnings
-            )
+            if result.success:
+                deadline_policy.observe_step(time.perf_counter() - step_started)
+            else:
+                span.set_outcome(OUTCOME_ERROR, result.message)
+            return result
     
     
     async def execute_step(
@@ -133,8 +260,8 @@ class CodingAgent:
             CodeGenerationResult for this step
         """
         try:
-            # Send natural language update about what we're working on
-            if websocket_callback and conversation_id:
+            # Send natural language update about what we're working on (skipped when short on time)
+            if websocket_callback and conversation_id and not deadline_policy.skip_narration():
                 # Generate a natural, enthusiastic message about what we're doing
                 from ..services.ai_service import ai_service
                 
@@ -154,9 +281,9 @@ class CodingAgent:
                     update_message = await ai_service.generate_response(
                         prompt=user_message,
                         system_instruction=system_prompt,
-                        temperature=0.7,
                         websocket_callback=self._silent_callback,
-                        conversation_id="coding_narrative"
+                        conversation_id="coding_narrative",
+                        call_type=LLMCallType.NARRATION
                     )
                     
                     # Send this as a progress update
@@ -251,10 +378,12 @@ class CodingAgent:
         
         code = await ai_service.generate_response(
             prompt=prompt,
-            system_instruction=CODING_AGENT_SYSTEM,
-            temperature=0.5,  # Balanced creativity for code
+            system_instruction=CODING_AGENT_INSTRUCTIONS,  # Static, so it is served from the prompt cache
             websocket_callback=callback,
-            conversation_id=conv_id
+            conversation_id=conv_id,
+            call_type=LLMCallType.CODE,
+            # Steps run in parallel: tell their streams apart
+            stream_tag={"step_number": step.step_number, "target_file": step.target_file}
         )
         
         # Clean up the code (remove markdown if present)
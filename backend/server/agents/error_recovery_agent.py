@@ -11,7 +11,8 @@ from typing import Dict, Any, Optional, List
 from ..models.message_models import (
     ErrorDetails,
     ErrorRecoveryResult,
-    ErrorSeverity
+    ErrorSeverity,
+    LLMCallType
 )
 from ..services.ai_service import ai_service
 from ..utils.prompt_templates import (
@@ -79,7 +80,8 @@ class ErrorRecoveryAgent:
                 system_instruction=ERROR_RECOVERY_SYSTEM,
                 websocket_callback=self._silent_callback,
                 conversation_id="error_recovery_internal",
-                response_format="json"
+                response_format="json",
+                call_type=LLMCallType.ERROR_ANALYSIS
             )
             
             # Parse the analysis
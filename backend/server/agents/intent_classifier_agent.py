@@ -8,7 +8,7 @@ SERVER SIDE FILE
 """
 
 from typing import Dict, Any, Optional, List
-from ..models.message_models import IntentType, IntentClassification, ModeType, Message
+from ..models.message_models import IntentType, IntentClassification, ModeType, Message, LLMCallType
 from ..services.ai_service import ai_service
 from ..utils.prompt_templates import (
     INTENT_CLASSIFIER_SYSTEM,
@@ -75,7 +75,8 @@ class IntentClassifierAgent:
                 system_instruction=INTENT_CLASSIFIER_SYSTEM,
                 websocket_callback=self._silent_callback,
                 conversation_id="intent_classification",
-                response_format="json"
+                response_format="json",
+                call_type=LLMCallType.INTENT
             )
             
             # Validate and parse the result
@@ -110,14 +111,13 @@ class IntentClassifierAgent:
         context = {}
         
         if conversation_history:
-            # Get last 5 messages for context (we don't need the entire history)
-            recent_messages = conversation_history[-5:]
+            # The prompt builder keeps as much recent history as its token budget allows
             context["history"] = [
                 {
                     "role": msg.role.value,
                     "content": msg.content
                 }
-                for msg in recent_messages
+                for msg in conversation_history
             ]
         
         if current_mode:
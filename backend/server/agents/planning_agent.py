@@ -7,16 +7,24 @@ Think of it as an "architect" that designs the blueprint before building.
 SERVER SIDE FILE
 """
 
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Awaitable
 import uuid
-from ..models.message_models import ExecutionPlan, ActionStep
+from ..models.message_models import ExecutionPlan, ActionStep, LLMCallType
 from ..services.ai_service import ai_service
+from ..services.plan_cache import plan_cache
+from ..services.stream_delivery import stream_delivery
+from ..utils.incremental_json import IncrementalArrayParser
 from ..utils.prompt_templates import (
     PLANNING_AGENT_SYSTEM,
     build_planning_prompt
 )
 
 
+class PlanRestarted(Exception):
+    """Raised to stop coding the steps of a plan attempt that was replaced."""
+    pass
+
+
 class PlanningAgent:
     """
     Creates detailed execution plans for Flutter widget generation.
@@ -31,6 +39,7 @@ class PlanningAgent:
     def __init__(self):
         """Initialize the Planning Agent."""
         self.name = "PlanningAgent"
+        self.max_plan_steps = 5  # Essential files only - users iterate from there
         print(f" {self.name} initialized")
     
     async def _silent_callback(self, stream_data: Dict):
@@ -44,7 +53,9 @@ class PlanningAgent:
         user_request: str,
         project_context: Dict[str, Any],
         websocket_callback=None,
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        on_step: Optional[Callable[[ActionStep], Awaitable[None]]] = None,
+        on_restart: Optional[Callable[[], Awaitable[None]]] = None
     ) -> ExecutionPlan:
         """
         Create a detailed execution plan for a user request.
@@ -52,6 +63,12 @@ class PlanningAgent:
         Args:
             user_request: What the user wants to build/modify
             project_context: Current state of the project (files, widgets, etc.)
+            on_step: Called with each step as soon as it has streamed in, so
+                     coding can start before the whole plan is generated
+            on_restart: Called when a retry or a cascade escalation replaces
+                        the attempt whose steps were already handed out; the
+                        steps of the new attempt follow. Without it, steps
+                        are only handed out once the plan is accepted
         
         Returns:
             ExecutionPlan with steps, files, and dependencies
@@ -65,21 +82,77 @@ class PlanningAgent:
         try:
             print(f"\n [{self.name}] Creating plan for: '{user_request[:50]}...'")
             
+            # Reuse the plan of a near-duplicate request if we have one
+            cached_plan = plan_cache.lookup(user_request, project_context)
+            if cached_plan is not None:
+                print(f" [{self.name}] Reusing cached plan with {len(cached_plan.steps)} steps")
+                if on_step:
+                    for step in cached_plan.steps:
+                        await on_step(step)
+                return cached_plan
+            
             # Build the prompt
             prompt = build_planning_prompt(user_request, project_context)
             
-            # Get plan from AI using streaming, but always use silent callback to keep planning internal
-            plan_data = await ai_service.generate_structured_response(
-                prompt=prompt,
-                system_instruction=PLANNING_AGENT_SYSTEM,
-                websocket_callback=self._silent_callback,  # Always keep planning internal
-                conversation_id="planning_internal",
-                response_format="json"
-            )
+            # Planning stays internal; with on_step, steps are parsed out of the stream as they complete
+            callback = self._silent_callback
+            streamed_positions = set()  # Array positions of the current attempt's steps already handed out
+            callback_error: Optional[Exception] = None
+            streaming = bool(on_step and on_restart)
+            if streaming:
+                parser = IncrementalArrayParser("steps")
+                
+                async def callback(stream_data: Dict):
+                    # Runs in the delivery task, which only logs errors: keep the first one for create_plan
+                    nonlocal parser, callback_error
+                    if callback_error is not None:
+                        return
+                    try:
+                        if stream_data.get("type") == "stream_start":
+                            # A retry or an escalation restarts the JSON: the steps handed out
+                            # so far belong to a rejected attempt, so coding starts over
+                            parser = IncrementalArrayParser("steps")
+                            if streamed_positions:
+                                streamed_positions.clear()
+                                await on_restart()
+                        elif stream_data.get("type") == "stream_token":
+                            for position, step_data in parser.feed(stream_data.get("content", "")):
+                                if position not in streamed_positions:
+                                    await on_step(self._parse_step(step_data, position))
+                                    streamed_positions.add(position)
+                    except Exception as e:
+                        callback_error = e
+            
+            # Its own delivery channel: other requests' plans stream under their own keys
+            stream_key = f"planning_internal:{uuid.uuid4().hex}"
+            try:
+                plan_data = await ai_service.generate_structured_response(
+                    prompt=prompt,
+                    system_instruction=PLANNING_AGENT_SYSTEM,
+                    websocket_callback=callback,
+                    conversation_id=stream_key,
+                    response_format="json",
+                    call_type=LLMCallType.PLAN
+                )
+            finally:
+                if streaming:
+                    await stream_delivery.wait_drained(stream_key)  # The callback runs in the delivery task
+            if callback_error is not None:
+                raise RuntimeError(f"Could not hand out a streamed plan step: {callback_error}") from callback_error
             
             # Parse and validate the plan
             execution_plan = self._parse_plan(plan_data)
             
+            # Cached responses don't stream - hand out whatever the parser didn't see or couldn't decode
+            if on_step:
+                for position, step in enumerate(execution_plan.steps, 1):
+                    if position not in streamed_positions:
+                        await on_step(step)
+            
+            # Remember good plans so rephrasings of this request can skip planning
+            if self.validate_plan(execution_plan)[0]:
+                plan_cache.store(user_request, execution_plan, project_context)
+            
             print(f" [{self.name}] Created plan with {len(execution_plan.steps)} steps")
             print(f"   Files to modify: {len(execution_plan.estimated_files)}")
             
@@ -102,14 +175,7 @@ class PlanningAgent:
             # Parse steps
             steps = []
             for step_data in plan_data.get("steps", []):
-                step = ActionStep(
-                    step_number=step_data.get("step_number", len(steps) + 1),
-                    action_type=step_data.get("action_type", "unknown"),
-                    description=step_data.get("description", "No description"),
-                    target_file=step_data.get("target_file"),
-
-                )
-                steps.append(step)
+                steps.append(self._parse_step(step_data, len(steps) + 1))
             
             # Create execution plan
             return ExecutionPlan(
@@ -125,6 +191,18 @@ class PlanningAgent:
             raise
     
     
+    def _parse_step(self, step_data: Dict[str, Any], default_number: int) -> ActionStep:
+        """
+        Parse one step of an AI plan.
+        """
+        return ActionStep(
+            step_number=step_data.get("step_number", default_number),
+            action_type=step_data.get("action_type", "unknown"),
+            description=step_data.get("description", "No description"),
+            target_file=step_data.get("target_file"),
+        )
+    
+    
     def _create_fallback_plan(self, request: str, error: str) -> ExecutionPlan:
         """
         Create a minimal fallback plan when AI planning fails.
@@ -161,16 +239,7 @@ class PlanningAgent:
         
         # Check each step
         for step in plan.steps:
-            if not step.description:
-                issues.append(f"Step {step.step_number} has no description")
-            
-            if not step.action_type:
-                issues.append(f"Step {step.step_number} has no action type")
-            
-            # If action involves files, check target_file is specified
-            if step.action_type in ["create_file", "modify_file", "update_widget"]:
-                if not step.target_file:
-                    issues.append(f"Step {step.step_number} needs a target file")
+            issues.extend(self.validate_step(step))
         
         is_valid = len(issues) == 0
         
@@ -182,6 +251,63 @@ class PlanningAgent:
         return is_valid, issues
     
     
+    def validate_step(self, step: ActionStep) -> List[str]:
+        """
+        Validate a single plan step. Returns the list of issues (empty if valid).
+        """
+        issues = []
+        
+        if not step.description:
+            issues.append(f"Step {step.step_number} has no description")
+        
+        if not step.action_type:
+            issues.append(f"Step {step.step_number} has no action type")
+        
+        # If action involves files, check target_file is specified
+        if step.action_type in ["create_file", "modify_file", "update_widget"]:
+            if not step.target_file:
+                issues.append(f"Step {step.step_number} needs a target file")
+        
+        return issues
+    
+    
+    def is_redundant_step(self, step: ActionStep, seen_files: set) -> bool:
+        """
+        True if the step creates a file an earlier step already handles.
+        Records the step's file in seen_files otherwise.
+        """
+        if step.target_file:
+            if step.target_file in seen_files and step.action_type == "create_file":
+                return True
+            seen_files.add(step.target_file)
+        return False
+    
+    
+    def step_dependencies(self, step: ActionStep, earlier_steps: List[ActionStep]) -> List[int]:
+        """
+        Indexes of the earlier steps a step has to wait for:
+        - steps writing the same target file (their edits apply in plan order)
+        - steps creating a Dart file this Dart step imports or refers to
+          (e.g. a preview of a widget mentions the widget's file name)
+        Steps without dependencies can run at the same time.
+        """
+        if not step.target_file:
+            return []
+    
+        text = f"{step.target_file} {step.description}".lower()
+        dependencies = []
+        for index, earlier in enumerate(earlier_steps):
+            if not earlier.target_file:
+                continue
+            if earlier.target_file == step.target_file:
+                dependencies.append(index)
+            elif step.target_file.endswith(".dart") and earlier.target_file.endswith(".dart"):
+                stem = earlier.target_file.rsplit("/", 1)[-1][:-len(".dart")].lower()
+                if stem and stem in text:
+                    dependencies.append(index)
+        return dependencies
+    
+    
     def optimize_plan(self, plan: ExecutionPlan) -> ExecutionPlan:
         """
         Optimize a plan by combining similar steps and removing redundancies.
@@ -194,20 +320,18 @@ class PlanningAgent:
         optimized_steps = []
         
         for step in plan.steps:
-            if step.target_file:
-                if step.target_file in seen_files and step.action_type == "create_file":
-                    # Skip duplicate file creation
-                    continue
-                seen_files.add(step.target_file)
+            if self.is_redundant_step(step, seen_files):
+                # Skip duplicate file creation
+                continue
             
             optimized_steps.append(step)
         
         # Limit to 4-5 essential files for initial generation
         # This supports iterative development - users can enhance later
-        if len(optimized_steps) > 5:
-            print(f" [{self.name}] Limiting to 5 essential steps for initial generation")
+        if len(optimized_steps) > self.max_plan_steps:
+            print(f" [{self.name}] Limiting to {self.max_plan_steps} essential steps for initial generation")
             # Keep the most important steps (typically the first ones)
-            optimized_steps = optimized_steps[:5]
+            optimized_steps = optimized_steps[:self.max_plan_steps]
         
         # Update step numbers
         for i, step in enumerate(optimized_steps, 1):
@@ -256,7 +380,8 @@ Create an updated plan that addresses the feedback while maintaining the origina
                 system_instruction=PLANNING_AGENT_SYSTEM,
                 websocket_callback=self._silent_callback,
                 conversation_id="planning_refinement",
-                response_format="json"
+                response_format="json",
+                call_type=LLMCallType.PLAN
             )
             
             refined_plan = self._parse_plan(refined_data)
@@ -313,4 +438,4 @@ planning_agent = PlanningAgent()
 
 
 # Export
-__all__ = ['PlanningAgent', 'planning_agent']
\ No newline at end of file
+__all__ = ['PlanningAgent', 'PlanRestarted', 'planning_agent']
\ No newline at end of file
@@ -7,7 +7,10 @@ Think of it as the "conductor" of an orchestra, coordinating all the agents.
 SERVER SIDE FILE - This is the heart of the system!
 """
 
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
+from dataclasses import dataclass, field, replace
+import asyncio
+import time
 import uuid
 from ..models.message_models import (
     Message,
@@ -16,10 +19,11 @@ from ..models.message_models import (
     ModeType,
     ConversationState,
     CoordinatorState,
-    AssistantResponse
+    AssistantResponse,
+    LLMCallType
 )
 from ..agents.intent_classifier_agent import intent_classifier_agent
-from ..agents.planning_agent import planning_agent
+from ..agents.planning_agent import planning_agent, PlanRestarted
 from ..agents.coding_agent import coding_agent
 from ..agents.error_recovery_agent import error_recovery_agent
 from ..agents.chat_agent import chat_agent
@@ -35,6 +39,14 @@ except ImportError:
 
 # Import AIService separately to ensure it is always available
 from ..services.ai_service import AIService
+from ..services.call_context import LLMCallContext, set_call_context, reset_call_context, get_call_context
+from ..services.llm_scheduler import llm_scheduler
+from ..services.request_deadline import deadline_policy
+from ..services.llm_cassettes import RecordingProvider
+from ..services.conversation_store import conversation_store
+from ..services.job_queue import job_queue
+from ..services.conversation_mailbox import conversation_mailbox, Letter, MessageSuperseded, MessageWithdrawn
+from ..services.tracing import tracer, OUTCOME_CANCELLED, OUTCOME_ERROR
 
 # Import project service for file management
 try:
@@ -46,6 +58,31 @@ except ImportError:
     print(" Project service not available - file saving disabled")
 
 
+# Pipeline stages in order (used to report what a cancellation skipped)
+PIPELINE_STAGES = ["analyzing", "intent", "planning", "coding", "saving", "complete"]
+
+# Put on the plan step queue when the planner replaced the attempt being coded
+_RESTART_CODING = object()
+
+
+@dataclass
+class ActiveRequest:
+    """
+    One message being processed, so it can be cancelled from outside.
+    """
+    request_id: str
+    conversation_id: str
+    call_context: LLMCallContext
+    task: Optional[asyncio.Task] = None
+    stage: str = "analyzing"
+    started_at: float = field(default_factory=time.monotonic)
+    cancel_reason: Optional[str] = None
+    queued_calls_cancelled: int = 0
+    report: Optional[Dict[str, Any]] = None
+    on_stage: Optional[Callable[[str], None]] = None  # Progress hook (e.g. job status)
+    background: bool = False                          # A job: keeps running when its client disconnects
+
+
 class AgentCoordinator:
     """
     Master coordinator that orchestrates all agents and manages workflow.
@@ -61,7 +98,8 @@ class AgentCoordinator:
     def __init__(self):
         """Initialize the Agent Coordinator."""
         self.name = "AgentCoordinator"
-        self.state = CoordinatorState()
+        # Bounded memory tier; evicted conversations come back from the database
+        self.state = CoordinatorState(active_conversations=conversation_store)
         self.project_service_enabled = PROJECT_SERVICE_AVAILABLE
         
         # Initialize AI service for streaming (required)
@@ -70,6 +108,24 @@ class AgentCoordinator:
         
         self.ai_service = AIService()
         
+        # Messages being processed, by request id (see cancel_conversation)
+        self.active_requests: Dict[str, ActiveRequest] = {}
+        self.cancellation_stats: Dict[str, Any] = {
+            "requests_cancelled": 0,
+            "streams_aborted": 0,
+            "queued_calls_cancelled": 0,
+            "tokens_discarded": 0,
+            "by_reason": {}
+        }
+        
+        # A cancel message or the last client leaving a conversation stops its generation
+        f3_websocket_manager.set_cancel_handler(self.cancel_conversation)
+        f3_websocket_manager.set_disconnect_handler(self._cancel_on_disconnect)
+        
+        # Evicted conversations come back with their project's files
+        if self.project_service_enabled:
+            conversation_store.set_project_loader(project_service.load_project_files)
+        
         print(f" {self.name} initialized")
         print(f"   Managing agents: Intent, Planning, Coding, Error Recovery, Chat")
         print(f"   Streaming mode:  Enabled (streaming-only)")
@@ -92,31 +148,217 @@ class AgentCoordinator:
         self,
         message: str,
         conversation_id: Optional[str] = None,
-        project_context: Optional[Dict[str, Any]] = None
+        project_context: Optional[Dict[str, Any]] = None,
+        request_id: Optional[str] = None,
+        latency_budget: Optional[float] = None,
+        on_stage: Optional[Callable[[str], None]] = None,
+        followup_policy: Optional[str] = None,
+        background: bool = False
     ) -> AssistantResponse:
         """
         Process a user message through the entire workflow.
         
         This is the main entry point for all user interactions.
+        The workflow runs in its own task so it can be cancelled
+        (cancel_conversation / cancel_request); a cancelled message returns
+        a response with error="cancelled" and a report of the work saved.
+        
+        Messages for the same conversation are processed one turn at a
+        time, in order (see conversation_mailbox.py). A message sent while
+        another is running waits for it; `followup_policy` decides whether
+        it gets its own turn ("queue"), is merged with the other waiting
+        messages ("coalesce") or replaces them ("supersede").
+        
+        With a latency budget, every stage checks the time left and takes
+        shortcuts to fit (see request_deadline.py); the response metadata
+        reports them under "deadline". Time spent waiting for the previous
+        turn counts against the budget.
         
         Args:
             message: The user's message
             conversation_id: Unique ID for this conversation
             project_context: Current project state (files, widgets, etc.)
+            request_id: ID for this message (generated if not given)
+            latency_budget: Seconds the caller is willing to wait (None = no deadline)
+            on_stage: Called with each pipeline stage the message reaches
+            followup_policy: "queue", "coalesce" or "supersede" (None = MAILBOX_POLICY)
+            background: Submitted as a job; not cancelled when the conversation's clients disconnect
         
         Returns:
             AssistantResponse with the result
+        
+        Raises:
+            MailboxFull: too many messages are already waiting for this conversation
+        """
+        # Get or create conversation state
+        if not conversation_id:
+            conversation_id = str(uuid.uuid4())
+        request_id = request_id or str(uuid.uuid4())
+        
+        letter = Letter(
+            request_id=request_id,
+            message=message,
+            policy=conversation_mailbox.resolve_policy(followup_policy),
+            payload={"project_context": project_context, "latency_budget": latency_budget, "on_stage": on_stage,
+                     "background": background}
+        )
+        try:
+            return await conversation_mailbox.post(conversation_id, letter, self._process_turn)
+        except MessageSuperseded as e:
+            print(f" [{self.name}] Message {request_id} superseded by {e.superseded_by} before it started")
+            return self._unprocessed_response(conversation_id, "superseded", {
+                "superseded": True,
+                "mailbox": {"policy": letter.policy, "superseded_by": e.superseded_by,
+                            "queue_wait_seconds": round(letter.queue_wait, 3)}
+            })
+        except MessageWithdrawn as e:
+            return self._unprocessed_response(conversation_id, "cancelled", {
+                "cancelled": True,
+                "cancellation": {"request_id": request_id, "conversation_id": conversation_id, "reason": e.reason,
+                                 "stage": "queued", "stages_skipped": list(PIPELINE_STAGES)}
+            })
+    
+    async def _process_turn(self, conversation_id: str, letters: List[Letter]) -> List[AssistantResponse]:
         """
+        Run one conversation turn (mailbox runner). A coalesced turn answers
+        its messages together: the last one carries the merged message and
+        the others point to it.
+        
+        Returns:
+            One response per letter
+        """
+        background = any(letter.payload.get("background") for letter in letters)
+        if job_queue.enabled and not background:
+            # The mailbox only orders this process's turns; the lease keeps worker processes off the conversation
+            async with job_queue.hold_conversation(conversation_id):
+                conversation_store.release(conversation_id)  # A worker may have answered since: reload it
+                return await self._run_turn(conversation_id, letters, background)
+        return await self._run_turn(conversation_id, letters, background)
+    
+    async def _run_turn(self, conversation_id: str, letters: List[Letter], background: bool) -> List[AssistantResponse]:
+        carrier = letters[-1]
+        message = "\n\n".join(letter.message for letter in letters)
+        request_id = carrier.request_id
+        project_context = carrier.payload.get("project_context")
+        latency_budget = carrier.payload.get("latency_budget")
+        if latency_budget is not None:
+            latency_budget -= carrier.queue_wait
+        stage_hooks = [letter.payload["on_stage"] for letter in letters if letter.payload.get("on_stage")]
+        
+        def on_stage(stage: str):
+            for hook in stage_hooks:
+                hook(stage)
+        
+        # Attribute every LLM call made for this message to its user/project
+        call_context = LLMCallContext(
+            conversation_id=conversation_id,
+            project_id=(project_context or {}).get("project_id"),
+            user_id=(project_context or {}).get("user_id"),
+            request_id=request_id
+        )
+        deadline_policy.start(call_context, latency_budget)
+        context_token = set_call_context(call_context)
+        
+        active = ActiveRequest(
+            request_id=request_id, conversation_id=conversation_id, call_context=call_context, on_stage=on_stage,
+            background=background
+        )
+        # Any of the merged messages' ids cancels the turn (and finds its trace)
+        for letter in letters:
+            self.active_requests[letter.request_id] = active
+            tracer.alias(letter.request_id, request_id)
+        conversation_store.pin(conversation_id)
+        try:
+            # The trace starts when the message was sent, so time spent behind the previous turn shows up
+            with tracer.span(
+                "chat.turn", request_id=request_id, start_time=time.time() - carrier.queue_wait,
+                conversation_id=conversation_id, policy=carrier.policy, messages=len(letters),
+                queue_wait_seconds=carrier.queue_wait
+            ) as span:
+                if carrier.queue_wait >= 0.001:
+                    tracer.record_span("mailbox.wait", span.start_time, span.start_time + carrier.queue_wait)
+                active.task = asyncio.create_task(self._run_workflow(message, conversation_id, project_context, call_context))
+                try:
+                    response = await active.task
+                    deadline_report = deadline_policy.report(call_context, latency_budget)
+                    if deadline_report is not None:
+                        response.metadata = {**(response.metadata or {}), "deadline": deadline_report}
+                except asyncio.CancelledError:
+                    if active.cancel_reason is None:
+                        raise  # Our caller was cancelled, not just this message
+                    conv_state = conversation_store.peek(conversation_id)
+                    response = AssistantResponse(
+                        content="Generation cancelled.",
+                        mode=conv_state.current_mode if conv_state else ModeType.CHAT_MODE,
+                        intent=IntentType.CHAT,
+                        conversation_id=conversation_id,
+                        error="cancelled",
+                        metadata={"cancelled": True, "cancellation": self._cancellation_report(active)}
+                    )
+                
+                span.set(intent=response.intent.value, mode=response.mode.value, files=len(response.files_modified or []))
+                if response.error == "cancelled":
+                    span.set_outcome(OUTCOME_CANCELLED, active.cancel_reason)
+                elif response.error:
+                    span.set_outcome(OUTCOME_ERROR, response.error)
+        finally:
+            for letter in letters:
+                self.active_requests.pop(letter.request_id, None)
+            conversation_store.unpin(conversation_id)
+            reset_call_context(context_token)
+        
+        # Finds the message's trace (GET /api/traces/{request_id}); WebSocket messages carry it too
+        response.metadata = {**(response.metadata or {}), "request_id": request_id}
+        if len(letters) == 1 and carrier.queue_wait < 0.001:
+            return [response]
+        
+        response.metadata = {**(response.metadata or {}), "mailbox": {
+            "policy": carrier.policy,
+            "merged_requests": [letter.request_id for letter in letters],
+            "message": message,
+            "queue_wait_seconds": round(carrier.queue_wait, 3)
+        }}
+        absorbed = [
+            replace(response, metadata={**response.metadata, "request_id": letter.request_id, "mailbox": {
+                "policy": letter.policy,
+                "absorbed_into": request_id,
+                "queue_wait_seconds": round(letter.queue_wait, 3)
+            }})
+            for letter in letters[:-1]
+        ]
+        return absorbed + [response]
+    
+    def _unprocessed_response(self, conversation_id: str, error: str, metadata: Dict[str, Any]) -> AssistantResponse:
+        """Answer for a message that never got its turn."""
+        conv_state = conversation_store.peek(conversation_id)
+        return AssistantResponse(
+            content="Generation cancelled." if error == "cancelled" else "Replaced by a newer message.",
+            mode=conv_state.current_mode if conv_state else ModeType.CHAT_MODE,
+            intent=IntentType.CHAT,
+            conversation_id=conversation_id,
+            error=error,
+            metadata=metadata
+        )
+    
+    
+    async def _run_workflow(
+        self,
+        message: str,
+        conversation_id: str,
+        project_context: Optional[Dict[str, Any]],
+        call_context: LLMCallContext
+    ) -> AssistantResponse:
+        """Run intent → plan/code or chat for one message (the cancellable part of process_message)."""
         try:
             print(f"\n{'='*70}")
             print(f" [{self.name}] Processing new message")
             print(f"{'='*70}")
             
-            # Get or create conversation state
-            if not conversation_id:
-                conversation_id = str(uuid.uuid4())
+            conv_state = await self._get_or_create_conversation(conversation_id)
             
-            conv_state = self._get_or_create_conversation(conversation_id)
+            # Capture the session in the cassette so it can be replayed later
+            if isinstance(self.ai_service.provider, RecordingProvider):
+                self.ai_service.provider.record_message(message, conversation_id, project_context)
             
             # Update project context if provided
             if project_context:
@@ -134,11 +376,14 @@ class AgentCoordinator:
             
             # STEP 1: Classify intent
             print(f"\n STEP 1: Intent Classification")
-            classification = await intent_classifier_agent.classify(
-                message=message,
-                conversation_history=conv_state.message_history,
-                current_mode=conv_state.current_mode
-            )
+            self._enter_stage("intent")
+            with tracer.span("intent") as span:
+                classification = await intent_classifier_agent.classify(
+                    message=message,
+                    conversation_history=conv_state.message_history,
+                    current_mode=conv_state.current_mode
+                )
+                span.set(intent=classification.intent.value, confidence=classification.confidence)
             
             # STEP 2: Determine if mode switch is needed
             print(f"\n STEP 2: Mode Management")
@@ -180,6 +425,13 @@ class AgentCoordinator:
             # Update state
             self.state.active_conversations[conversation_id] = conv_state
             
+            # Report how long this message spent throttled or queued for LLM slots
+            response.metadata = {
+                **(response.metadata or {}),
+                "rate_limit_wait_seconds": round(call_context.rate_limit_wait, 3),
+                "scheduler_wait_seconds": round(call_context.scheduler_wait, 3)
+            }
+            
             print(f"\n [{self.name}] Message processed successfully")
             print(f"{'='*70}\n")
             
@@ -224,15 +476,88 @@ class AgentCoordinator:
                 conv_state.current_mode = ModeType.CHAT_MODE
                 return await self._handle_chat_mode(message, conv_state, intent)
             
-            # STEP 1: Create execution plan (keep internal, no UI updates)
-            print(f"\n   Step 1: Planning (Internal)")
+            # STEPS 1+2: Plan (internal) and generate code, overlapped -
+            # each plan step starts coding as soon as it has streamed in
+            print(f"\n   Step 1: Planning (Internal, streamed)")
+            self._enter_stage("planning")
+            step_queue: asyncio.Queue = asyncio.Queue()
+            coding_restarted = False
+            
+            async def restart_coding():
+                await step_queue.put(_RESTART_CODING)
+            
+            async def traced_plan():
+                with tracer.span("planning") as span:
+                    plan = await planning_agent.create_plan(
+                        user_request=message,
+                        project_context=conv_state.context,
+                        websocket_callback=None,  # Keep planning internal
+                        conversation_id=None,
+                        on_step=step_queue.put,
+                        on_restart=restart_coding
+                    )
+                    span.set(steps=len(plan.steps))
+                    return plan
+            
+            plan_task = asyncio.create_task(traced_plan())
+            plan_task.add_done_callback(lambda _task: step_queue.put_nowait(None))
+            
+            files_created = []
+            progress_tasks = []
+            
+            async def planned_steps():
+                nonlocal coding_restarted
+                while True:
+                    step = await step_queue.get()
+                    if step is None:
+                        return
+                    if step is _RESTART_CODING:
+                        # Stops this run; its unfinished steps are cancelled and its changes dropped
+                        coding_restarted = True
+                        raise PlanRestarted("The plan was regenerated")
+                    if not progress_tasks:
+                        self._enter_stage("coding")
+                        # Send coding progress update to start UI feedback (without holding up step 1)
+                        print(f"\n   Step 2: Code Generation (first step arrived)")
+                        progress_tasks.append(asyncio.create_task(self._send_progress_update(
+                            conv_state.conversation_id, "coding", files_created=files_created, user_prompt=message
+                        )))
+                    yield step
+            
+            coded = False
             try:
-                plan = await planning_agent.create_plan(
-                    user_request=message,
-                    project_context=conv_state.context,
-                    websocket_callback=None,  # Keep planning internal
-                    conversation_id=None
+                while True:
+                    result = await coding_agent.execute_plan_stream(
+                        planned_steps(),
+                        project_context=conv_state.context,
+                        websocket_callback=f3_websocket_manager.streaming_callback if f3_websocket_manager else None,
+                        conversation_id=conv_state.conversation_id
+                    )
+                    if not coding_restarted:
+                        break
+                    # The planner retried or escalated: code the new attempt's steps from scratch
+                    coding_restarted = False
+                    print(f"   Plan attempt replaced - restarting code generation")
+                coded = True
+            except Exception as e:
+                print(f" Code generation failed: {str(e)}")
+                return AssistantResponse(
+                    content=f" Code generation failed: {str(e)}. Please try a simpler request.",
+                    mode=ModeType.CODE_MODE,
+                    intent=IntentType.CODE,
+                    conversation_id=conv_state.conversation_id
                 )
+            finally:
+                if not coded:
+                    # Failed or cancelled: the planner and progress narration run in their own tasks, stop them too
+                    plan_task.cancel()
+                    for task in progress_tasks:
+                        task.cancel()
+                    await asyncio.gather(plan_task, *progress_tasks, return_exceptions=True)
+            
+            try:
+                await asyncio.gather(*progress_tasks, return_exceptions=True)
+                plan = await plan_task
                 
                 # Validate plan
                 is_valid, issues = planning_agent.validate_plan(plan)
@@ -253,28 +578,6 @@ class AgentCoordinator:
                     conversation_id=conv_state.conversation_id
                 )
             
-            # Send coding progress update to start UI feedback
-            files_created = []
-            await self._send_progress_update(conv_state.conversation_id, "coding", files_created=files_created, user_prompt=message)
-            
-            # STEP 2: Execute plan with real-time updates
-            print(f"\n   Step 2: Code Generation")
-            try:
-                result = await coding_agent.execute_plan(
-                    plan=plan,
-                    project_context=conv_state.context,
-                    websocket_callback=f3_websocket_manager.streaming_callback if f3_websocket_manager else None,
-                    conversation_id=conv_state.conversation_id
-                )
-            except Exception as e:
-                print(f" Code generation failed: {str(e)}")
-                return AssistantResponse(
-                    content=f" Code generation failed: {str(e)}. Please try a simpler request.",
-                    mode=ModeType.CODE_MODE,
-                    intent=IntentType.CODE,
-                    conversation_id=conv_state.conversation_id
-                )
-            
             if result.success:
                 # Send validation progress update
                 await self._send_progress_update(conv_state.conversation_id, "validating")
@@ -285,6 +588,7 @@ class AgentCoordinator:
                         conv_state.project_files[change.file_path] = change.content
                 
                 # STEP 4: Save generated files to project (if project context provided)
+                self._enter_stage("saving")
                 files_created = [c.file_path for c in result.changes]
                 if self.project_service_enabled and conv_state.context.get("project_id"):
                     await self._save_files_to_project(
@@ -294,6 +598,7 @@ class AgentCoordinator:
                     )
                 
                 # Send completion progress update
+                self._enter_stage("complete")
                 await self._send_progress_update(
                     conv_state.conversation_id, 
                     "complete", 
@@ -357,24 +662,30 @@ class AgentCoordinator:
                 conv_state.current_mode = ModeType.CODE_MODE
                 return await self._handle_code_mode(message, conv_state, intent)
             
+            self._enter_stage("chat")
+            
             # Import the required modules for chat mode
-            from ..utils.prompt_templates import CHAT_AGENT_SYSTEM, build_chat_prompt
+            from ..utils.prompt_templates import CHAT_AGENT_SYSTEM, build_chat_prompt, select_history
+            from ..utils.prompt_budget import prompt_budget
             
-            # Build the proper chat prompt with context
+            # Build the proper chat prompt with context (history is cut by token budget, not message count)
+            history = [{"role": msg.role.value, "content": msg.content} for msg in conv_state.message_history]
             prompt = build_chat_prompt(
                 message=message,
                 context=conv_state.context,
-                history=[{"role": msg.role.value, "content": msg.content} for msg in conv_state.message_history[-5:]]
+                history=history
             )
             
             # Generate streaming chat response with proper system instruction
-            response_text = await self.ai_service.generate_response(
-                prompt=prompt,
-                system_instruction=CHAT_AGENT_SYSTEM,
-                context=[{"role": msg.role.value, "content": msg.content} for msg in conv_state.message_history[-5:]],  # Last 5 messages for context
-                websocket_callback=f3_websocket_manager.streaming_callback if f3_websocket_manager else None,
-                conversation_id=conv_state.conversation_id
-            )
+            with tracer.span("chat"):
+                response_text = await self.ai_service.generate_response(
+                    prompt=prompt,
+                    system_instruction=CHAT_AGENT_SYSTEM,
+                    context=select_history(history, prompt_budget(LLMCallType.CHAT) // 4),  # Most recent messages that fit
+                    websocket_callback=f3_websocket_manager.streaming_callback if f3_websocket_manager else None,
+                    conversation_id=conv_state.conversation_id,
+                    call_type=LLMCallType.CHAT
+                )
             
             # Safety check: Remove any code that might have leaked through
             if chat_agent._contains_code(response_text):
@@ -499,12 +810,13 @@ class AgentCoordinator:
         # In real app, you'd track which error is being addressed
         
         # Create new plan based on clarification
-        plan = await planning_agent.create_plan(
-            user_request=message,
-            project_context=conv_state.context,
-            websocket_callback=f3_websocket_manager.streaming_callback if f3_websocket_manager else None,
-            conversation_id=conv_state.conversation_id
-        )
+        with tracer.span("planning", clarification=True):
+            plan = await planning_agent.create_plan(
+                user_request=message,
+                project_context=conv_state.context,
+                websocket_callback=f3_websocket_manager.streaming_callback if f3_websocket_manager else None,
+                conversation_id=conv_state.conversation_id
+            )
 
         # Execute the refined plan
         result = await coding_agent.execute_plan(
@@ -531,13 +843,14 @@ class AgentCoordinator:
             )
     
     
-    def _get_or_create_conversation(self, conversation_id: str) -> ConversationState:
+    async def _get_or_create_conversation(self, conversation_id: str) -> ConversationState:
         """
         Get existing conversation or create new one.
         """
-        if conversation_id in self.state.active_conversations:
+        conv_state = await conversation_store.load(conversation_id)  # Rehydrated (in a thread) if it was evicted
+        if conv_state is not None:
             print(f"    Retrieved existing conversation: {conversation_id}")
-            return self.state.active_conversations[conversation_id]
+            return conv_state
         
         print(f"    Created new conversation: {conversation_id}")
         return self.state.create_conversation(conversation_id)
@@ -568,45 +881,181 @@ class AgentCoordinator:
         """
         Save generated files to project using project service.
         """
-        try:
-            print(f"\n [{self.name}] Saving {len(files)} files to project {project_id}")
-            
-            # Convert CodeChange objects to file format expected by project service
-            file_list = []
-            for change in files:
-                if hasattr(change, 'file_path') and hasattr(change, 'content'):
-                    file_list.append({
-                        "file_path": change.file_path,
-                        "content": change.content,
-                        "operation": getattr(change, 'operation', 'create')
-                    })
-            
-            # Save files using project service
-            if project_service:
-                result = await project_service.save_generated_files(
-                    project_id=project_id,
-                    files=file_list,
-                    conversation_id=conversation_id
-                )
-                if result["success"]:
-                    print(f" [{self.name}] Saved {result['total_saved']} files to project")
-                    if result["total_failed"] > 0:
-                        print(f" [{self.name}] Failed to save {result['total_failed']} files")
-                else:
-                    print(f" [{self.name}] Failed to save files to project: {result.get('error', 'Unknown error')}")
-            else:
-                print(f" [{self.name}] Project service is not available. Cannot save files.")
+        with tracer.span("files.save", project_id=project_id, files=len(files)) as span:
+            try:
+                print(f"\n [{self.name}] Saving {len(files)} files to project {project_id}")
                 
-        except Exception as e:
-            print(f" [{self.name}] Error saving files to project: {str(e)}")
+                # Convert CodeChange objects to file format expected by project service
+                file_list = []
+                for change in files:
+                    if hasattr(change, 'file_path') and hasattr(change, 'content'):
+                        file_list.append({
+                            "file_path": change.file_path,
+                            "content": change.content,
+                            "operation": getattr(change, 'operation', 'create')
+                        })
+                
+                # Save files using project service
+                if project_service:
+                    result = await project_service.save_generated_files(
+                        project_id=project_id,
+                        files=file_list,
+                        conversation_id=conversation_id
+                    )
+                    if result["success"]:
+                        span.set(saved=result['total_saved'], failed=result["total_failed"])
+                        print(f" [{self.name}] Saved {result['total_saved']} files to project")
+                        if result["total_failed"] > 0:
+                            print(f" [{self.name}] Failed to save {result['total_failed']} files")
+                    else:
+                        span.set_outcome(OUTCOME_ERROR, result.get('error', 'Unknown error'))
+                        print(f" [{self.name}] Failed to save files to project: {result.get('error', 'Unknown error')}")
+                else:
+                    span.set_outcome(OUTCOME_ERROR, "Project service is not available")
+                    print(f" [{self.name}] Project service is not available. Cannot save files.")
+                    
+            except Exception as e:
+                span.set_outcome(OUTCOME_ERROR, str(e))
+                print(f" [{self.name}] Error saving files to project: {str(e)}")
+    
+    def _enter_stage(self, stage: str):
+        """Record which pipeline stage the current message has reached."""
+        active = self.active_requests.get(get_call_context().request_id)
+        if active is not None:
+            active.stage = stage
+            if active.on_stage is not None:
+                active.on_stage(stage)
+    
+    
+    def _cancellation_report(self, active: ActiveRequest) -> Dict[str, Any]:
+        """
+        Summarize what a cancelled message had done and what it skipped
+        (built once, when the cancelled workflow has stopped).
+        """
+        if active.report is None:
+            call_context = active.call_context
+            stages_skipped = (
+                PIPELINE_STAGES[PIPELINE_STAGES.index(active.stage) + 1:]
+                if active.stage in PIPELINE_STAGES else []
+            )
+            active.report = {
+                "request_id": active.request_id,
+                "conversation_id": active.conversation_id,
+                "reason": active.cancel_reason,
+                "stage": active.stage,
+                "stages_skipped": stages_skipped,
+                "elapsed_seconds": round(time.monotonic() - active.started_at, 3),
+                "llm_calls_completed": call_context.completed_calls,
+                "llm_streams_aborted": call_context.aborted_calls,
+                "tokens_discarded": call_context.discarded_tokens,
+                "queued_llm_calls_cancelled": active.queued_calls_cancelled,
+            }
+            
+            stats = self.cancellation_stats
+            stats["requests_cancelled"] += 1
+            stats["streams_aborted"] += call_context.aborted_calls
+            stats["queued_calls_cancelled"] += active.queued_calls_cancelled
+            stats["tokens_discarded"] += call_context.discarded_tokens
+            stats["by_reason"][active.cancel_reason] = stats["by_reason"].get(active.cancel_reason, 0) + 1
+            
+            print(f" [{self.name}] Cancelled {active.request_id} during {active.stage} ({active.cancel_reason}): "
+                  f"{call_context.aborted_calls} stream(s) aborted, {active.queued_calls_cancelled} queued call(s) dropped, "
+                  f"skipped {', '.join(stages_skipped) or 'nothing'}")
+        return active.report
+    
+    
+    async def _cancel(self, requests: List[ActiveRequest], reason: str) -> List[Dict[str, Any]]:
+        current = asyncio.current_task()
+        to_wait = []
+        for active in requests:
+            if active.task is None or active.task.done() or active.task is current or active.cancel_reason:
+                continue
+            active.cancel_reason = reason
+            # Count before cancelling: cancelling the task also drops its queued scheduler entries
+            active.queued_calls_cancelled = llm_scheduler.queued_for(active.conversation_id)
+            active.task.cancel()
+            to_wait.append(active)
+        
+        if not to_wait:
+            return []
+        
+        # Provider streams are closed and scheduler slots released as the tasks unwind
+        await asyncio.wait([active.task for active in to_wait], timeout=10.0)
+        reports = [self._cancellation_report(active) for active in to_wait]
+        
+        if f3_websocket_manager is not None:
+            for report in reports:
+                await f3_websocket_manager.manager.send_to_conversation(
+                    {"type": "generation_cancelled", **report}, report["conversation_id"]
+                )
+        return reports
+    
+    
+    async def cancel_conversation(
+        self, conversation_id: str, reason: str = "cancelled", include_background: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Stop every message being processed for a conversation: provider
+        streams are closed, queued and running LLM calls give their scheduler
+        slots back, and the remaining stages are skipped.
+        
+        Args:
+            include_background: Also stop messages submitted as jobs
+        
+        Returns:
+            Summary with one report per cancelled message
+        """
+        # Messages still waiting for their turn never start
+        keep = None if include_background else (lambda letter: bool(letter.payload.get("background")))
+        withdrawn = conversation_mailbox.withdraw_conversation(conversation_id, reason, keep=keep)
+        
+        requests = {id(active): active for active in list(self.active_requests.values()) if active.conversation_id == conversation_id}
+        spared = {key for key, active in requests.items() if active.background and not include_background}
+        reports = await self._cancel([active for key, active in requests.items() if key not in spared], reason)
+        
+        # Calls queued outside a registered message (e.g. a shared stream) for this conversation;
+        # left alone while a job of the conversation still needs them
+        if not spared and not conversation_mailbox.pending_for(conversation_id):
+            llm_scheduler.cancel_owner(conversation_id)
+        
+        return {
+            "conversation_id": conversation_id,
+            "reason": reason,
+            "requests_cancelled": len(reports),
+            "requests": reports,
+            "queued_messages_withdrawn": len(withdrawn)
+        }
+    
+    
+    async def _cancel_on_disconnect(self, conversation_id: str, reason: str) -> Dict[str, Any]:
+        """The last client of a conversation left: stop what it was watching, but not its jobs."""
+        return await self.cancel_conversation(conversation_id, reason, include_background=False)
+    
+    
+    async def cancel_request(self, request_id: str, reason: str = "cancelled") -> Optional[Dict[str, Any]]:
+        """
+        Stop one message (e.g. its HTTP client went away). Returns its report,
+        or None if it wasn't running (a message still waiting for its turn is
+        just withdrawn).
+        """
+        active = self.active_requests.get(request_id)
+        if active is None:
+            conversation_mailbox.withdraw(request_id, reason)
+            return None
+        reports = await self._cancel([active], reason)
+        return reports[0] if reports else None
+    
     
     def clear_conversation(self, conversation_id: str):
         """
         Clear a conversation from memory.
         """
-        if conversation_id in self.state.active_conversations:
-            del self.state.active_conversations[conversation_id]
-            print(f" [{self.name}] Cleared conversation: {conversation_id}")
+        # Don't leave queued LLM calls running for a conversation nobody owns
+        llm_scheduler.cancel_owner(conversation_id)
+        
+        # Also keeps its current history from being rehydrated later
+        conversation_store.forget(conversation_id)
+        print(f" [{self.name}] Cleared conversation: {conversation_id}")
     
     
     def get_system_stats(self) -> Dict[str, Any]:
@@ -619,6 +1068,10 @@ class AgentCoordinator:
                 len(conv.message_history) 
                 for conv in self.state.active_conversations.values()
             ),
+            "conversation_store": conversation_store.get_stats(),
+            "active_requests": len(self.active_requests),
+            "mailbox": conversation_mailbox.get_stats(),
+            "cancellations": self.cancellation_stats,
             "error_recovery_stats": error_recovery_agent.get_retry_stats()
         }
 
@@ -0,0 +1,94 @@
+"""
+Chat Pipeline
+=============
+The steps behind one /api/chat message, shared by the API process and
+the job workers (job_worker.py):
+
+- process_chat: run a validated ChatRequest through the coordinator
+- persist_chat: store the user message, the assistant's reply and the
+  conversation's mode (what the conversation store rehydrates from);
+  traced as the message's db.persist span
+- to_chat_response: turn the coordinator's answer into the API response
+
+SERVER SIDE FILE
+"""
+
+from typing import Callable, Optional
+
+from ..models.message_models import ChatRequest, ChatResponse
+from ..database.repositories import conversation_repo, message_repo
+from ..services.tracing import tracer, OUTCOME_SKIPPED
+from .agent_coordinator import agent_coordinator
+
+
+def process_chat(
+    request: ChatRequest, request_id: str, on_stage: Optional[Callable[[str], None]] = None, background: bool = False
+):
+    """The coordinator call for a validated chat request (background: run as a job)."""
+    return agent_coordinator.process_message(
+        message=request.message,
+        conversation_id=request.conversation_id,
+        project_context=request.project_context,
+        request_id=request_id,
+        latency_budget=request.latency_budget_ms / 1000.0 if request.latency_budget_ms else None,
+        on_stage=on_stage,
+        followup_policy=request.followup_policy,
+        background=background
+    )
+
+
+def persist_chat(request: ChatRequest, response, request_id: Optional[str] = None) -> None:
+    """
+    Store the user message and (unless it was cancelled or superseded) the
+    assistant's reply. A coalesced turn is stored once, by the message that
+    carried it, with the merged text the agents saw.
+    Timed as the db.persist span of the message's trace.
+    """
+    if not request.conversation_id:
+        return
+    metadata = response.metadata or {}
+    mailbox = metadata.get("mailbox") or {}
+    if mailbox.get("absorbed_into"):
+        return
+    with tracer.span("db.persist", request_id=request_id or metadata.get("request_id")) as span:
+        conv = conversation_repo.get_conversation(request.conversation_id)
+        if not conv:
+            span.set_outcome(OUTCOME_SKIPPED, "conversation not found")
+            return
+        message_repo.create_message(
+            conversation_id=conv['id'],
+            role='user',
+            content=mailbox.get("message", request.message)
+        )
+        stored = 1
+        if not (metadata.get("cancelled") or metadata.get("superseded")):  # No answer to keep
+            message_repo.create_message(
+                conversation_id=conv['id'],
+                role='assistant',
+                content=response.content,
+                intent_type=response.intent.value if hasattr(response, 'intent') else None,
+                files_modified=response.files_modified
+            )
+            stored += 1
+        # Remembered so the conversation comes back in the same mode and project after it was evicted from memory
+        conversation_repo.update_conversation(
+            request.conversation_id, getattr(response.mode, "value", response.mode),
+            project_key=(request.project_context or {}).get("project_id")
+        )
+        span.set(messages=stored)
+
+
+def to_chat_response(response) -> ChatResponse:
+    return ChatResponse(
+        message=response.content,
+        conversation_id=response.conversation_id,
+        mode=response.mode,
+        files_changed=response.files_modified,
+        preview_update_required=response.files_modified is not None and len(response.files_modified) > 0,
+        error=response.error,
+        metadata=response.metadata
+    )
+
+
+# Export
+__all__ = ['process_chat', 'persist_chat', 'to_chat_response']
@@ -7,7 +7,9 @@ from .repositories import (
     message_repo,
     template_repo,
     error_log_repo,
-    generation_history_repo
+    generation_history_repo,
+    api_usage_repo,
+    job_queue_repo
 )
 
 __all__ = [
@@ -20,5 +22,7 @@ __all__ = [
     'message_repo',
     'template_repo',
     'error_log_repo',
-    'generation_history_repo'
+    'generation_history_repo',
+    'api_usage_repo',
+    'job_queue_repo'
 ]
\ No newline at end of file
@@ -36,9 +36,12 @@ class Database:
         if self.connection is None:
             self.connection = sqlite3.connect(
                 str(self.db_path),
-                check_same_thread=False
+                check_same_thread=False,
+                timeout=30
             )
             self.connection.row_factory = sqlite3.Row
+            # Job worker processes write to the same file; WAL lets them and the API read while one writes
+            self.connection.execute("PRAGMA journal_mode=WAL")
     
     def get_connection(self):
         if self.connection is None:
@@ -206,8 +209,83 @@ class Database:
             CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id)
         """)
         
+        # The file-system project id (f3_project_...) the conversation works on
+        self._add_missing_columns(cursor, "conversations", {"project_key": "TEXT"})
+        
+        # Messages up to this id were cleared: they stay stored but aren't loaded back into the conversation
+        self._add_missing_columns(cursor, "conversations", {"cleared_after_message_id": "INTEGER DEFAULT 0"})
+        
+        self._add_missing_columns(cursor, "api_usage", {
+            "project_id": "TEXT",
+            "conversation_id": "TEXT",
+            "call_type": "TEXT",
+            "model": "TEXT",
+            "prompt_tokens": "INTEGER DEFAULT 0",
+            "completion_tokens": "INTEGER DEFAULT 0",
+            "latency_ms": "INTEGER",
+            "first_token_ms": "INTEGER",
+            "success": "BOOLEAN DEFAULT 1",
+            "cached_tokens": "INTEGER DEFAULT 0"
+        })
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_api_usage_date_call_type ON api_usage(date, call_type)
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_queue (
+                job_id TEXT PRIMARY KEY,
+                conversation_id TEXT,
+                client_id TEXT,
+                payload TEXT NOT NULL,
+                status TEXT DEFAULT 'queued',
+                stage TEXT DEFAULT 'queued',
+                progress INTEGER DEFAULT 0,
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER DEFAULT 3,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                cancel_requested BOOLEAN DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_job_queue_status ON job_queue(status, created_at)
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_leases (
+                conversation_id TEXT PRIMARY KEY,
+                lease_owner TEXT NOT NULL,
+                lease_expires_at REAL NOT NULL
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT,
+                conversation_id TEXT,
+                client_id TEXT,
+                event TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        
         self.connection.commit()
     
+    def _add_missing_columns(self, cursor, table: str, columns: dict):
+        # CREATE TABLE IF NOT EXISTS won't touch existing databases, so add new columns by hand
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    
     def execute(self, query: str, params: tuple = ()):
         if self.connection is None:
             self.connect()
@@ -227,6 +305,16 @@ class Database:
         cursor.execute(query, params)
         return cursor.fetchone()
 
+    def executemany(self, query: str, params_seq: list):
+        if self.connection is None:
+            self.connect()
+        if self.connection is None:
+            raise RuntimeError("Database connection could not be established.")
+        cursor = self.connection.cursor()
+        cursor.executemany(query, params_seq)
+        self.connection.commit()
+        return cursor
+
     def fetchall(self, query: str, params: tuple = ()):
         if self.connection is None:
             self.connect()
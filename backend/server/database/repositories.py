@@ -1,6 +1,7 @@
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import json
+import time
 from .database import database
 
 
@@ -140,12 +141,13 @@ class ConversationRepository:
         self,
         user_id: int,
         conversation_id: str,
-        project_id: Optional[int] = None
+        project_id: Optional[int] = None,
+        project_key: Optional[str] = None
     ) -> Optional[int]:
         try:
             cursor = database.execute(
-                "INSERT INTO conversations (user_id, conversation_id, project_id) VALUES (?, ?, ?)",
-                (user_id, conversation_id, project_id)
+                "INSERT INTO conversations (user_id, conversation_id, project_id, project_key) VALUES (?, ?, ?, ?)",
+                (user_id, conversation_id, project_id, project_key)
             )
             return cursor.lastrowid
         except Exception as e:
@@ -166,12 +168,22 @@ class ConversationRepository:
         )
         return [dict(row) for row in rows]
     
-    def update_conversation(self, conversation_id: str, mode: str):
+    def update_conversation(self, conversation_id: str, mode: str, project_key: Optional[str] = None):
+        database.execute(
+            """UPDATE conversations 
+               SET current_mode = ?, project_key = COALESCE(?, project_key), last_message_at = CURRENT_TIMESTAMP
+               WHERE conversation_id = ?""",
+            (mode, project_key, conversation_id)
+        )
+    
+    def mark_cleared(self, conversation_id: str):
         database.execute(
             """UPDATE conversations 
-               SET current_mode = ?, last_message_at = CURRENT_TIMESTAMP
+               SET cleared_after_message_id = (
+                   SELECT COALESCE(MAX(id), 0) FROM messages WHERE messages.conversation_id = conversations.id
+               )
                WHERE conversation_id = ?""",
-            (mode, conversation_id)
+            (conversation_id,)
         )
     
     def delete_conversation(self, conversation_id: str):
@@ -220,6 +232,17 @@ class MessageRepository:
         )
         messages = [dict(row) for row in rows]
         return list(reversed(messages))
+    
+    def get_recent_messages(self, conversation_id: int, limit: int = 50, after_id: int = 0) -> List[Dict]:
+        # Ordered by id: messages written in the same second keep their order
+        rows = database.fetchall(
+            """SELECT * FROM messages 
+               WHERE conversation_id = ? AND id > ? 
+               ORDER BY id DESC 
+               LIMIT ?""",
+            (conversation_id, after_id, limit)
+        )
+        return list(reversed([dict(row) for row in rows]))
 
 
 class TemplateRepository:
@@ -334,6 +357,331 @@ class GenerationHistoryRepository:
         return [dict(row) for row in rows]
 
 
+class ApiUsageRepository:
+    
+    GROUP_COLUMNS = ("call_type", "model", "user_id", "project_id", "conversation_id", "date")
+    
+    def log_usage_batch(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        try:
+            database.executemany(
+                """INSERT INTO api_usage 
+                   (user_id, endpoint, project_id, conversation_id, call_type, model,
+                    prompt_tokens, completion_tokens, tokens_used, latency_ms, first_token_ms, success,
+                    cached_tokens)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (
+                        row.get("user_id") or 0,  # 0 = anonymous
+                        row.get("endpoint", "llm"),
+                        row.get("project_id"),
+                        row.get("conversation_id"),
+                        row.get("call_type"),
+                        row.get("model"),
+                        row.get("prompt_tokens", 0),
+                        row.get("completion_tokens", 0),
+                        row.get("prompt_tokens", 0) + row.get("completion_tokens", 0),
+                        row.get("latency_ms"),
+                        row.get("first_token_ms"),
+                        row.get("success", True),
+                        row.get("cached_tokens", 0)
+                    )
+                    for row in rows
+                ]
+            )
+            return len(rows)
+        except Exception as e:
+            print(f"Error logging API usage: {e}")
+            return 0
+    
+    def get_usage_summary(
+        self,
+        group_by: str = "call_type",
+        user_id: Optional[int] = None,
+        project_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        since: Optional[str] = None
+    ) -> List[Dict]:
+        if group_by not in self.GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {', '.join(self.GROUP_COLUMNS)}")
+        
+        filters = []
+        params: List[Any] = []
+        if user_id is not None:
+            filters.append("user_id = ?")
+            params.append(user_id)
+        if project_id is not None:
+            filters.append("project_id = ?")
+            params.append(project_id)
+        if conversation_id is not None:
+            filters.append("conversation_id = ?")
+            params.append(conversation_id)
+        if since is not None:
+            filters.append("date >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        
+        rows = database.fetchall(
+            f"""SELECT {group_by} AS grp,
+                      COUNT(*) AS calls,
+                      SUM(CASE WHEN success THEN 0 ELSE 1 END) AS failed_calls,
+                      COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                      COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+                      COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+                      COALESCE(SUM(tokens_used), 0) AS tokens_used,
+                      AVG(latency_ms) AS avg_latency_ms,
+                      MAX(latency_ms) AS max_latency_ms,
+                      COALESCE(SUM(latency_ms), 0) AS total_latency_ms,
+                      AVG(first_token_ms) AS avg_first_token_ms
+               FROM api_usage
+               {where}
+               GROUP BY {group_by}
+               ORDER BY tokens_used DESC""",
+            tuple(params)
+        )
+        summary = []
+        for row in rows:
+            item = dict(row)
+            item[group_by] = item.pop("grp")
+            summary.append(item)
+        return summary
+
+
+class JobQueueRepository:
+    
+    def enqueue(
+        self,
+        job_id: str,
+        payload: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        client_id: Optional[str] = None,
+        max_attempts: int = 3,
+        created_at: Optional[float] = None
+    ) -> bool:
+        try:
+            database.execute(
+                """INSERT INTO job_queue 
+                   (job_id, conversation_id, client_id, payload, max_attempts, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (job_id, conversation_id, client_id, json.dumps(payload), max_attempts,
+                 created_at if created_at is not None else time.time())
+            )
+            return True
+        except Exception as e:
+            print(f"Error enqueuing job: {e}")
+            return False
+    
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        row = database.fetchone("SELECT * FROM job_queue WHERE job_id = ?", (job_id,))
+        return dict(row) if row else None
+    
+    def count_by_status(self) -> Dict[str, int]:
+        rows = database.fetchall("SELECT status, COUNT(*) AS jobs FROM job_queue GROUP BY status")
+        return {row["status"]: row["jobs"] for row in rows}
+    
+    def queue_position(self, job_id: str) -> Optional[int]:
+        row = database.fetchone(
+            """SELECT COUNT(*) AS position FROM job_queue 
+               WHERE status = 'queued' 
+               AND created_at <= (SELECT created_at FROM job_queue WHERE job_id = ? AND status = 'queued')""",
+            (job_id,)
+        )
+        return row["position"] if row and row["position"] else None
+    
+    def claim(self, lease_owner: str, visibility_timeout: float, now: Optional[float] = None) -> Optional[Dict]:
+        # One UPDATE picks and leases the oldest available job, so two workers can't claim the same one.
+        # A running job whose lease expired (its worker died) is available again.
+        # Jobs of a conversation that already has a live job wait, so each conversation runs in order;
+        # so do jobs of a conversation the API process is answering directly (a live conversation lease).
+        now = now if now is not None else time.time()
+        available = """(status = 'queued' OR (status = 'running' AND lease_expires_at < ?))
+                       AND cancel_requested = 0 AND attempts < max_attempts"""
+        cursor = database.execute(
+            f"""UPDATE job_queue 
+                SET status = 'running', lease_owner = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, started_at = COALESCE(started_at, ?)
+                WHERE job_id = (
+                    SELECT job_id FROM job_queue WHERE {available}
+                    AND (conversation_id IS NULL OR conversation_id NOT IN (
+                        SELECT conversation_id FROM job_queue 
+                        WHERE status = 'running' AND lease_expires_at >= ? AND conversation_id IS NOT NULL
+                    ))
+                    AND (conversation_id IS NULL OR conversation_id NOT IN (
+                        SELECT conversation_id FROM conversation_leases WHERE lease_expires_at >= ?
+                    ))
+                    ORDER BY created_at LIMIT 1
+                )
+                AND {available}""",
+            (lease_owner, now + visibility_timeout, now, now, now, now, now)
+        )
+        if cursor.rowcount == 0:
+            return None
+        row = database.fetchone("SELECT * FROM job_queue WHERE lease_owner = ? AND status = 'running'", (lease_owner,))
+        return dict(row) if row else None
+    
+    def fail_abandoned(self, now: Optional[float] = None) -> List[Dict]:
+        # Jobs whose lease expired after their last allowed attempt (or that were cancelled while the worker was gone)
+        now = now if now is not None else time.time()
+        rows = database.fetchall(
+            """SELECT * FROM job_queue 
+               WHERE status = 'running' AND lease_expires_at < ?
+               AND (attempts >= max_attempts OR cancel_requested = 1)""",
+            (now,)
+        )
+        finished = []
+        for row in rows:
+            job = dict(row)
+            status = "cancelled" if job["cancel_requested"] else "failed"
+            error = None if job["cancel_requested"] else f"Worker lost the job {job['attempts']} time(s)"
+            cursor = database.execute(
+                """UPDATE job_queue 
+                   SET status = ?, error = ?, finished_at = ?, lease_owner = NULL
+                   WHERE job_id = ? AND status = 'running' AND lease_expires_at < ?""",
+                (status, error, now, job["job_id"], now)
+            )
+            if cursor.rowcount:
+                job.update(status=status, error=error, finished_at=now)
+                finished.append(job)
+        return finished
+    
+    def extend_lease(self, job_id: str, lease_owner: str, visibility_timeout: float) -> Optional[Dict]:
+        # None means the lease is gone (expired and claimed by another worker, or the job was finished)
+        cursor = database.execute(
+            """UPDATE job_queue SET lease_expires_at = ? 
+               WHERE job_id = ? AND lease_owner = ? AND status = 'running'""",
+            (time.time() + visibility_timeout, job_id, lease_owner)
+        )
+        if cursor.rowcount == 0:
+            return None
+        return self.get_job(job_id)
+    
+    def update_progress(self, job_id: str, lease_owner: str, stage: str, progress: int):
+        database.execute(
+            """UPDATE job_queue SET stage = ?, progress = MAX(progress, ?) 
+               WHERE job_id = ? AND lease_owner = ? AND status = 'running'""",
+            (stage, progress, job_id, lease_owner)
+        )
+    
+    def finish(
+        self,
+        job_id: str,
+        lease_owner: str,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ) -> bool:
+        cursor = database.execute(
+            """UPDATE job_queue 
+               SET status = ?, result = ?, error = ?, finished_at = ?, lease_owner = NULL,
+                   progress = CASE WHEN ? = 'completed' THEN 100 ELSE progress END
+               WHERE job_id = ? AND lease_owner = ? AND status = 'running'""",
+            (status, json.dumps(result) if result is not None else None, error, time.time(),
+             status, job_id, lease_owner)
+        )
+        return cursor.rowcount > 0
+    
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        # Queued jobs are cancelled right away; running ones are flagged for their worker
+        cursor = database.execute(
+            "UPDATE job_queue SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        )
+        if cursor.rowcount:
+            return "cancelled"
+        cursor = database.execute(
+            "UPDATE job_queue SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'",
+            (job_id,)
+        )
+        return "cancel_requested" if cursor.rowcount else None
+    
+    def unfinished_jobs(self, conversation_id: str) -> List[str]:
+        rows = database.fetchall(
+            "SELECT job_id FROM job_queue WHERE conversation_id = ? AND status IN ('queued', 'running')",
+            (conversation_id,)
+        )
+        return [row["job_id"] for row in rows]
+    
+    def acquire_conversation_lease(
+        self, conversation_id: str, lease_owner: str, visibility_timeout: float, now: Optional[float] = None
+    ) -> bool:
+        # One statement: taken only while no job of the conversation is queued or running (and no one
+        # else holds a live lease), so a worker claim and a direct turn can't both win
+        now = now if now is not None else time.time()
+        cursor = database.execute(
+            """INSERT INTO conversation_leases (conversation_id, lease_owner, lease_expires_at)
+               SELECT ?, ?, ? WHERE NOT EXISTS (
+                   SELECT 1 FROM job_queue WHERE conversation_id = ?
+                   AND ((status = 'queued' AND cancel_requested = 0 AND attempts < max_attempts)
+                        OR (status = 'running' AND lease_expires_at >= ?))
+               )
+               ON CONFLICT(conversation_id) DO UPDATE
+               SET lease_owner = excluded.lease_owner, lease_expires_at = excluded.lease_expires_at
+               WHERE conversation_leases.lease_expires_at < ?""",
+            (conversation_id, lease_owner, now + visibility_timeout, conversation_id, now, now)
+        )
+        return cursor.rowcount > 0
+    
+    def extend_conversation_lease(self, conversation_id: str, lease_owner: str, visibility_timeout: float) -> bool:
+        cursor = database.execute(
+            "UPDATE conversation_leases SET lease_expires_at = ? WHERE conversation_id = ? AND lease_owner = ?",
+            (time.time() + visibility_timeout, conversation_id, lease_owner)
+        )
+        return cursor.rowcount > 0
+    
+    def release_conversation_lease(self, conversation_id: str, lease_owner: str):
+        database.execute(
+            "DELETE FROM conversation_leases WHERE conversation_id = ? AND lease_owner = ?",
+            (conversation_id, lease_owner)
+        )
+    
+    def add_events(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        try:
+            database.executemany(
+                """INSERT INTO job_events (job_id, conversation_id, client_id, event, created_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [
+                    (
+                        row.get("job_id"),
+                        row.get("conversation_id"),
+                        row.get("client_id"),
+                        json.dumps(row["event"]),
+                        row.get("created_at", time.time())
+                    )
+                    for row in rows
+                ]
+            )
+            return len(rows)
+        except Exception as e:
+            print(f"Error writing job events: {e}")
+            return 0
+    
+    def events_after(self, last_id: int, limit: int = 500) -> List[Dict]:
+        rows = database.fetchall(
+            "SELECT * FROM job_events WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, limit)
+        )
+        events = []
+        for row in rows:
+            event = dict(row)
+            event["event"] = json.loads(event["event"])
+            events.append(event)
+        return events
+    
+    def last_event_id(self) -> int:
+        row = database.fetchone("SELECT COALESCE(MAX(id), 0) AS last_id FROM job_events")
+        return row["last_id"] if row else 0
+    
+    def purge(self, finished_before: float, events_before: float):
+        database.execute(
+            "DELETE FROM job_queue WHERE status IN ('completed', 'failed', 'cancelled') AND finished_at < ?",
+            (finished_before,)
+        )
+        database.execute("DELETE FROM job_events WHERE created_at < ?", (events_before,))
+
+
 user_repo = UserRepository()
 project_repo = ProjectRepository()
 file_repo = FileRepository()
@@ -342,6 +690,8 @@ message_repo = MessageRepository()
 template_repo = TemplateRepository()
 error_log_repo = ErrorLogRepository()
 generation_history_repo = GenerationHistoryRepository()
+api_usage_repo = ApiUsageRepository()
+job_queue_repo = JobQueueRepository()
 
 
 __all__ = [
@@ -352,5 +702,7 @@ __all__ = [
     'message_repo',
     'template_repo',
     'error_log_repo',
-    'generation_history_repo'
+    'generation_history_repo',
+    'api_usage_repo',
+    'job_queue_repo'
 ]  
\ No newline at end of file
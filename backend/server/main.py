@@ -12,6 +12,7 @@ This is the cleaned-up F3 backend with 9 essential endpoints:
 
   AI Chat:
   - /api/chat                          # Main AI conversation (POST)
+  - /api/jobs/{id}                     # Chat job status (GET) / Cancel (DELETE)
 
   Projects:
   - /api/projects                      # Create project from prompt (POST)
@@ -28,24 +29,46 @@ This is the cleaned-up F3 backend with 9 essential endpoints:
   Conversations:
   - /api/conversations/{id}            # Clear conversation (DELETE)
 
+  Usage:
+  - /api/usage                         # Aggregated LLM token/latency usage (GET)
+  - /api/traces                        # Recent request traces (GET)
+  - /api/traces/{request_id}           # One request's pipeline spans (GET)
+
 All endpoints have TODO comments for Supabase authentication integration.
 """
 
-from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi import FastAPI, HTTPException, WebSocket, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any
-from dataclasses import dataclass
+from fastapi.responses import JSONResponse
+from typing import Dict, Any, Optional
+from dataclasses import dataclass, asdict
+from datetime import datetime
+import asyncio
 import uvicorn
 import os
+import uuid
 from dotenv import load_dotenv
 
 from server.coordinator.agent_coordinator import agent_coordinator
+from server.coordinator.chat_pipeline import process_chat, persist_chat, to_chat_response
 from server.models.message_models import ChatRequest, ChatResponse
 from server.services.file_service import file_service
 from server.services.preview_service import preview_service
 from server.services.websocket_service import f3_websocket_manager
+from server.services.rate_limiter import rate_limiter
+from server.services.llm_scheduler import llm_scheduler
+from server.services.circuit_breaker import provider_breaker
+from server.services.request_deadline import deadline_policy
+from server.services.job_manager import job_manager, Job, JobQueueFull, JOB_QUEUED
+from server.services.job_queue import job_queue, ConversationBusy
+from server.services.conversation_mailbox import conversation_mailbox, MailboxFull
+from server.services.response_cache import response_cache
+from server.services.plan_cache import plan_cache
+from server.services.ai_service import ai_service
+from server.services.usage_tracker import usage_tracker
+from server.services.tracing import tracer
 from server.projects.project_service import project_service
-from server.database.repositories import project_repo, conversation_repo, message_repo
+from server.database.repositories import project_repo, conversation_repo
 
 load_dotenv()
 
@@ -118,6 +141,17 @@ async def health_check():
                 "ai_service": "active"
             },
             "websocket": f3_websocket_manager.get_stats(),
+            "ai_service": ai_service.get_stats(),
+            "rate_limiter": rate_limiter.get_stats(),
+            "llm_scheduler": llm_scheduler.get_stats(),
+            "circuit_breaker": provider_breaker.get_stats(),
+            "deadlines": deadline_policy.get_stats(),
+            "jobs": job_manager.get_stats(),
+            "job_queue": job_queue.get_stats(),
+            "response_cache": response_cache.get_stats(),
+            "plan_cache": plan_cache.get_stats(),
+            "usage_tracker": usage_tracker.get_stats(),
+            "tracing": tracer.get_stats(),
             "statistics": stats
         }
     except Exception as e:
@@ -127,8 +161,65 @@ async def health_check():
         }
 
 
+async def _run_until_disconnect(http_request: Request, request_id: str, work: "asyncio.Task"):
+    """
+    Wait for a chat message to be processed; if the HTTP client goes away
+    first, cancel it so no LLM work is spent on a response nobody reads.
+    """
+    try:
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=1.0)
+            if done:
+                return work.result()
+            if await http_request.is_disconnected():
+                await agent_coordinator.cancel_request(request_id, "client disconnected")
+                break
+        # Cancelled once; the message now unwinds on its own
+        return await work
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+
+
+async def _deliver(message: Dict[str, Any], conversation_id: Optional[str], client_id: Optional[str]):
+    """Send to one client if given, otherwise to everyone in the conversation."""
+    if client_id:
+        await f3_websocket_manager.manager.send_to_client(message, client_id)
+    elif conversation_id:
+        await f3_websocket_manager.manager.send_to_conversation(message, conversation_id)
+
+
+async def _publish_job_event(job: Job, event: Dict[str, Any]):
+    """Push a job's status to the client that submitted it (or to the conversation)."""
+    await _deliver({**event, "timestamp": datetime.now().isoformat()}, job.conversation_id, job.client_id)
+
+
+async def _cancel_conversation(conversation_id: str, reason: str) -> Dict[str, Any]:
+    """Cancel a conversation's generations here and its jobs in the worker processes."""
+    cancellation = await agent_coordinator.cancel_conversation(conversation_id, reason)
+    if job_queue.enabled:
+        cancellation["jobs_cancelled"] = job_queue.cancel_conversation(conversation_id)
+    return cancellation
+
+
+job_manager.set_publisher(_publish_job_event)
+job_queue.set_publisher(_deliver)  # Events written by job_worker.py processes
+if job_queue.enabled:
+    # Only an explicit cancel reaches the durable jobs; they outlive the client's socket
+    f3_websocket_manager.set_cancel_handler(_cancel_conversation)
+
+
+def _get_job(job_id: str) -> Optional[Job]:
+    return job_queue.get(job_id) if job_queue.enabled else job_manager.get(job_id)
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
+    """
+    Main AI conversation.
+    With "async_job": true the message is queued and the response (202) only
+    carries a job id; poll GET /api/jobs/{id} or listen on /ws/{client_id}.
+    """
     try:
         print(f"\nReceived chat request: {request.message[:50]}...")
         if not request.conversation_id:
@@ -141,44 +232,89 @@ async def chat(request: ChatRequest):
         conv_db = conversation_repo.get_conversation(request.conversation_id)
         if not conv_db:
             raise HTTPException(status_code=400, detail="invalid conversation_id")
+        if request.latency_budget_ms is not None and request.latency_budget_ms <= 0:
+            raise HTTPException(status_code=400, detail="latency_budget_ms must be positive")
+        try:
+            conversation_mailbox.resolve_policy(request.followup_policy)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        response = await agent_coordinator.process_message(
-            message=request.message,
-            conversation_id=request.conversation_id,
-            project_context=request.project_context
-        )
-        
-        if request.conversation_id:
-            conv = conversation_repo.get_conversation(request.conversation_id)
-            if conv:
-                message_repo.create_message(
-                    conversation_id=conv['id'],
-                    role='user',
-                    content=request.message
-                )
-                message_repo.create_message(
-                    conversation_id=conv['id'],
-                    role='assistant',
-                    content=response.content,
-                    intent_type=response.intent.value if hasattr(response, 'intent') else None,
-                    files_modified=response.files_modified
+        if request.async_job:
+            async def run_job(job: Job) -> Dict[str, Any]:
+                response = await process_chat(
+                    request, job.job_id, on_stage=lambda stage: job_manager.update_stage(job, stage), background=True
                 )
+                persist_chat(request, response, job.job_id)
+                return asdict(to_chat_response(response))
+            
+            try:
+                if job_queue.enabled:
+                    # Run by a job_worker.py process; the queue outlives this one
+                    job = job_queue.submit(asdict(request), conversation_id=request.conversation_id, client_id=request.client_id)
+                else:
+                    job = job_manager.submit(run_job, conversation_id=request.conversation_id, client_id=request.client_id)
+            except JobQueueFull as e:
+                raise HTTPException(status_code=429, detail=str(e))
+            
+            return JSONResponse(status_code=202, content={
+                "job_id": job.job_id,
+                "status": job.status,
+                "queue_position": (job_queue if job_queue.enabled else job_manager).queue_position(job),
+                "status_url": f"/api/jobs/{job.job_id}"
+            })
         
-        return ChatResponse(
-            message=response.content,
-            conversation_id=response.conversation_id,
-            mode=response.mode,
-            files_changed=response.files_modified,
-            preview_update_required=response.files_modified is not None and len(response.files_modified) > 0,
-            error=response.error,
-            metadata=response.metadata
-        )
+        request_id = str(uuid.uuid4())
+        try:
+            response = await _run_until_disconnect(http_request, request_id, asyncio.create_task(
+                process_chat(request, request_id)
+            ))
+        except MailboxFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except ConversationBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        persist_chat(request, response, request_id)
+        return to_chat_response(response)
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status, stage and progress of a chat job (result included once completed).
+    TODO: Add Supabase authentication and job ownership check
+    """
+    job = _get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    status = job.to_dict()
+    if job.status == JOB_QUEUED:
+        status["queue_position"] = (job_queue if job_queue.enabled else job_manager).queue_position(job)
+    return status
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running chat job.
+    TODO: Add Supabase authentication and job ownership check
+    """
+    job = _get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    if job_queue.enabled:
+        # A running job is cancelled by its worker at the next lease renewal
+        job_queue.cancel(job_id)
+        return _get_job(job_id).to_dict()
+    if not job_manager.cancel_queued(job_id):
+        await agent_coordinator.cancel_request(job_id, "job cancelled")
+    return job.to_dict()
+
+
 # Removed: Legacy project creation endpoint - use /api/projects instead
 
 
@@ -219,7 +355,8 @@ async def create_project(request: Dict[str, Any]):
             db_conversation_id = conversation_repo.create_conversation(
                 user_id=user_id,
                 conversation_id=conversation_id,
-                project_id=db_project_id
+                project_id=db_project_id,
+                project_key=project_id
             )
         except Exception as db_error:
             print(f"Database save failed (non-critical): {db_error}")
@@ -374,12 +511,77 @@ async def clear_conversation(conversation_id: str):
     TODO: Add Supabase authentication and conversation ownership check
     """
     try:
+        # Stop any generation still running for it first
+        cancellation = await _cancel_conversation(conversation_id, "conversation deleted")
         agent_coordinator.clear_conversation(conversation_id)
-        return {"message": f"Conversation {conversation_id} cleared"}
+        return {"message": f"Conversation {conversation_id} cleared", "cancellation": cancellation}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/usage")
+async def get_usage(
+    group_by: str = "call_type",
+    user_id: Optional[int] = None,
+    project_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    since: Optional[str] = None
+):
+    """
+    Aggregate LLM usage (tokens, latency) by call_type, model, user_id,
+    project_id, conversation_id or date. `since` is a YYYY-MM-DD date.
+    TODO: Add Supabase authentication check (admin only)
+    """
+    try:
+        summary = usage_tracker.get_usage_summary(
+            group_by=group_by,
+            user_id=user_id,
+            project_id=project_id,
+            conversation_id=conversation_id,
+            since=since
+        )
+        return {"group_by": group_by, "usage": summary}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/traces")
+async def list_traces(
+    conversation_id: Optional[str] = None,
+    min_duration_ms: Optional[float] = None,
+    outcome: Optional[str] = None,
+    limit: int = 50
+):
+    """
+    Most recent request traces (newest first) with their duration, tokens
+    and time per stage; filter by conversation, minimum duration or outcome.
+    TODO: Add Supabase authentication check (admin only)
+    """
+    return {"traces": tracer.list_traces(
+        conversation_id=conversation_id,
+        min_duration_ms=min_duration_ms,
+        outcome=outcome,
+        limit=max(1, min(limit, 500))
+    )}
+
+
+@app.get("/api/traces/{request_id}")
+async def get_trace(request_id: str, format: str = "json"):
+    """
+    Every span of one request (the request_id in its WebSocket messages and
+    response metadata). `format=otlp` returns it as OTLP/JSON.
+    TODO: Add Supabase authentication check (admin only)
+    """
+    if format not in ("json", "otlp"):
+        raise HTTPException(status_code=400, detail="format must be json or otlp")
+    trace = tracer.get_trace(request_id, otlp=format == "otlp")
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+
 # Removed: Mode setting endpoint - handled automatically by AI
 
 
@@ -414,10 +616,16 @@ async def startup_event():
     print(f"API endpoints registered")
     print(f"Server running on http://localhost:{os.getenv('PORT', 8000)}")
     print("="*70 + "\n")
+    # Deliver progress from the job_worker.py processes (JOB_BACKEND=sqlite)
+    job_queue.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Write any buffered usage rows and spans before the process exits
+    usage_tracker.flush()
+    tracer.flush()
+    await job_queue.stop()
     # TODO: Add proper database cleanup when implemented
     print("\n" + "="*70)
     print("F3 AI Backend Shutting Down...")
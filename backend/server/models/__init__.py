@@ -5,6 +5,7 @@ __all__ = [
     'MessageRole',
     'IntentType',
     'ModeType',
+    'LLMCallType',
     'ErrorSeverity',
     'UserMessage',
     'AssistantResponse',
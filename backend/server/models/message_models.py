@@ -44,6 +44,19 @@ class ModeType(str, Enum):
     CODE_MODE = "code"  # Code generation mode
 
 
+class LLMCallType(str, Enum):
+    """
+    What an LLM call is for.
+    Used to prioritize, rate limit and account for calls to the AI service.
+    """
+    INTENT = "intent"                  # Intent classification
+    PLAN = "plan"                      # Execution planning
+    CODE = "code"                      # Code generation for a plan step
+    ERROR_ANALYSIS = "error_analysis"  # Error recovery analysis
+    NARRATION = "narration"            # Progress narration shown while working
+    CHAT = "chat"                      # Chat mode responses
+
+
 class ErrorSeverity(str, Enum):
     """
     How serious is the error?
@@ -233,7 +246,7 @@ class CoordinatorState:
     """
     Overall state managed by the Agent Coordinator.
     """
-    active_conversations: Dict[str, ConversationState] = field(default_factory=dict)
+    active_conversations: Dict[str, ConversationState] = field(default_factory=dict)  # The coordinator passes its ConversationStore
     
     def get_conversation(self, conversation_id: str) -> Optional[ConversationState]:
         """Get a specific conversation's state."""
@@ -263,6 +276,10 @@ class ChatRequest:
     message: str
     conversation_id: Optional[str] = None
     project_context: Optional[Dict[str, Any]] = None
+    latency_budget_ms: Optional[int] = None  # Answer within this many ms (stages degrade to fit)
+    async_job: bool = False                  # Queue it and return a job id right away
+    client_id: Optional[str] = None          # WebSocket client that receives job updates
+    followup_policy: Optional[str] = None    # "queue", "coalesce" or "supersede" if a turn is still running
 
 
 @dataclass
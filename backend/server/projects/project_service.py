@@ -236,6 +236,31 @@ class ProjectService:
                 "error": f"Failed to save files: {str(e)}"
             }
     
+    def load_project_files(self, project_id: str) -> Dict[str, str]:
+        """
+        Read a project's files back from the file system.
+        
+        Args:
+            project_id: The project identifier
+            
+        Returns:
+            Dict of {file_path: content} (empty if the project doesn't exist)
+        """
+        project_path = file_service.base_dir / project_id
+        files: Dict[str, str] = {}
+        if not project_path.is_dir():
+            return files
+        
+        for full_path in sorted(project_path.rglob("*")):
+            relative = full_path.relative_to(project_path)
+            if not full_path.is_file() or any(part.startswith(".") for part in relative.parts):
+                continue  # Skip .f3_metadata.json and other hidden files
+            relative_path = relative.as_posix()
+            result = file_service.read_file(project_id, relative_path)
+            if result["success"]:
+                files[relative_path] = result["content"]
+        return files
+    
     async def delete_project(self, project_id: str) -> Dict[str, Any]:
         """
         Delete project completely (file system + database).
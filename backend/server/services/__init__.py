@@ -3,11 +3,19 @@ from .compiler_service import compiler_service
 from .file_service import file_service
 from .preview_service import preview_service
 from .flutter_project_manager import flutter_project_manager
+from .rate_limiter import rate_limiter
+from .llm_scheduler import llm_scheduler
+from .response_cache import response_cache
+from .plan_cache import plan_cache
 
 __all__ = [
     'ai_service',
     'compiler_service',
     'file_service',
     'preview_service',
-    'flutter_project_manager'
+    'flutter_project_manager',
+    'rate_limiter',
+    'llm_scheduler',
+    'response_cache',
+    'plan_cache'
 ]
\ No newline at end of file
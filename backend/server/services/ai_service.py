@@ -9,15 +9,43 @@ NEVER expose this to the frontend!
 """
 
 import os
+import re
 import json
 import time
+import random
+import uuid
 import asyncio
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator
 from collections import deque
-import google.generativeai as genai
-from google.generativeai.types import GenerationConfig
 from dotenv import load_dotenv
 
+from ..models.message_models import LLMCallType
+from .call_context import get_call_context, set_call_context, reset_call_context
+from .llm_providers import LLMProvider, create_provider_from_env
+from .rate_limiter import rate_limiter
+from .llm_scheduler import llm_scheduler, LLMCallCancelled
+from .circuit_breaker import provider_breaker, CircuitOpenError
+from .response_cache import response_cache
+from .request_hedging import RequestHedger
+from .model_routing import ModelRouter
+from .prompt_cache import prompt_cache, CachedPrefix
+from .request_deadline import deadline_policy, DeadlineSkipped, DeadlineExceeded
+from .usage_tracker import usage_tracker, estimate_tokens
+from .tracing import tracer, OUTCOME_SKIPPED
+from ..utils.prompt_budget import prompt_budget
+from ..utils.prompt_templates import format_context
+from .stream_flush import FlushPolicy, StreamBuffer, StreamMetrics
+from .stream_delivery import stream_delivery
+from .single_flight import (
+    SingleFlight,
+    Flight,
+    EVENT_START,
+    EVENT_CHUNK,
+    EVENT_ERROR,
+    EVENT_COMPLETE,
+    EVENT_FAILED
+)
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -41,111 +69,184 @@ class AIService:
         return cls._instance
     
     def __init__(self):
-        """Initialize the AI service with Gemini."""
+        """Initialize the AI service with the configured LLM provider."""
         if self._initialized:
             return
         
-        # Get API key from environment variables
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables!")
-        
-        # Configure Gemini
-        genai.configure(api_key=self.api_key)
-        
-        # Initialize the model
-        # Using gemini-2.5-flash for latest capabilities and performance
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        # Pluggable backend: Gemini by default, LLM_PROVIDER=fake for offline load tests
+        self.provider: LLMProvider = create_provider_from_env()
         
-        # Generation config for consistent responses
-        self.generation_config = GenerationConfig(
-            temperature=0.7,      # Creativity level (0.0 = deterministic, 1.0 = creative)
-            top_p=0.95,           # Nucleus sampling
-            top_k=40,             # Top-k sampling
-            max_output_tokens=8192,  # Maximum response length
-        )
-        
-        # Safety settings - prevent harmful content
-        self.safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-        ]
+        # Model, temperature, output cap and timeout per call type
+        self.router = ModelRouter.from_env()
         
-        # Rate limiting configuration
-        self.requests_per_minute = 15  # Conservative limit for free tier
-        self.request_timestamps = deque()  # Track request times
-        self.min_request_interval = 4.0  # Minimum 4 seconds between requests
-        self.last_request_time = 0
+        # Rate limiting is handled per tenant by rate_limiter (see rate_limiter.py)
         self.retry_delays = [1, 2, 4, 8, 16]  # Exponential backoff delays
         
         # Streaming configuration (streaming is now the only mode)
-        self.token_buffer_size = 3  # Buffer 3 tokens for smoother streaming
-        self.streaming_delay = 0.05  # 50ms delay between token chunks for premium feel
+        self.flush_policy = FlushPolicy.from_env()  # Flush by size or frame time, no artificial delay
+        self.recent_stream_metrics: deque = deque(maxlen=200)
+        self.streams_aborted = 0  # Provider streams closed early because their request was cancelled
+        
+        # Identical in-flight calls of one conversation share one generation; a waiter whose
+        # queued call was cancelled hands the generation to the next waiter
+        self.single_flight = SingleFlight(reelect_on=(LLMCallCancelled,))
+        
+        # Slow-starting calls can race a second identical request (LLM_HEDGE_CALL_TYPES)
+        self.hedger = RequestHedger.from_env()
         
         self._initialized = True
-        print(" AI Service initialized with Gemini 2.5 Flash + Streaming-Only Mode")
+        print(f" AI Service initialized with {self.provider.name} provider ({self.provider.model_name}) + Streaming-Only Mode")
     
     
-    async def _check_rate_limit(self):
-        """Check and enforce rate limiting before making API calls."""
-        current_time = time.time()
+    async def _check_rate_limit(self, call_type: LLMCallType = LLMCallType.CHAT) -> float:
+        """
+        Wait for this tenant's rate limit before making an API call.
         
-        # Remove timestamps older than 1 minute
-        while self.request_timestamps and current_time - self.request_timestamps[0] > 60:
-            self.request_timestamps.popleft()
+        Returns:
+            Seconds this call spent queued behind the rate limiter
+        """
+        call_context = get_call_context()
+        wait_time = await rate_limiter.acquire(
+            call_context.tenant_key,
+            rate_limiter.priority_for(call_type)
+        )
+        call_context.rate_limit_wait += wait_time
+        
+        if wait_time >= 1.0:
+            print(f" Rate limited {call_type.value} call for {call_context.tenant_key}: waited {wait_time:.1f} seconds")
         
-        # Check if we've exceeded requests per minute
-        if len(self.request_timestamps) >= self.requests_per_minute:
-            wait_time = 60 - (current_time - self.request_timestamps[0])
-            print(f" Rate limit reached. Waiting {wait_time:.1f} seconds...")
-            await asyncio.sleep(wait_time)
-            return await self._check_rate_limit()  # Recheck after waiting
+        return wait_time
+    
+    
+    @staticmethod
+    def _classify_error(error: Exception) -> Optional[str]:
+        """
+        What kind of provider trouble an error signals.
         
-        # Check minimum interval between requests
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_request_interval:
-            wait_time = self.min_request_interval - time_since_last
-            print(f" Enforcing minimum interval. Waiting {wait_time:.1f} seconds...")
-            await asyncio.sleep(wait_time)
+        Returns:
+            "rate_limit", "timeout", "unavailable", or None when the request
+            itself was the problem (bad prompt, safety block, ...)
+        """
+        if isinstance(error, asyncio.TimeoutError):
+            return "timeout"
         
-        # Record this request
-        self.request_timestamps.append(time.time())
-        self.last_request_time = time.time()
+        error_str = str(error).lower()
+        if "429" in error_str or "quota" in error_str or "rate limit" in error_str or "exhausted" in error_str:
+            return "rate_limit"
+        if "timeout" in error_str or "timed out" in error_str or "deadline" in error_str or re.search(r"\b504\b", error_str):
+            return "timeout"
+        if re.search(r"\b(500|502|503)\b", error_str) or "unavailable" in error_str or "internal error" in error_str:
+            return "unavailable"
+        return None
     
     
     async def _handle_api_error(self, error: Exception, retry_count: int = 0):
-        """Handle API errors with exponential backoff retry logic."""
-        error_str = str(error).lower()
+        """
+        Feed a failed call into the shared concurrency limit and circuit breaker,
+        then decide whether to retry.
         
-        # Check if it's a rate limit error
-        if "429" in error_str or "quota" in error_str or "rate limit" in error_str:
-            if retry_count < len(self.retry_delays):
-                delay = self.retry_delays[retry_count]
-                print(f" Rate limit hit. Retrying in {delay} seconds... (attempt {retry_count + 1})")
-                await asyncio.sleep(delay)
-                return True  # Indicate retry should happen
-            else:
-                print(" Max retries exceeded for rate limit. Giving up.")
-                raise Exception("Rate limit exceeded. Please try again later.")
+        Rate limits and timeouts cut the adaptive concurrency limit. Every
+        provider-side failure counts towards the circuit breaker and is retried
+        with jittered exponential backoff; other errors are raised as-is.
+        """
+        kind = self._classify_error(error)
+        if kind is None:
+            # The provider answered - this request was the problem
+            provider_breaker.record_success()
+            raise error
+        
+        if kind in ("rate_limit", "timeout"):
+            llm_scheduler.on_overload(kind)
+        provider_breaker.record_failure(kind)
+        
+        # Don't keep retrying into an open circuit
+        if provider_breaker.retry_after() > 0:
+            raise CircuitOpenError(provider_breaker.retry_after())
+        
+        if retry_count < len(self.retry_delays):
+            # Full backoff with jitter so retries from many agents don't line up
+            delay = self.retry_delays[retry_count] * random.uniform(0.5, 1.0)
+            print(f" Provider {kind.replace('_', ' ')}. Retrying in {delay:.1f} seconds... (attempt {retry_count + 1})")
+            await asyncio.sleep(delay)
+            return True  # Indicate retry should happen
         
-        # For other errors, don't retry
-        raise error
+        print(f" Max retries exceeded ({kind}). Giving up.")
+        if kind == "rate_limit":
+            raise Exception("Rate limit exceeded. Please try again later.")
+        raise Exception(f"AI provider {kind.replace('_', ' ')} persisted after {retry_count} retries: {error}")
     
     
+    def set_provider(self, provider: LLMProvider):
+        """Swap the LLM backend (e.g. a FakeProvider in load tests)."""
+        self.provider = provider
+        print(f" AI Service now using {provider.name} provider ({provider.model_name})")
+    
+    
+    async def stream_response(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        context: Optional[List[Dict[str, str]]] = None,
+        temperature: Optional[float] = None,
+        call_type: Optional[LLMCallType] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        cached_prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream raw text chunks from the configured provider as an async iterator.
+        
+        Waiting for the next chunk yields to the event loop, so many
+        generations can be in flight at once without stalling other requests.
+        
+        Args:
+            prompt: The user's message or instruction
+            system_instruction: Instructions for how the AI should behave
+            context: Previous conversation history
+            temperature: Override default temperature
+            call_type: What this call is for (lets fake providers pick a response shape)
+            usage: Filled with provider-reported token counts, when available
+            model: Concrete model name (None = provider default)
+            max_output_tokens: Output cap (None = provider default)
+            timeout: Seconds the whole stream may take (raises asyncio.TimeoutError)
+            cached_prefix: Provider handle holding the system instruction (see prompt_cache.py)
+        
+        Yields:
+            Text chunks in the order the provider produces them
+        """
+        stream = self.provider.stream(
+            prompt,
+            system_instruction=system_instruction,
+            context=context,
+            temperature=temperature,
+            call_type=call_type,
+            usage=usage,
+            model=model,
+            max_output_tokens=max_output_tokens,
+            cached_prefix=cached_prefix
+        )
+        if not timeout:
+            async for chunk_text in stream:
+                yield chunk_text
+            return
+        
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"LLM call timed out after {timeout:g}s")
+                try:
+                    chunk_text = await asyncio.wait_for(stream.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise asyncio.TimeoutError(f"LLM call timed out after {timeout:g}s")
+                yield chunk_text
+        finally:
+            await stream.aclose()
     
     
     async def generate_response(
@@ -155,12 +256,26 @@ class AIService:
         context: Optional[List[Dict[str, str]]] = None,
         temperature: Optional[float] = None,
         websocket_callback=None,
-        conversation_id: Optional[str] = None
+        conversation_id: Optional[str] = None,
+        call_type: LLMCallType = LLMCallType.CHAT,
+        paced: bool = True,
+        model: Optional[str] = None,
+        stream_tag: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Generate a streaming response from Gemini with real-time token delivery.
         This is now the primary and only response generation method.
         
+        Identical calls of the same conversation and tenant that are already
+        in flight are coalesced: they share one generation, and each caller
+        still receives its own websocket_callback events.
+        
+        The call type's route (see model_routing.py) picks the model, the
+        default temperature, the output cap and the timeout.
+        If the request has a deadline (see request_deadline.py), narration
+        may be skipped (DeadlineSkipped), the fast model used and the
+        timeout capped by the time left.
+        
         Args:
             prompt: The user's message or instruction
             system_instruction: Instructions for how the AI should behave
@@ -168,6 +283,10 @@ class AIService:
             temperature: Override default temperature
             websocket_callback: Function to call for each token chunk (required for streaming)
             conversation_id: ID for WebSocket routing (required for streaming)
+            call_type: What this call is for (drives rate limit and scheduling priority)
+            paced: False for machine consumers - never apply the pacing delay
+            model: Override the route's model ("default", "fast" or a model name)
+            stream_tag: Extra fields for every stream frame (e.g. which coding step it belongs to)
         
         Returns:
             The complete AI response as a string
@@ -175,133 +294,380 @@ class AIService:
         if not websocket_callback:
             raise Exception("WebSocket callback is required for streaming responses")
         
+        # One span per call (llm.narration, llm.coding, ...) under the stage that made it
+        with tracer.span(f"llm.{call_type.value}", call_type=call_type.value) as span:
+            # Requests with a deadline drop narration and move to faster models when time runs short
+            if call_type == LLMCallType.NARRATION and deadline_policy.skip_narration():
+                span.set_outcome(OUTCOME_SKIPPED, "request deadline")
+                raise DeadlineSkipped("Narration skipped to meet the request deadline")
+            
+            route = self.router.route(call_type)
+            model_name = self.provider.resolve_model(model or deadline_policy.cascade(call_type, [route.model])[0])
+            if temperature is None:
+                temperature = route.temperature
+            span.set(model=model_name)
+            
+            # Only retries and tabs of one conversation share a generation (scheduler owner, budget and usage are per conversation)
+            call_context = get_call_context()
+            flight_key = self.single_flight.make_key(
+                call_context.tenant_key, call_context.conversation_id,
+                model_name, system_instruction, prompt, context, temperature, call_type.value
+            )
+            
+            async def producer(flight: Flight):
+                # Runs in the flight's task; charge this waiter's request if it ends up leading
+                token = set_call_context(call_context)
+                try:
+                    await self._produce_stream(
+                        flight,
+                        prompt=prompt,
+                        system_instruction=system_instruction,
+                        context=context,
+                        temperature=temperature,
+                        call_type=call_type,
+                        model_name=model_name,
+                        max_output_tokens=route.max_output_tokens,
+                        timeout=route.timeout
+                    )
+                finally:
+                    reset_call_context(token)
+            
+            flight, events = self.single_flight.join(flight_key, producer)
+            if len(flight.subscribers) > 1:
+                span.set(shared_generation=True)  # Tokens and waits are on the span that started it
+            try:
+                return await self._deliver_stream(events, websocket_callback, conversation_id, call_type, paced, stream_tag)
+            finally:
+                flight.unsubscribe(events)
+                if not flight.subscribers and flight.task is not None and not flight.task.done():
+                    # We were the last waiter of an unfinished generation (e.g. the request was
+                    # cancelled): let it close the provider stream and record its usage first
+                    await asyncio.wait({flight.task}, timeout=5.0)
+    
+    
+    async def _produce_stream(
+        self,
+        flight: Flight,
+        prompt: str,
+        system_instruction: Optional[str],
+        context: Optional[List[Dict[str, str]]],
+        temperature: Optional[float],
+        call_type: LLMCallType,
+        model_name: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        """
+        Run one generation (with retries) and publish its events to every waiter.
+        Each attempt's timeout is `timeout` capped by the request's time left.
+        """
+        model_name = model_name or self.provider.model_name
         retry_count = 0
         max_retries = len(self.retry_delays)
+        cache_retried = False
+        admitted = False  # Let through by the breaker without a verdict yet (e.g. as the half-open probe)
         
         while retry_count <= max_retries:
+            cached_prefix: Optional[CachedPrefix] = None
+            call_timeout = deadline_policy.call_timeout(timeout) if timeout else timeout
             try:
+                # Fail fast while the provider is unhealthy (shared by every agent);
+                # a retry without a recorded verdict keeps its admission
+                if not admitted:
+                    provider_breaker.before_call()
+                    admitted = True
+                
+                # Large static system instructions are stored once on the provider side
+                cached_prefix = await prompt_cache.get_prefix(self.provider, model_name, system_instruction)
+                
                 # Check rate limits before making request
-                await self._check_rate_limit()
+                queue_wait = await self._check_rate_limit(call_type)
                 
-                # Build the full conversation history
-                chat_history = []
+                # Wait for a scheduler slot (bounded concurrency, priority ordered)
+                call_context = get_call_context()
+                async with llm_scheduler.slot(call_type, owner_id=call_context.conversation_id) as slot_wait:
+                    call_context.scheduler_wait += slot_wait
+                    queue_wait += slot_wait
+                    tracer.add(queue_wait_seconds=queue_wait, llm_queue_wait_seconds=queue_wait)
+                    
+                    flight.publish(EVENT_START, queue_wait)
+                    
+                    response_parts: List[str] = []
+                    usage: Dict[str, int] = {}
+                    started = time.perf_counter()
+                    first_token_latency = None
+                    
+                    def start_request(attempt_usage: Dict[str, int]) -> AsyncIterator[str]:
+                        return self.stream_response(
+                            prompt=prompt,
+                            system_instruction=system_instruction,
+                            context=context,
+                            temperature=temperature,
+                            call_type=call_type,
+                            usage=attempt_usage,
+                            model=model_name,
+                            max_output_tokens=max_output_tokens,
+                            timeout=call_timeout,
+                            cached_prefix=cached_prefix.name if cached_prefix else None
+                        )
+                    
+                    def record_abandoned(attempt_usage: Dict[str, int], attempt_started: float):
+                        # The losing request of a hedge still cost its prompt tokens
+                        self._record_usage(call_type, model_name, prompt, system_instruction, context, "",
+                                           attempt_usage, attempt_started, None, call_context, success=False)
+                    
+                    try:
+                        async for chunk_text in self.hedger.stream(
+                            call_type,
+                            start_request,
+                            usage,
+                            can_hedge=lambda: rate_limiter.try_acquire(call_context.tenant_key),
+                            on_abandoned=record_abandoned,
+                            acquire_slot=llm_scheduler.try_acquire,  # A hedge is one more provider call
+                            release_slot=llm_scheduler.release
+                        ):
+                            if first_token_latency is None:
+                                first_token_latency = time.perf_counter() - started
+                            response_parts.append(chunk_text)
+                            flight.publish(EVENT_CHUNK, chunk_text)
+                    except (Exception, asyncio.CancelledError) as e:
+                        partial_response = "".join(response_parts)
+                        self._record_usage(call_type, model_name, prompt, system_instruction, context, partial_response,
+                                           usage, started, first_token_latency, call_context, success=False)
+                        if isinstance(e, asyncio.CancelledError):
+                            # Every waiter went away (request cancelled): the provider stream is closed here
+                            self.streams_aborted += 1
+                            call_context.aborted_calls += 1
+                            call_context.discarded_tokens += usage.get("completion_tokens") or estimate_tokens(partial_response)
+                        raise
+                    
+                    full_response = "".join(response_parts)
+                    self._record_usage(call_type, model_name, prompt, system_instruction, context, full_response,
+                                       usage, started, first_token_latency, call_context)
+                    call_context.completed_calls += 1
+                    provider_breaker.record_success()
+                    llm_scheduler.on_success()
+                    flight.publish(EVENT_COMPLETE, full_response)
+                    return
+            
+            except LLMCallCancelled:
+                # The owning conversation went away while we were queued
+                provider_breaker.release_probe()
+                raise
+            
+            except asyncio.CancelledError:
+                provider_breaker.release_probe()
+                raise
+            
+            except CircuitOpenError as e:
+                print(f" {e}")
+                flight.publish(EVENT_ERROR, str(e))
+                raise
+            
+            except Exception as e:
+                print(f" Error in streaming generation: {str(e)}")
                 
-                if context:
-                    # Convert context to Gemini's format
-                    for msg in context:
-                        role = "user" if msg["role"] == "user" else "model"
-                        chat_history.append({
-                            "role": role,
-                            "parts": [msg["content"]]
-                        })
+                # Send error notification
+                flight.publish(EVENT_ERROR, str(e))
                 
-                # Override temperature if provided
-                if temperature is not None:
-                    config = GenerationConfig(
-                        temperature=temperature,
-                        top_p=self.generation_config.top_p,
-                        top_k=self.generation_config.top_k,
-                        max_output_tokens=self.generation_config.max_output_tokens,
-                    )
-                else:
-                    config = self.generation_config
+                if isinstance(e, asyncio.TimeoutError) and call_timeout and deadline_policy.deadline_hit(call_timeout, timeout):
+                    # This request ran out of time, the provider didn't: no retry, breaker verdict or concurrency cut
+                    provider_breaker.release_probe()
+                    raise DeadlineExceeded(f"Request deadline reached after {call_timeout:g}s of a {call_type.value} call") from e
                 
-                # Combine system instruction with prompt if provided
-                full_prompt = prompt
-                if system_instruction:
-                    full_prompt = f"{system_instruction}\n\nUser: {prompt}\n\nAssistant:"
+                if cached_prefix is not None and "cached content" in str(e).lower():
+                    # The provider dropped our prefix: forget it and retry once (a new one is
+                    # created) under the same breaker admission - a half-open probe stays the probe
+                    prompt_cache.invalidate(cached_prefix)
+                    if not cache_retried:
+                        cache_retried = True
+                        continue
+                
+                # Try to handle the error and determine if we should retry (records a verdict)
+                admitted = False
+                should_retry = await self._handle_api_error(e, retry_count)
+                if should_retry and retry_count < max_retries:
+                    retry_count += 1
+                    continue
+                else:
+                    raise Exception(f"Streaming generation failed after {retry_count} retries: {str(e)}")
+        
+        raise Exception("Max retries exceeded")
+    
+    
+    def _record_usage(
+        self,
+        call_type: LLMCallType,
+        model_name: str,
+        prompt: str,
+        system_instruction: Optional[str],
+        context: Optional[List[Dict[str, str]]],
+        response_text: str,
+        usage: Dict[str, int],
+        started: float,
+        first_token_latency: Optional[float],
+        call_context,
+        success: bool = True
+    ):
+        """Hand one attempt's token counts and latency to the usage tracker."""
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = (
+                estimate_tokens(system_instruction)
+                + estimate_tokens(prompt)
+                + sum(estimate_tokens(msg.get("content")) for msg in context or [])
+            )
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(response_text)
+        
+        tracer.add(llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        usage_tracker.record(
+            call_type=call_type,
+            model=model_name,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency=time.perf_counter() - started,
+            first_token_latency=first_token_latency,
+            call_context=call_context,
+            success=success,
+            cached_tokens=usage.get("cached_tokens", 0)
+        )
+    
+    
+    async def _deliver_stream(
+        self,
+        events: asyncio.Queue,
+        websocket_callback,
+        conversation_id: Optional[str],
+        call_type: LLMCallType = LLMCallType.CHAT,
+        paced: bool = True,
+        stream_tag: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Turn flight events into this caller's WebSocket stream events.
+        
+        Every frame carries this call's stream_id (and the stream_tag
+        fields), so clients can tell apart streams of one conversation
+        that run at the same time (e.g. parallel coding steps).
+        
+        Buffered text is flushed by size or frame time (see FlushPolicy);
+        a frame timer also flushes when the model pauses mid-stream.
+        Frames are handed to stream_delivery and sent by its own task, so a
+        slow client never holds up reading the provider stream (pending
+        tokens are coalesced instead) and the full response is returned as
+        soon as the model finishes.
+        
+        Returns:
+            The complete AI response as a string
+        """
+        policy = self.flush_policy
+        token_buffer = StreamBuffer()
+        metrics = StreamMetrics()
+        last_flush = time.perf_counter()
+        pace = policy.pacing_delay if paced else 0.0
+        request_id = get_call_context().request_id
+        stream_id = uuid.uuid4().hex[:12]
+        
+        def send(frame: Dict[str, Any]):
+            frame["stream_id"] = stream_id
+            if stream_tag:
+                frame.update(stream_tag)
+            if request_id:
+                frame["request_id"] = request_id  # Frames are sent from the delivery task, outside this request
+            stream_delivery.put(websocket_callback, conversation_id, frame, pace, request_id=request_id)
+        
+        def flush():
+            nonlocal last_flush
+            send({
+                "type": "stream_token",
+                "content": token_buffer.take(),
+                "conversation_id": conversation_id
+            })
+            metrics.on_flush()
+            last_flush = time.perf_counter()
+        
+        while True:
+            if token_buffer:
+                # Wake up at the end of the current frame even if no chunk arrives
+                remaining = policy.frame_interval - (time.perf_counter() - last_flush)
+                try:
+                    event_type, payload = await asyncio.wait_for(events.get(), timeout=max(remaining, 0.0))
+                except asyncio.TimeoutError:
+                    flush()
+                    continue
+            else:
+                event_type, payload = await events.get()
+            
+            if event_type == EVENT_START:
+                if metrics.chunks:
+                    metrics.restart()  # Retry after a failed attempt
+                token_buffer.take()
                 
                 # Send stream start notification
-                await websocket_callback({
+                send({
                     "type": "stream_start",
-                    "conversation_id": conversation_id
+                    "conversation_id": conversation_id,
+                    "queue_wait": payload
                 })
+            
+            elif event_type == EVENT_CHUNK:
+                metrics.on_chunk(payload)
+                token_buffer.append(payload)
                 
-                # Create streaming response
-                if chat_history:
-                    chat = self.model.start_chat(history=chat_history)
-                    response_stream = chat.send_message(
-                        full_prompt,
-                        generation_config=config,
-                        safety_settings=self.safety_settings,
-                        stream=True
-                    )
-                else:
-                    response_stream = self.model.generate_content(
-                        full_prompt,
-                        generation_config=config,
-                        safety_settings=self.safety_settings,
-                        stream=True
-                    )
-                
-                # Process streaming tokens with intelligent buffering
-                full_response = ""
-                token_buffer = ""
-                
-                for chunk in response_stream:
-                    # Handle complex response format from Gemini
-                    chunk_text = ""
-                    if hasattr(chunk, 'text') and chunk.text:
-                        chunk_text = chunk.text
-                    elif hasattr(chunk, 'parts') and chunk.parts:
-                        # Extract text from parts for complex responses
-                        for part in chunk.parts:
-                            if hasattr(part, 'text') and part.text:
-                                chunk_text += part.text
-                    
-                    if chunk_text:
-                        token_buffer += chunk_text
-                        full_response += chunk_text
-                        
-                        # Send buffered tokens for smoother streaming
-                        if len(token_buffer.split()) >= self.token_buffer_size:
-                            await websocket_callback({
-                                "type": "stream_token",
-                                "content": token_buffer,
-                                "conversation_id": conversation_id
-                            })
-                            token_buffer = ""
-                            
-                            # Premium streaming delay
-                            await asyncio.sleep(self.streaming_delay)
-                
+                # The first chunk goes out immediately so the client sees the stream start
+                if not metrics.flushes or policy.should_flush(token_buffer.byte_count, time.perf_counter() - last_flush):
+                    flush()
+            
+            elif event_type == EVENT_ERROR:
+                # Send error notification
+                send({
+                    "type": "stream_error",
+                    "error": payload,
+                    "conversation_id": conversation_id
+                })
+            
+            elif event_type == EVENT_COMPLETE:
                 # Send any remaining tokens
                 if token_buffer:
-                    await websocket_callback({
-                        "type": "stream_token", 
-                        "content": token_buffer,
-                        "conversation_id": conversation_id
-                    })
+                    flush()
+                
+                stream_metrics = metrics.to_dict()
+                self.recent_stream_metrics.append({"call_type": call_type.value, **stream_metrics})
                 
                 # Send stream completion notification
-                await websocket_callback({
+                send({
                     "type": "stream_complete",
                     "conversation_id": conversation_id,
-                    "full_response": full_response
+                    "full_response": payload,
+                    "metrics": stream_metrics
                 })
                 
-                return full_response
+                return payload
             
-            except Exception as e:
-                print(f" Error in streaming generation: {str(e)}")
-                
-                # Send error notification
-                if websocket_callback:
-                    await websocket_callback({
-                        "type": "stream_error",
-                        "error": str(e),
-                        "conversation_id": conversation_id
-                    })
-                
-                # Try to handle the error and determine if we should retry
-                should_retry = await self._handle_api_error(e, retry_count)
-                if should_retry and retry_count < max_retries:
-                    retry_count += 1
-                    continue
-                else:
-                    raise Exception(f"Streaming generation failed after {retry_count} retries: {str(e)}")
-        
-        raise Exception("Max retries exceeded")
+            elif event_type == EVENT_FAILED:
+                raise payload
+    
+    
+    def _stream_metrics_summary(self) -> Dict[str, Any]:
+        """Average time to first token and inter-chunk gaps over recent streams, per call type."""
+        summary: Dict[str, Dict[str, Any]] = {}
+        for entry in self.recent_stream_metrics:
+            stats = summary.setdefault(entry["call_type"], {"streams": 0, "ttft": [], "p95_gap": [], "max_gap": 0.0})
+            stats["streams"] += 1
+            if entry["time_to_first_token"] is not None:
+                stats["ttft"].append(entry["time_to_first_token"])
+            stats["p95_gap"].append(entry["p95_gap"])
+            stats["max_gap"] = max(stats["max_gap"], entry["max_gap"])
+        return {
+            call_type: {
+                "streams": stats["streams"],
+                "avg_time_to_first_token": sum(stats["ttft"]) / len(stats["ttft"]) if stats["ttft"] else None,
+                "avg_p95_gap": sum(stats["p95_gap"]) / len(stats["p95_gap"]) if stats["p95_gap"] else 0.0,
+                "max_gap": stats["max_gap"],
+            }
+            for call_type, stats in summary.items()
+        }
     
     
     async def generate_structured_response(
@@ -310,57 +676,125 @@ class AIService:
         system_instruction: str,
         websocket_callback,
         conversation_id: str,
-        response_format: str = "json"
+        response_format: str = "json",
+        call_type: LLMCallType = LLMCallType.CHAT
     ) -> Dict[str, Any]:
         """
         Generate a structured response (like JSON) from Gemini with streaming.
         Useful for getting data in a specific format.
         
+        Call types with a cascade route try the cheap model first and are
+        repeated on the stronger model if the JSON is invalid or the result's
+        confidence is too low.
+        
         Args:
             prompt: The instruction/question
             system_instruction: How the AI should respond
             websocket_callback: Function to call for each token chunk
             conversation_id: ID for WebSocket routing
             response_format: Expected format (default: json)
+            call_type: What this call is for (drives rate limit and scheduling priority)
         
         Returns:
             Parsed dictionary/object
         """
-        response_text = ""
-        try:
-            # Add format instruction to system prompt
-            full_system = f"{system_instruction}\n\nIMPORTANT: Respond ONLY with valid {response_format.upper()}. No markdown, no explanations, just the {response_format.upper()} object."
-            
-            response_text = await self.generate_response(
-                prompt=prompt,
-                system_instruction=full_system,
-                temperature=0.3,  # Lower temperature for more consistent formatting
-                websocket_callback=websocket_callback,
-                conversation_id=conversation_id
-            )
+        route = self.router.route(call_type)
+        cascade = deadline_policy.cascade(call_type, route.cascade())
+        
+        # Add format instruction to system prompt
+        full_system = f"{system_instruction}\n\nIMPORTANT: Respond ONLY with valid {response_format.upper()}. No markdown, no explanations, just the {response_format.upper()} object."
+        
+        # Exact-match cache: a hit skips the round trip and the rate limiter entirely.
+        # Results are keyed by the whole cascade that produced them (an escalated answer is
+        # the cascade's answer, not the cheap model's); a deadline-degraded call also accepts
+        # what the full route produced, but only stores under its own, shorter cascade
+        def cascade_key(models: List[str]) -> str:
+            resolved = ">".join(self.provider.resolve_model(model) for model in models)
+            return response_cache.make_key(resolved, full_system, prompt, route.temperature)
+        
+        cache_key = cascade_key(cascade)
+        lookup_keys = [cascade_key(route.cascade()), cache_key] if cascade != route.cascade() else [cache_key]
+        for lookup_key in lookup_keys:
+            cached = response_cache.get(lookup_key)
+            if cached is not None:
+                print(f" Response cache hit for {call_type.value} call")
+                tracer.add(response_cache_hits=1)
+                return cached
+        
+        if len(cascade) > 1:
+            self.router.record_cascade(call_type)
+        
+        # Cheapest model first; escalate on invalid JSON or low confidence
+        for index, model in enumerate(cascade):
+            is_last = index == len(cascade) - 1
+            response_text = ""
+            try:
+                response_text = await self.generate_response(
+                    prompt=prompt,
+                    system_instruction=full_system,
+                    websocket_callback=websocket_callback,
+                    conversation_id=conversation_id,
+                    call_type=call_type,
+                    paced=False,
+                    model=model
+                )
+                
+                # Clean the response (remove markdown code blocks if present)
+                cleaned = response_text.strip()
+                if cleaned.startswith("```json"):
+                    cleaned = cleaned[7:]  # Remove ```json
+                if cleaned.startswith("```"):
+                    cleaned = cleaned[3:]   # Remove ```
+                if cleaned.endswith("```"):
+                    cleaned = cleaned[:-3]  # Remove trailing ```
+                cleaned = cleaned.strip()
+                
+                # Parse JSON
+                if response_format == "json":
+                    result = json.loads(cleaned)
+                else:
+                    result = {"text": cleaned}
             
-            # Clean the response (remove markdown code blocks if present)
-            cleaned = response_text.strip()
-            if cleaned.startswith("```json"):
-                cleaned = cleaned[7:]  # Remove ```json
-            if cleaned.startswith("```"):
-                cleaned = cleaned[3:]   # Remove ```
-            if cleaned.endswith("```"):
-                cleaned = cleaned[:-3]  # Remove trailing ```
-            cleaned = cleaned.strip()
+            except json.JSONDecodeError as e:
+                print(f" Failed to parse JSON response: {response_text}")
+                if is_last:
+                    raise Exception(f"AI returned invalid JSON: {str(e)}")
+                self.router.record_cascade(call_type, "invalid_json")
+                print(f" Escalating {call_type.value} call to {cascade[index + 1]} model (invalid JSON)")
+                continue
+            except Exception as e:
+                print(f" Error in structured generation: {str(e)}")
+                raise
             
-            # Parse JSON
-            if response_format == "json":
-                return json.loads(cleaned)
+            reason = None if is_last else self.router.escalation_reason(route, result)
+            if reason:
+                self.router.record_cascade(call_type, reason)
+                print(f" Escalating {call_type.value} call to {cascade[index + 1]} model ({reason})")
+                continue
             
-            return {"text": cleaned}
-        
-        except json.JSONDecodeError as e:
-            print(f" Failed to parse JSON response: {response_text}")
-            raise Exception(f"AI returned invalid JSON: {str(e)}")
-        except Exception as e:
-            print(f" Error in structured generation: {str(e)}")
-            raise
+            response_cache.set(cache_key, result, call_type=call_type.value)
+            return result
+    
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get AI service statistics (shown in /health)."""
+        return {
+            "provider": self.provider.name,
+            "model": self.provider.model_name,
+            "provider_stats": self.provider.get_stats(),
+            "flush_policy": {
+                "max_bytes": self.flush_policy.max_bytes,
+                "frame_interval": self.flush_policy.frame_interval,
+                "pacing_delay": self.flush_policy.pacing_delay,
+            },
+            "streams": self._stream_metrics_summary(),
+            "streams_aborted": self.streams_aborted,
+            "delivery": stream_delivery.get_stats(),
+            "routing": self.router.get_stats(),
+            "prompt_cache": prompt_cache.get_stats(),
+            "coalescing": self.single_flight.get_stats(),
+            "hedging": self.hedger.get_stats()
+        }
     
     
     async def classify_intent(
@@ -411,7 +845,8 @@ Return a JSON object with this exact structure:
             prompt=prompt,
             system_instruction=system_instruction,
             websocket_callback=_noop_websocket_callback,
-            conversation_id="intent_classifier"
+            conversation_id="intent_classifier",
+            call_type=LLMCallType.INTENT
         )
     
     
@@ -444,8 +879,8 @@ Return a JSON object with this exact structure:
 Create detailed, step-by-step execution plans for Flutter widget generation.
 Each step should be clear, actionable, and include necessary code snippets."""
 
-        # Build context string
-        context_str = json.dumps(project_context, indent=2)
+        # Build context string (ranked and cut to the planning budget)
+        context_str = format_context(project_context, prompt_budget(LLMCallType.PLAN) - estimate_tokens(user_request) - 300)
         
         prompt = f"""Create an execution plan for this request:
 
@@ -480,7 +915,8 @@ Generate a detailed plan as JSON with this structure:
             prompt=prompt,
             system_instruction=system_instruction,
             websocket_callback=_noop_websocket_callback,
-            conversation_id="plan_generator"
+            conversation_id="plan_generator",
+            call_type=LLMCallType.PLAN
         )
     
     
@@ -511,7 +947,8 @@ Return ONLY the complete Dart code, no explanations or markdown."""
         return await self.generate_response(
             prompt=prompt,
             system_instruction=system_instruction,
-            temperature=0.5  # Balanced creativity for code
+            temperature=0.5,  # Balanced creativity for code
+            call_type=LLMCallType.CODE
         )
     
     
@@ -557,7 +994,8 @@ Return JSON:
             prompt=prompt,
             system_instruction=system_instruction,
             websocket_callback=_noop_websocket_callback,
-            conversation_id="error_analyzer"
+            conversation_id="error_analyzer",
+            call_type=LLMCallType.ERROR_ANALYSIS
         )
     
     
@@ -584,7 +1022,7 @@ CRITICAL RULES:
 - Be conversational and helpful"""
 
         # Add project context to prompt
-        context_str = json.dumps(project_context, indent=2) if project_context else "No project context available"
+        context_str = format_context(project_context, prompt_budget(LLMCallType.CHAT) // 2 - estimate_tokens(message))
         
         full_prompt = f"""Project Context:
 {context_str}
@@ -596,7 +1034,8 @@ Provide a helpful response without including any code."""
         return await self.generate_response(
             prompt=full_prompt,
             system_instruction=system_instruction,
-            context=conversation_history
+            context=conversation_history,
+            call_type=LLMCallType.CHAT
         )
 
 
@@ -0,0 +1,84 @@
+"""
+LLM Call Context
+================
+Carries "who is this call for?" information from the Agent Coordinator down
+to the AI service without threading extra arguments through every agent.
+
+The coordinator sets the context once per request; every LLM call made while
+handling that request (intent, planning, coding, narration...) can read it.
+Each asyncio task gets its own copy, so concurrent requests never mix.
+
+SERVER SIDE FILE
+"""
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+
+@dataclass
+class LLMCallContext:
+    """
+    Per-request information shared by all LLM calls made for that request.
+    """
+    conversation_id: Optional[str] = None
+    project_id: Optional[str] = None
+    user_id: Optional[int] = None
+    request_id: Optional[str] = None
+    rate_limit_wait: float = 0.0  # Total seconds this request spent throttled
+    scheduler_wait: float = 0.0   # Total seconds this request waited for an LLM slot
+    completed_calls: int = 0      # LLM streams that finished for this request
+    aborted_calls: int = 0        # LLM streams cut off because the request was cancelled
+    discarded_tokens: int = 0     # Completion tokens generated by aborted streams
+    deadline: Optional[float] = None  # time.monotonic() by which the request should be answered
+    degradations: Dict[str, int] = field(default_factory=dict)  # What was cut to meet the deadline
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None if the request has none)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def degrade(self, what: str, count: int = 1):
+        """Record a shortcut taken to meet the deadline."""
+        self.degradations[what] = self.degradations.get(what, 0) + count
+
+    @property
+    def tenant_key(self) -> str:
+        """Key used to give each user/project its own rate limit bucket."""
+        user = self.user_id if self.user_id is not None else "anonymous"
+        scope = self.project_id or self.conversation_id or "default"
+        return f"{user}:{scope}"
+
+
+_current_call_context: ContextVar[Optional[LLMCallContext]] = ContextVar(
+    "llm_call_context", default=None
+)
+
+
+def set_call_context(call_context: LLMCallContext):
+    """Attach a call context to the current task. Returns a token for reset_call_context."""
+    return _current_call_context.set(call_context)
+
+
+def reset_call_context(token):
+    """Restore the call context that was active before set_call_context."""
+    _current_call_context.reset(token)
+
+
+def get_call_context() -> LLMCallContext:
+    """Get the current call context (an anonymous one if none was set)."""
+    call_context = _current_call_context.get()
+    if call_context is None:
+        call_context = LLMCallContext()
+        _current_call_context.set(call_context)
+    return call_context
+
+
+__all__ = [
+    'LLMCallContext',
+    'set_call_context',
+    'reset_call_context',
+    'get_call_context'
+]
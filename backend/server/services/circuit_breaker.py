@@ -0,0 +1,164 @@
+"""
+Circuit Breaker - Fail Fast While the LLM Provider Is Unhealthy
+===============================================================
+Shared by every agent (all LLM calls go through AIService).
+
+States:
+- closed:    calls go through; provider failures are counted
+- open:      calls fail immediately with CircuitOpenError for `reset_timeout` seconds
+- half_open: a few probe calls go through; success closes the circuit,
+             a failure opens it again
+
+The circuit opens after `failure_threshold` consecutive provider
+failures (rate limits, timeouts, 5xx). Errors caused by the request
+itself (bad prompt, safety blocks) don't count.
+
+The state is per process: with JOB_BACKEND=sqlite the API and every job
+worker process open their own circuit after their own failures.
+
+Configure with:
+    LLM_BREAKER_FAILURE_THRESHOLD=5
+    LLM_BREAKER_RESET_SECONDS=30
+
+SERVER SIDE FILE
+"""
+
+import os
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+# Circuit states
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            f"AI provider is temporarily unavailable after repeated failures. "
+            f"Please try again in {max(1, int(retry_after + 0.5))} seconds."
+        )
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with a half-open probe phase.
+
+    Usage:
+        provider_breaker.before_call()   # raises CircuitOpenError when open
+        ... call the provider ...
+        provider_breaker.record_success() / record_failure(reason)
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_calls = 0
+
+        # Statistics
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self.recent_transitions: deque = deque(maxlen=20)  # (timestamp, state, reason)
+
+        print(f" CircuitBreaker initialized (opens after {self.failure_threshold} failures, "
+              f"reset after {self.reset_timeout:g}s)")
+
+    def _transition(self, state: str, reason: str):
+        if state == self.state:
+            return
+        self.state = state
+        self.recent_transitions.append((time.time(), state, reason))
+        print(f" LLM circuit breaker -> {state} ({reason})")
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through."""
+        if self.state != STATE_OPEN or self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self):
+        """
+        Check whether a call may go to the provider.
+
+        Raises:
+            CircuitOpenError: if the circuit is open (or half-open with its probes in flight)
+        """
+        if self.state == STATE_OPEN:
+            if self.retry_after() > 0:
+                self.rejected_calls += 1
+                raise CircuitOpenError(self.retry_after())
+            self._transition(STATE_HALF_OPEN, "reset timeout elapsed")
+            self.half_open_calls = 0
+
+        if self.state == STATE_HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.rejected_calls += 1
+                raise CircuitOpenError(self.reset_timeout)
+            self.half_open_calls += 1
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state == STATE_HALF_OPEN:
+            self._transition(STATE_CLOSED, "probe call succeeded")
+
+    def record_failure(self, reason: str):
+        self.consecutive_failures += 1
+        if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+            self._transition(STATE_OPEN, f"{self.consecutive_failures} consecutive failures, last: {reason}")
+
+    def release_probe(self):
+        """A half-open probe ended without a verdict (e.g. it was cancelled)."""
+        if self.state == STATE_HALF_OPEN:
+            self.half_open_calls = max(0, self.half_open_calls - 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get circuit state (shown in /health)."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "retry_after_seconds": round(self.retry_after(), 2),
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls,
+            "recent_transitions": [
+                {"at": at, "state": state, "reason": reason}
+                for at, state, reason in self.recent_transitions
+            ],
+        }
+
+
+# Create singleton instance
+provider_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+)
+
+
+# Export
+__all__ = [
+    'CircuitBreaker',
+    'CircuitOpenError',
+    'provider_breaker',
+    'STATE_CLOSED',
+    'STATE_OPEN',
+    'STATE_HALF_OPEN'
+]
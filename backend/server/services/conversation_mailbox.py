@@ -0,0 +1,301 @@
+"""
+Conversation Mailbox - In-Order Message Processing per Conversation
+==================================================================
+Two messages for the same conversation used to run at the same time,
+racing on its history, mode and files. Every message now goes through
+its conversation's mailbox:
+
+- A conversation processes one turn at a time, in arrival order;
+  different conversations still run in parallel
+- Follow-ups that arrive while a turn is running are handled by policy:
+    queue      - each one gets its own turn afterwards (default)
+    coalesce   - the waiting follow-ups are merged into a single turn
+    supersede  - a new message replaces the ones still waiting (they
+                 end with MessageSuperseded); the running turn finishes
+- Waiting messages can be withdrawn (cancelled before they start)
+- At most `max_pending` messages wait per conversation (MailboxFull)
+
+The mailbox orders turns inside one process only. With JOB_BACKEND=sqlite
+the job worker processes run turns too; there the job queue keeps one
+conversation's jobs apart and a turn of this process holds a conversation
+lease (see job_queue.py), so a conversation still runs one turn at a time.
+
+Configure with:
+    MAILBOX_POLICY=queue
+    MAILBOX_MAX_PENDING=20
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, Awaitable, Callable, Deque, List, Optional
+
+
+# Follow-up policies
+POLICY_QUEUE = "queue"
+POLICY_COALESCE = "coalesce"
+POLICY_SUPERSEDE = "supersede"
+
+POLICIES = (POLICY_QUEUE, POLICY_COALESCE, POLICY_SUPERSEDE)
+
+
+class MailboxFull(Exception):
+    """Raised when a conversation already has max_pending messages waiting."""
+    pass
+
+
+class MessageSuperseded(Exception):
+    """A waiting message was replaced by a newer one (supersede policy)."""
+
+    def __init__(self, superseded_by: str):
+        super().__init__(f"Superseded by message {superseded_by}")
+        self.superseded_by = superseded_by
+
+
+class MessageWithdrawn(Exception):
+    """A waiting message was cancelled before its turn started."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Withdrawn before it started: {reason}")
+        self.reason = reason
+
+
+@dataclass
+class Letter:
+    """
+    One message waiting for (or taking part in) a conversation turn.
+    """
+    request_id: str
+    message: str
+    policy: str = POLICY_QUEUE
+    payload: Dict[str, Any] = field(default_factory=dict)  # Whatever the turn runner needs
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    future: Optional[asyncio.Future] = None
+    abandoned: bool = False                                  # Its caller stopped waiting
+
+    @property
+    def queue_wait(self) -> float:
+        """Seconds spent waiting for the conversation's previous turn."""
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+
+# Runs one turn: (conversation_id, letters) -> one result per letter
+TurnRunner = Callable[[str, List[Letter]], Awaitable[List[Any]]]
+
+
+class _Box:
+    def __init__(self):
+        self.pending: Deque[Letter] = deque()
+        self.turn: List[Letter] = []
+        self.turn_task: Optional[asyncio.Task] = None
+        self.drain_task: Optional[asyncio.Task] = None
+
+
+class ConversationMailbox:
+    """
+    Serializes turns per conversation.
+
+    Usage:
+        result = await conversation_mailbox.post(conversation_id, Letter(...), run_turn)
+    """
+
+    def __init__(self, policy: str = POLICY_QUEUE, max_pending: int = 20):
+        self.default_policy = policy if policy in POLICIES else POLICY_QUEUE
+        self.max_pending = max(1, max_pending)
+        self._boxes: Dict[str, _Box] = {}
+
+        # Statistics
+        self.turns = 0
+        self.waited = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.withdrawn = 0
+        self.rejected = 0
+        self.max_pending_seen = 0
+        self.total_queue_wait = 0.0
+
+        print(f" ConversationMailbox initialized (policy: {self.default_policy}, max pending: {self.max_pending})")
+
+    def resolve_policy(self, policy: Optional[str]) -> str:
+        """The policy to use for a message (the default if none was given)."""
+        if policy is None:
+            return self.default_policy
+        if policy not in POLICIES:
+            raise ValueError(f"followup_policy must be one of {', '.join(POLICIES)}")
+        return policy
+
+    async def post(self, conversation_id: str, letter: Letter, runner: TurnRunner) -> Any:
+        """
+        Queue a message and wait for the result of the turn it ends up in.
+
+        Raises:
+            MailboxFull: too many messages already waiting
+            MessageSuperseded / MessageWithdrawn: it never got a turn
+        """
+        box = self._boxes.get(conversation_id)
+        if box is None:
+            box = self._boxes[conversation_id] = _Box()
+        if len(box.pending) >= self.max_pending:
+            self.rejected += 1
+            raise MailboxFull(f"Conversation {conversation_id} already has {len(box.pending)} messages waiting")
+
+        letter.future = asyncio.get_running_loop().create_future()
+        if letter.policy == POLICY_SUPERSEDE and box.pending:
+            for stale in box.pending:
+                self._settle(stale, error=MessageSuperseded(letter.request_id))
+                self.superseded += 1
+            print(f" Mailbox {conversation_id}: {len(box.pending)} waiting message(s) superseded by {letter.request_id}")
+            box.pending.clear()
+
+        box.pending.append(letter)
+        self.max_pending_seen = max(self.max_pending_seen, len(box.pending))
+        if box.drain_task is None:
+            box.drain_task = asyncio.create_task(self._drain(conversation_id, box, runner))
+
+        try:
+            return await asyncio.shield(letter.future)
+        except asyncio.CancelledError:
+            # Our caller went away: drop the message, or stop its turn if nobody else waits for it
+            letter.abandoned = True
+            if letter in box.pending:
+                box.pending.remove(letter)
+                letter.future.cancel()
+            elif letter in box.turn and all(other.abandoned for other in box.turn) and box.turn_task is not None:
+                box.turn_task.cancel()
+            raise
+
+    def _next_turn(self, box: _Box) -> List[Letter]:
+        turn = [box.pending.popleft()]
+        if turn[0].policy == POLICY_COALESCE:
+            while box.pending and box.pending[0].policy == POLICY_COALESCE:
+                turn.append(box.pending.popleft())
+            self.coalesced += len(turn) - 1
+        return turn
+
+    async def _drain(self, conversation_id: str, box: _Box, runner: TurnRunner):
+        try:
+            while box.pending:
+                turn = self._next_turn(box)
+                started = time.monotonic()
+                for letter in turn:
+                    letter.started_at = started
+                    if letter.queue_wait > 0.001:
+                        self.waited += 1
+                    self.total_queue_wait += letter.queue_wait
+
+                box.turn = turn
+                box.turn_task = asyncio.create_task(runner(conversation_id, turn))
+                await asyncio.wait({box.turn_task})
+                self.turns += 1
+
+                if box.turn_task.cancelled():
+                    for letter in turn:
+                        self._settle(letter, error=asyncio.CancelledError())
+                elif box.turn_task.exception() is not None:
+                    for letter in turn:
+                        self._settle(letter, error=box.turn_task.exception())
+                else:
+                    for letter, result in zip(turn, box.turn_task.result()):
+                        self._settle(letter, result=result)
+                box.turn = []
+                box.turn_task = None
+        finally:
+            box.drain_task = None
+            if not box.pending and self._boxes.get(conversation_id) is box:
+                del self._boxes[conversation_id]
+
+    def _settle(self, letter: Letter, result: Any = None, error: Optional[BaseException] = None):
+        if letter.future is None or letter.future.done():
+            return
+        if letter.abandoned or isinstance(error, asyncio.CancelledError):
+            letter.future.cancel()
+        elif error is not None:
+            letter.future.set_exception(error)
+        else:
+            letter.future.set_result(result)
+
+    def withdraw(self, request_id: str, reason: str = "cancelled") -> Optional[str]:
+        """
+        Cancel a message that is still waiting.
+
+        Returns:
+            Its conversation id, or None if it isn't waiting (running or unknown)
+        """
+        for conversation_id, box in self._boxes.items():
+            for letter in box.pending:
+                if letter.request_id == request_id:
+                    box.pending.remove(letter)
+                    self._settle(letter, error=MessageWithdrawn(reason))
+                    self.withdrawn += 1
+                    return conversation_id
+        return None
+
+    def withdraw_conversation(
+        self, conversation_id: str, reason: str = "cancelled", keep: Optional[Callable[[Letter], bool]] = None
+    ) -> List[str]:
+        """
+        Cancel every waiting message of a conversation (except those `keep`
+        returns True for). Returns their request ids.
+        """
+        box = self._boxes.get(conversation_id)
+        if box is None:
+            return []
+        kept: Deque[Letter] = deque()
+        withdrawn = []
+        for letter in box.pending:
+            if keep is not None and keep(letter):
+                kept.append(letter)
+            else:
+                self._settle(letter, error=MessageWithdrawn(reason))
+                withdrawn.append(letter.request_id)
+        self.withdrawn += len(withdrawn)
+        box.pending = kept
+        return withdrawn
+
+    def pending_for(self, conversation_id: str) -> int:
+        """Number of messages waiting behind the conversation's current turn."""
+        box = self._boxes.get(conversation_id)
+        return len(box.pending) if box else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get mailbox counters (shown in /health)."""
+        return {
+            "policy": self.default_policy,
+            "active_conversations": len(self._boxes),
+            "waiting_messages": sum(len(box.pending) for box in self._boxes.values()),
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "turns": self.turns,
+            "messages_waited": self.waited,
+            "avg_queue_wait_seconds": self.total_queue_wait / self.waited if self.waited else 0.0,
+            "coalesced": self.coalesced,
+            "superseded": self.superseded,
+            "withdrawn": self.withdrawn,
+            "rejected": self.rejected,
+        }
+
+
+# Create singleton instance
+conversation_mailbox = ConversationMailbox(
+    policy=os.getenv("MAILBOX_POLICY", POLICY_QUEUE),
+    max_pending=int(os.getenv("MAILBOX_MAX_PENDING", "20"))
+)
+
+
+# Export
+__all__ = [
+    'ConversationMailbox',
+    'Letter',
+    'MailboxFull',
+    'MessageSuperseded',
+    'MessageWithdrawn',
+    'conversation_mailbox',
+    'POLICY_QUEUE',
+    'POLICY_COALESCE',
+    'POLICY_SUPERSEDE'
+]
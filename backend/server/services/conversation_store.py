@@ -0,0 +1,321 @@
+"""
+Conversation Store - Bounded Memory Tier over the Conversations Tables
+=====================================================================
+Conversation state used to live in a plain dict that only ever grew.
+This store keeps the hot conversations in memory and falls back to the
+`conversations` / `messages` tables for everything else:
+
+- Least recently used conversations are evicted once more than
+  `max_conversations` are held or their estimated size passes
+  `memory_budget` bytes
+- Conversations idle for longer than `ttl` seconds are evicted
+- Each in-memory history keeps the last `max_history` messages (the
+  database has all of them)
+- A conversation that isn't in memory is rehydrated on first access
+  from its persisted messages, mode and project (the project's files are
+  read back through the loader set with set_project_loader)
+- Conversations with a message in flight are pinned and never evicted
+
+Behaves like the dict it replaces (CoordinatorState.active_conversations),
+except that a lookup can load the conversation from the database. Async
+code uses `await conversation_store.load(...)`, which rehydrates in a
+thread instead of blocking the event loop.
+
+Configure with:
+    CONVERSATION_STORE_MAX=500
+    CONVERSATION_STORE_MEMORY_MB=64
+    CONVERSATION_IDLE_TTL_SECONDS=1800
+    CONVERSATION_HISTORY_MESSAGES=50
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterator, Optional
+
+from ..models.message_models import ConversationState, Message, MessageRole, ModeType
+from ..database.repositories import conversation_repo, message_repo
+
+
+# Rough per-object overhead added to the text sizes when estimating memory
+MESSAGE_OVERHEAD_BYTES = 200
+STATE_OVERHEAD_BYTES = 1000
+
+
+class ConversationStore(MutableMapping):
+    """
+    LRU/TTL memory tier of ConversationState objects, backed by the database.
+
+    Usage:
+        conv_state = conversation_store.get(conversation_id)   # memory, else database, else None
+        conv_state = await conversation_store.load(conversation_id)  # same, database read in a thread
+        conversation_store[conversation_id] = conv_state        # new or changed conversation
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 500,
+        memory_budget: int = 64 * 1024 * 1024,
+        ttl: float = 1800.0,
+        max_history: int = 50
+    ):
+        self.max_conversations = max(1, max_conversations)
+        self.memory_budget = max(1, memory_budget)
+        self.ttl = ttl
+        self.max_history = max(1, max_history)
+
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self._pins: Dict[str, int] = {}
+        self.bytes_used = 0
+        # Reads a project's files back when a conversation is rehydrated (set by the coordinator)
+        self.project_loader: Optional[Callable[[str], Dict[str, str]]] = None
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.rehydrated = 0
+        self.evictions: Dict[str, int] = {"ttl": 0, "budget": 0, "count": 0}
+
+        print(f" ConversationStore initialized (max: {self.max_conversations}, "
+              f"budget: {self.memory_budget // (1024 * 1024)}MB, ttl: {self.ttl:g}s)")
+
+    # ------------------------------------------------------------------
+    # Mapping interface (memory tier + lazy rehydration)
+    # ------------------------------------------------------------------
+
+    def __getitem__(self, conversation_id: str) -> ConversationState:
+        state = self._states.get(conversation_id)
+        if state is not None:
+            self.hits += 1
+            self._touch(conversation_id)
+            return state
+
+        self.misses += 1
+        state = self._rehydrate(conversation_id)
+        if state is None:
+            raise KeyError(conversation_id)
+        self._store(conversation_id, state)
+        return state
+
+    def __setitem__(self, conversation_id: str, state: ConversationState):
+        self._store(conversation_id, state)
+
+    def __delitem__(self, conversation_id: str):
+        if conversation_id not in self._states:
+            raise KeyError(conversation_id)
+        self._drop(conversation_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._states))
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    async def load(self, conversation_id: str) -> Optional[ConversationState]:
+        """
+        Like get(), but a conversation that isn't in memory is rehydrated in a
+        thread: its history query and project file walk don't block the event loop.
+        """
+        state = self._states.get(conversation_id)
+        if state is not None:
+            self.hits += 1
+            self._touch(conversation_id)
+            return state
+
+        self.misses += 1
+        state = await asyncio.to_thread(self._rehydrate, conversation_id)
+        if state is None:
+            return None
+        if conversation_id in self._states:
+            return self._states[conversation_id]  # Stored while we were loading: that copy wins
+        self._store(conversation_id, state)
+        return state
+
+    def peek(self, conversation_id: str) -> Optional[ConversationState]:
+        """The conversation if it is in memory (no database access, no LRU update)."""
+        return self._states.get(conversation_id)
+
+    def forget(self, conversation_id: str):
+        """
+        Clear a conversation: drop it from memory and don't bring its
+        current history back on the next access.
+        """
+        # Stored with the conversation, so restarts and worker processes skip the old history too
+        conversation_repo.mark_cleared(conversation_id)
+        if conversation_id in self._states:
+            self._drop(conversation_id)
+
+    def release(self, conversation_id: str):
+        """Drop a conversation from memory unless a message is in flight (it stays in the database)."""
+        if conversation_id in self._states and not self._pins.get(conversation_id):
+            self._drop(conversation_id)
+
+    def pin(self, conversation_id: str):
+        """Keep a conversation in memory while a message is being processed."""
+        self._pins[conversation_id] = self._pins.get(conversation_id, 0) + 1
+
+    def unpin(self, conversation_id: str):
+        remaining = self._pins.get(conversation_id, 0) - 1
+        if remaining > 0:
+            self._pins[conversation_id] = remaining
+        else:
+            self._pins.pop(conversation_id, None)
+            self._evict()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _touch(self, conversation_id: str):
+        self._states.move_to_end(conversation_id)
+        self._last_used[conversation_id] = time.monotonic()
+        self._evict()
+
+    def _store(self, conversation_id: str, state: ConversationState):
+        # The database keeps the full history; memory only needs the recent part
+        if len(state.message_history) > self.max_history:
+            del state.message_history[:-self.max_history]
+
+        size = self._estimate_size(state)
+        self.bytes_used += size - self._sizes.get(conversation_id, 0)
+        self._sizes[conversation_id] = size
+        self._states[conversation_id] = state
+        self._touch(conversation_id)
+
+    def _drop(self, conversation_id: str):
+        self._states.pop(conversation_id, None)
+        self._last_used.pop(conversation_id, None)
+        self.bytes_used -= self._sizes.pop(conversation_id, 0)
+
+    def _evict(self):
+        """Evict idle conversations, then least recently used ones until within limits."""
+        now = time.monotonic()
+        for conversation_id in list(self._states):
+            if now - self._last_used.get(conversation_id, now) < self.ttl:
+                break  # LRU order: everything after this was used more recently
+            if not self._pins.get(conversation_id):
+                self._drop(conversation_id)
+                self.evictions["ttl"] += 1
+
+        for conversation_id in list(self._states):
+            over_count = len(self._states) > self.max_conversations
+            over_budget = self.bytes_used > self.memory_budget
+            if not (over_count or over_budget):
+                break
+            if self._pins.get(conversation_id):
+                continue
+            self._drop(conversation_id)
+            self.evictions["count" if over_count else "budget"] += 1
+
+    def _estimate_size(self, state: ConversationState) -> int:
+        size = STATE_OVERHEAD_BYTES + len(str(state.context))
+        size += sum(len(message.content) + MESSAGE_OVERHEAD_BYTES for message in state.message_history)
+        size += sum(len(path) + len(content) for path, content in state.project_files.items())
+        return size
+
+    def set_project_loader(self, loader: Callable[[str], Dict[str, str]]):
+        """Register the function returning {file_path: content} for a project id."""
+        self.project_loader = loader
+
+    def _rehydrate(self, conversation_id: str) -> Optional[ConversationState]:
+        """Rebuild a conversation from the conversations/messages tables."""
+        try:
+            conv = conversation_repo.get_conversation(conversation_id)
+            if not conv:
+                return None
+            rows = message_repo.get_recent_messages(
+                conv["id"], limit=self.max_history, after_id=conv.get("cleared_after_message_id") or 0
+            )
+        except Exception as e:
+            print(f" Could not rehydrate conversation {conversation_id}: {e}")
+            return None
+
+        history = []
+        for row in rows:
+            try:
+                role = MessageRole(row["role"])
+            except ValueError:
+                continue
+            metadata = {}
+            if row.get("intent_type"):
+                metadata["intent_type"] = row["intent_type"]
+            if row.get("files_modified"):
+                metadata["files_modified"] = json.loads(row["files_modified"])
+            history.append(Message(
+                role=role,
+                content=row["content"],
+                timestamp=self._parse_timestamp(row.get("timestamp")),
+                metadata=metadata or None
+            ))
+
+        try:
+            mode = ModeType(conv.get("current_mode") or ModeType.CHAT_MODE.value)
+        except ValueError:
+            mode = ModeType.CHAT_MODE
+
+        # Without the project, generated files would no longer be saved to it
+        context: Dict[str, Any] = {}
+        project_files: Dict[str, str] = {}
+        project_key = conv.get("project_key")
+        if project_key:
+            context["project_id"] = project_key
+            if self.project_loader is not None:
+                try:
+                    project_files = self.project_loader(project_key)
+                except Exception as e:
+                    print(f" Could not reload files of project {project_key}: {e}")
+
+        self.rehydrated += 1
+        print(f"    Rehydrated conversation {conversation_id} ({len(history)} messages, {mode.value} mode, "
+              f"project {project_key or 'none'}, {len(project_files)} files)")
+        return ConversationState(
+            conversation_id=conversation_id,
+            current_mode=mode,
+            message_history=history,
+            project_files=project_files,
+            context=context
+        )
+
+    def _parse_timestamp(self, value: Optional[str]) -> datetime:
+        try:
+            return datetime.fromisoformat(value) if value else datetime.now()
+        except ValueError:
+            return datetime.now()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get memory tier counters (shown in /health)."""
+        lookups = self.hits + self.misses
+        return {
+            "in_memory": len(self._states),
+            "pinned": len(self._pins),
+            "max_conversations": self.max_conversations,
+            "bytes_used": self.bytes_used,
+            "memory_budget_bytes": self.memory_budget,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "rehydrated": self.rehydrated,
+            "evictions": self.evictions,
+        }
+
+
+# Create singleton instance
+conversation_store = ConversationStore(
+    max_conversations=int(os.getenv("CONVERSATION_STORE_MAX", "500")),
+    memory_budget=int(float(os.getenv("CONVERSATION_STORE_MEMORY_MB", "64")) * 1024 * 1024),
+    ttl=float(os.getenv("CONVERSATION_IDLE_TTL_SECONDS", "1800")),
+    max_history=int(os.getenv("CONVERSATION_HISTORY_MESSAGES", "50"))
+)
+
+
+# Export
+__all__ = ['ConversationStore', 'conversation_store']
@@ -0,0 +1,273 @@
+"""
+Job Manager - Asynchronous /api/chat Jobs
+=========================================
+A code-mode message can take minutes. Holding the HTTP request open for
+that long ties up proxies and client sockets and invites retries that
+double the work. In job mode /api/chat validates the request, enqueues
+it here and answers immediately with a job id:
+
+- At most `max_running` jobs run at once; up to `max_queued` more wait
+  in FIFO order (submitting beyond that raises JobQueueFull -> HTTP 429)
+- GET /api/jobs/{id} reports status, pipeline stage and progress
+- Status changes are pushed to the submitting WebSocket client (or the
+  conversation's clients) as job_queued / job_progress / job_complete
+- Finished jobs are kept for `retention` seconds so results can be fetched
+
+Configure with:
+    JOB_MAX_RUNNING=4
+    JOB_MAX_QUEUED=100
+    JOB_RETENTION_SECONDS=3600
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, Awaitable, Deque, Optional, Tuple
+
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = {JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED}
+
+# Rough progress per pipeline stage (see AgentCoordinator._enter_stage)
+STAGE_PROGRESS = {
+    "queued": 0,
+    "analyzing": 10,
+    "intent": 20,
+    "planning": 35,
+    "coding": 55,
+    "chat": 55,
+    "saving": 85,
+    "complete": 95,
+}
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while max_queued jobs are already waiting."""
+    pass
+
+
+@dataclass
+class Job:
+    """
+    One queued or running /api/chat message.
+    """
+    job_id: str
+    conversation_id: Optional[str] = None
+    client_id: Optional[str] = None        # WebSocket client to push updates to
+    status: str = JOB_QUEUED
+    stage: str = "queued"
+    progress: int = 0
+    attempts: int = 0                      # Times a worker picked it up (durable queue only)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "conversation_id": self.conversation_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "attempts": self.attempts,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+JobRunner = Callable[[Job], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    """
+    Bounded FIFO of jobs run by at most `max_running` tasks.
+
+    Usage:
+        job = job_manager.submit(run, conversation_id=..., client_id=...)
+        job_manager.get(job.job_id)
+    """
+
+    def __init__(self, max_running: int = 4, max_queued: int = 100, retention: float = 3600.0):
+        self.max_running = max(1, max_running)
+        self.max_queued = max(0, max_queued)
+        self.retention = retention
+
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending: Deque[Tuple[Job, JobRunner]] = deque()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._publisher: Optional[Callable[[Job, Dict[str, Any]], Awaitable[None]]] = None
+
+        # Statistics
+        self.submitted = 0
+        self.rejected = 0
+        self.finished: Dict[str, int] = {state: 0 for state in FINISHED_STATES}
+
+        print(f" JobManager initialized (running: {self.max_running}, queued: {self.max_queued})")
+
+    def set_publisher(self, publisher: Callable[[Job, Dict[str, Any]], Awaitable[None]]):
+        """Register the function that pushes job events (e.g. over WebSocket)."""
+        self._publisher = publisher
+
+    def _publish(self, job: Job, event_type: str):
+        if self._publisher is None:
+            return
+
+        # Snapshot now - the job keeps moving before the event is sent
+        event = {"type": event_type, **job.to_dict()}
+        if job.status == JOB_QUEUED:
+            event["queue_position"] = self.queue_position(job)
+
+        async def publish():
+            try:
+                await self._publisher(job, event)
+            except Exception as e:
+                print(f" Failed to publish {event_type} for job {job.job_id}: {e}")
+
+        asyncio.create_task(publish())
+
+    def _expire(self):
+        """Forget finished jobs older than the retention period."""
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.status in FINISHED_STATES and job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def submit(
+        self,
+        run: JobRunner,
+        conversation_id: Optional[str] = None,
+        client_id: Optional[str] = None,
+        job_id: Optional[str] = None
+    ) -> Job:
+        """
+        Queue a job. `run` is called with the job once a slot is free and
+        returns the job's result.
+
+        Raises:
+            JobQueueFull: if max_queued jobs are already waiting
+        """
+        self._expire()
+        if len(self._pending) >= self.max_queued and len(self._running) >= self.max_running:
+            self.rejected += 1
+            raise JobQueueFull(f"Too many queued jobs ({len(self._pending)}), try again later")
+
+        job = Job(job_id=job_id or str(uuid.uuid4()), conversation_id=conversation_id, client_id=client_id)
+        self._jobs[job.job_id] = job
+        self._pending.append((job, run))
+        self.submitted += 1
+        self._publish(job, "job_queued")
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        while self._pending and len(self._running) < self.max_running:
+            job, run = self._pending.popleft()
+            self._running[job.job_id] = asyncio.create_task(self._execute(job, run))
+
+    async def _execute(self, job: Job, run: JobRunner):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        self.update_stage(job, "analyzing")
+        try:
+            job.result = await run(job)
+            if job.result and job.result.get("error") == "cancelled":
+                job.status = JOB_CANCELLED
+            else:
+                job.status = JOB_COMPLETED
+                job.progress = 100
+        except asyncio.CancelledError:
+            job.status = JOB_CANCELLED
+        except Exception as e:
+            print(f" Job {job.job_id} failed: {e}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self.finished[job.status] = self.finished.get(job.status, 0) + 1
+            self._running.pop(job.job_id, None)
+            self._publish(job, "job_complete")
+            self._dispatch()
+
+    def update_stage(self, job: Job, stage: str):
+        """Record (and push) the pipeline stage a running job has reached."""
+        if job.stage == stage and job.status == JOB_RUNNING and job.progress:
+            return
+        job.stage = stage
+        job.progress = max(job.progress, STAGE_PROGRESS.get(stage, job.progress))
+        self._publish(job, "job_progress")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        """1-based position of a queued job (None once it has started)."""
+        for position, (queued, _) in enumerate(self._pending, 1):
+            if queued is job:
+                return position
+        return None
+
+    def cancel_queued(self, job_id: str) -> bool:
+        """Drop a job that hasn't started yet. Returns False if it isn't queued."""
+        for entry in list(self._pending):
+            if entry[0].job_id == job_id:
+                self._pending.remove(entry)
+                job = entry[0]
+                job.status = JOB_CANCELLED
+                job.finished_at = time.time()
+                self.finished[JOB_CANCELLED] += 1
+                self._publish(job, "job_complete")
+                return True
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get job queue counters (shown in /health)."""
+        return {
+            "running": len(self._running),
+            "queued": len(self._pending),
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "finished": self.finished,
+        }
+
+
+# Create singleton instance
+job_manager = JobManager(
+    max_running=int(os.getenv("JOB_MAX_RUNNING", "4")),
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+    retention=float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+)
+
+
+# Export
+__all__ = [
+    'JobManager',
+    'Job',
+    'JobQueueFull',
+    'job_manager',
+    'STAGE_PROGRESS',
+    'FINISHED_STATES',
+    'JOB_QUEUED',
+    'JOB_RUNNING',
+    'JOB_COMPLETED',
+    'JOB_FAILED',
+    'JOB_CANCELLED'
+]
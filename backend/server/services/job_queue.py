@@ -0,0 +1,413 @@
+"""
+Durable Job Queue - SQLite-Backed Chat Jobs for Worker Processes
+================================================================
+The in-process JobManager loses its queue when the API restarts and runs
+every pipeline inside the API's event loop. With JOB_BACKEND=sqlite,
+async /api/chat jobs go to the `job_queue` table instead and separate
+worker processes run them (python job_worker.py --processes N):
+
+- A worker claims the oldest queued job with a lease of
+  `visibility_timeout` seconds and renews it while the job runs; jobs of
+  the same conversation run one at a time, in the order they were sent
+- The conversation mailbox only orders turns inside one process, so a
+  synchronous /api/chat turn in the API process takes a conversation
+  lease (`hold_conversation`) for as long as it runs: workers don't claim
+  that conversation's jobs meanwhile, and the turn is refused
+  (ConversationBusy) while one of its jobs is queued or running
+- If the worker dies, its lease runs out and another worker picks the
+  job up again (up to `max_attempts` claims, then the job fails)
+- Workers write job progress and the pipeline's WebSocket messages
+  (stream tokens, ai_progress, ...) to `job_events`; the API process
+  polls that table and delivers them to its connected clients
+- Jobs survive API and worker restarts; finished jobs are kept for
+  `retention` seconds
+
+Configure with:
+    JOB_BACKEND=sqlite
+    JOB_VISIBILITY_TIMEOUT_SECONDS=60
+    JOB_MAX_ATTEMPTS=3
+    JOB_EVENT_POLL_MS=100
+(JOB_MAX_QUEUED and JOB_RETENTION_SECONDS apply as in job_manager.py)
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Callable, Awaitable, List, Optional, Tuple
+
+from ..database.repositories import job_queue_repo
+from .job_manager import Job, JobQueueFull, JOB_QUEUED, STAGE_PROGRESS
+
+
+# Relayed events are only needed until the API has delivered them
+EVENT_RETENTION_SECONDS = 600
+
+# Publisher signature: (message, conversation_id, client_id)
+EventPublisher = Callable[[Dict[str, Any], Optional[str], Optional[str]], Awaitable[None]]
+
+
+class ConversationBusy(Exception):
+    """Raised when a conversation's turn can't start because a worker job of it is queued or running."""
+    pass
+
+
+class DurableJobQueue:
+    """
+    Job queue in SQLite shared by the API process and the worker processes.
+
+    API process:
+        job = job_queue.submit(payload, conversation_id=..., client_id=...)
+        job_queue.start()                 # delivers worker events to clients
+    Worker process:
+        job, payload, lease = job_queue.claim(worker_id)
+        job_queue.heartbeat(job, lease)   # while running
+        job_queue.finish(job, lease, "completed", result)
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_queued: int = 100,
+        visibility_timeout: float = 60.0,
+        max_attempts: int = 3,
+        poll_interval: float = 0.1,
+        retention: float = 3600.0,
+        max_outbox: int = 50
+    ):
+        self.enabled = enabled
+        self.max_queued = max(0, max_queued)
+        self.visibility_timeout = max(1.0, visibility_timeout)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.max_outbox = max_outbox
+
+        self._outbox: List[Dict[str, Any]] = []
+        self._publisher: Optional[EventPublisher] = None
+        self._relay_task: Optional[asyncio.Task] = None
+        self._last_event_id = 0
+
+        # Statistics
+        self.submitted = 0
+        self.rejected = 0
+        self.claimed = 0
+        self.retried = 0
+        self.events_written = 0
+        self.events_delivered = 0
+        self.conversations_busy = 0
+
+        if self.enabled:
+            print(f" DurableJobQueue initialized (lease: {self.visibility_timeout:g}s, "
+                  f"max attempts: {self.max_attempts}, queued: {self.max_queued})")
+
+    # ------------------------------------------------------------------
+    # API process
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        payload: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        client_id: Optional[str] = None,
+        job_id: Optional[str] = None
+    ) -> Job:
+        """
+        Store a job for the workers. `payload` is the ChatRequest as a dict.
+
+        Raises:
+            JobQueueFull: if max_queued jobs are already waiting
+        """
+        queued = job_queue_repo.count_by_status().get(JOB_QUEUED, 0)
+        if queued >= self.max_queued:
+            self.rejected += 1
+            raise JobQueueFull(f"Too many queued jobs ({queued}), try again later")
+
+        job_id = job_id or str(uuid.uuid4())
+        if not job_queue_repo.enqueue(job_id, payload, conversation_id, client_id, self.max_attempts):
+            raise RuntimeError(f"Could not store job {job_id}")
+        self.submitted += 1
+
+        job = self.get(job_id)
+        self._publish_job(job, "job_queued")
+        self.flush_events()
+        return job
+
+    @asynccontextmanager
+    async def hold_conversation(self, conversation_id: str) -> AsyncIterator[None]:
+        """
+        Keep workers off a conversation while this process runs one of its turns.
+
+        Usage:
+            async with job_queue.hold_conversation(conversation_id):
+                ...  # run the turn
+
+        Raises:
+            ConversationBusy: if a job of the conversation is queued or running
+        """
+        owner = f"api:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        if not await asyncio.to_thread(
+            job_queue_repo.acquire_conversation_lease, conversation_id, owner, self.visibility_timeout
+        ):
+            self.conversations_busy += 1
+            raise ConversationBusy(f"Conversation {conversation_id} has a background job queued or running")
+
+        async def renew():
+            while True:
+                await asyncio.sleep(self.visibility_timeout / 3)
+                await asyncio.to_thread(
+                    job_queue_repo.extend_conversation_lease, conversation_id, owner, self.visibility_timeout
+                )
+
+        renewer = asyncio.create_task(renew())
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            # Not awaited in a thread: the lease must be released even while the turn is being cancelled
+            job_queue_repo.release_conversation_lease(conversation_id, owner)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = job_queue_repo.get_job(job_id)
+        return self._job_from_row(row) if row else None
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        """1-based position of a queued job (None once it has been claimed)."""
+        return job_queue_repo.queue_position(job.job_id)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job: queued jobs are cancelled right away, running ones are
+        flagged and cancelled by their worker at its next heartbeat.
+
+        Returns:
+            "cancelled", "cancel_requested", or None if the job already finished
+        """
+        outcome = job_queue_repo.request_cancel(job_id)
+        if outcome == "cancelled":
+            self._publish_job(self.get(job_id), "job_complete")
+            self.flush_events()
+        return outcome
+
+    def cancel_conversation(self, conversation_id: str) -> List[str]:
+        """Cancel every unfinished job of a conversation. Returns their ids."""
+        return [
+            job_id for job_id in job_queue_repo.unfinished_jobs(conversation_id)
+            if self.cancel(job_id)
+        ]
+
+    def set_publisher(self, publisher: EventPublisher):
+        """Register the function that delivers worker events to WebSocket clients."""
+        self._publisher = publisher
+
+    def start(self):
+        """Start delivering events written by the workers (API process only)."""
+        if not self.enabled or self._relay_task is not None:
+            return
+        # Only events written from now on - older ones were for a previous API process
+        self._last_event_id = job_queue_repo.last_event_id()
+        self._relay_task = asyncio.create_task(self._relay_events())
+
+    async def stop(self):
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            try:
+                await self._relay_task
+            except asyncio.CancelledError:
+                pass
+            self._relay_task = None
+
+    async def _relay_events(self):
+        last_maintenance = 0.0
+        while True:
+            events = []
+            try:
+                # Database work runs in a thread so polling doesn't block the API's event loop
+                events = await asyncio.to_thread(job_queue_repo.events_after, self._last_event_id)
+                for row in events:
+                    self._last_event_id = row["id"]
+                    if self._publisher is not None:
+                        await self._publisher(row["event"], row["conversation_id"], row["client_id"])
+                    self.events_delivered += 1
+
+                # Fail jobs whose worker died for good and drop old rows now and then
+                if time.monotonic() - last_maintenance >= self.visibility_timeout / 3:
+                    last_maintenance = time.monotonic()
+                    await asyncio.to_thread(self._maintain)
+            except Exception as e:
+                print(f" Job event relay error: {e}")
+            if not events:
+                await asyncio.sleep(self.poll_interval)
+
+    def reap(self) -> int:
+        """Finish jobs whose lease ran out after their last attempt (or after a cancel)."""
+        abandoned = job_queue_repo.fail_abandoned()
+        events = []
+        for row in abandoned:
+            print(f" Job {row['job_id']} {row['status']} after its worker went away")
+            events.append(self._job_event(self._job_from_row(row), "job_complete"))
+        # Written directly, not through the outbox: the API process reaps from a thread
+        self.events_written += job_queue_repo.add_events(events)
+        return len(abandoned)
+
+    def _maintain(self):
+        """Fail jobs whose worker died for good and drop old rows (runs in a thread)."""
+        self.reap()
+        now = time.time()
+        job_queue_repo.purge(now - self.retention, now - EVENT_RETENTION_SECONDS)
+
+    # ------------------------------------------------------------------
+    # Worker processes
+    # ------------------------------------------------------------------
+
+    def claim(self, worker_id: str) -> Optional[Tuple[Job, Dict[str, Any], str]]:
+        """
+        Lease the oldest available job.
+
+        Returns:
+            (job, payload, lease) or None if nothing is waiting
+        """
+        self.reap()
+        lease = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+        row = job_queue_repo.claim(lease, self.visibility_timeout)
+        if row is None:
+            return None
+
+        self.claimed += 1
+        if row["attempts"] > 1:
+            self.retried += 1
+            print(f" Retrying job {row['job_id']} (attempt {row['attempts']}/{row['max_attempts']})")
+        return self._job_from_row(row), json.loads(row["payload"]), lease
+
+    def heartbeat(self, job: Job, lease: str) -> Optional[bool]:
+        """
+        Renew a running job's lease.
+
+        Returns:
+            Whether cancellation was requested, or None if the lease was lost
+        """
+        row = job_queue_repo.extend_lease(job.job_id, lease, self.visibility_timeout)
+        if row is None:
+            return None
+        return bool(row["cancel_requested"])
+
+    def update_stage(self, job: Job, lease: str, stage: str):
+        """Record (and publish) the pipeline stage a running job has reached."""
+        if job.stage == stage:
+            return
+        job.stage = stage
+        job.progress = max(job.progress, STAGE_PROGRESS.get(stage, job.progress))
+        job_queue_repo.update_progress(job.job_id, lease, stage, job.progress)
+        self._publish_job(job, "job_progress")
+
+    def finish(
+        self,
+        job: Job,
+        lease: str,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None
+    ) -> bool:
+        """
+        Store a job's outcome. Returns False if the lease was lost (another
+        worker owns the job now, so this outcome is dropped).
+        """
+        owned = job_queue_repo.finish(job.job_id, lease, status, result, error)
+        if owned:
+            finished = self.get(job.job_id)
+            self._publish_job(finished or job, "job_complete")
+        self.flush_events()
+        return owned
+
+    async def relay(self, message: Dict[str, Any], conversation_id: Optional[str], client_id: Optional[str]):
+        """ConnectionManager relay: queue a pipeline WebSocket message for the API process."""
+        self.publish(message, conversation_id, client_id)
+
+    def publish(
+        self,
+        message: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        client_id: Optional[str] = None,
+        job_id: Optional[str] = None
+    ):
+        """Buffer an event; written with the next flush_events()."""
+        self._outbox.append(self._event_row(message, conversation_id, client_id, job_id))
+        if len(self._outbox) >= self.max_outbox:
+            self.flush_events()
+
+    def flush_events(self) -> int:
+        """Write buffered events (one transaction)."""
+        rows, self._outbox = self._outbox, []
+        written = job_queue_repo.add_events(rows)
+        self.events_written += written
+        return written
+
+    @staticmethod
+    def _event_row(
+        message: Dict[str, Any], conversation_id: Optional[str], client_id: Optional[str], job_id: Optional[str]
+    ) -> Dict[str, Any]:
+        return {
+            "job_id": job_id,
+            "conversation_id": conversation_id,
+            "client_id": client_id,
+            "event": message,
+            "created_at": time.time(),
+        }
+
+    def _job_event(self, job: Job, event_type: str) -> Dict[str, Any]:
+        return self._event_row({"type": event_type, **job.to_dict()}, job.conversation_id, job.client_id, job.job_id)
+
+    def _publish_job(self, job: Job, event_type: str):
+        self.publish({"type": event_type, **job.to_dict()}, job.conversation_id, job.client_id, job.job_id)
+
+    def _job_from_row(self, row: Dict[str, Any]) -> Job:
+        return Job(
+            job_id=row["job_id"],
+            conversation_id=row["conversation_id"],
+            client_id=row["client_id"],
+            status=row["status"],
+            stage=row["stage"],
+            progress=row["progress"],
+            attempts=row["attempts"],
+            created_at=row["created_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue counters (shown in /health)."""
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "jobs": job_queue_repo.count_by_status(),
+            "max_queued": self.max_queued,
+            "visibility_timeout_seconds": self.visibility_timeout,
+            "max_attempts": self.max_attempts,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "conversations_busy": self.conversations_busy,
+            "events_delivered": self.events_delivered,
+            "relay_running": self._relay_task is not None and not self._relay_task.done(),
+        }
+
+
+# Create singleton instance
+job_queue = DurableJobQueue(
+    enabled=os.getenv("JOB_BACKEND", "memory").lower() == "sqlite",
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+    visibility_timeout=float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "60")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    poll_interval=float(os.getenv("JOB_EVENT_POLL_MS", "100")) / 1000.0,
+    retention=float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+)
+
+
+# Export
+__all__ = ['DurableJobQueue', 'ConversationBusy', 'job_queue']
@@ -0,0 +1,312 @@
+"""
+LLM Cassettes - Record and Replay LLM Traffic
+=============================================
+Record mode wraps the real provider and writes every call (prompt hash,
+call type, conversation, each chunk with its arrival time, or the error)
+into a gzip-compressed JSON-lines cassette.
+
+Replay mode serves those recordings back instead of calling a model:
+- Calls are matched by their request hash first, then by
+  (conversation, call type) order, then by call type order
+- Chunks are re-emitted with their original timing, scaled by
+  `timing_scale` (1.0 = real time, 0.5 = twice as fast, 0 = instant)
+- Recorded errors are raised again, so retry paths replay too
+
+The coordinator also writes each user message into the cassette, so a
+whole session can be pushed through AgentCoordinator.process_message
+again (see replay_cassette.py) to measure the pipeline's own overhead
+without spending quota.
+
+Configure with:
+    LLM_CASSETTE_MODE=record|replay
+    LLM_CASSETTE_PATH=cassettes/session.jsonl.gz
+    LLM_CASSETTE_TIMING_SCALE=1.0
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional, Dict, Any, List, AsyncIterator, Deque
+
+from ..models.message_models import LLMCallType
+from .call_context import get_call_context
+from .llm_providers import LLMProvider, LLMProviderError
+
+
+CASSETTE_VERSION = 1
+
+# Entry kinds
+KIND_HEADER = "header"
+KIND_CALL = "call"
+KIND_MESSAGE = "message"
+
+
+def request_key(
+    model_name: str,
+    prompt: str,
+    system_instruction: Optional[str],
+    context: Optional[List[Dict[str, str]]],
+    temperature: Optional[float],
+    call_type: Optional[LLMCallType]
+) -> str:
+    """Hash the inputs of one LLM call (same inputs -> same recording)."""
+    payload = json.dumps(
+        [model_name, system_instruction or "", prompt, context or [], temperature,
+         call_type.value if call_type else None],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_cassette(path: str) -> List[Dict[str, Any]]:
+    """Read every entry of a cassette file."""
+    entries = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Wraps a real provider and appends every call to a cassette file.
+    """
+
+    def __init__(self, inner: LLMProvider, cassette_path: str):
+        self.inner = inner
+        self.name = f"recording:{inner.name}"
+        self.model_name = inner.model_name
+        self.fast_model_name = inner.fast_model_name
+        self.supports_prompt_cache = inner.supports_prompt_cache
+        self.cassette_path = Path(cassette_path)
+        self.cassette_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.calls_recorded = 0
+        self.messages_recorded = 0
+
+        if not self.cassette_path.exists():
+            self._append({
+                "kind": KIND_HEADER,
+                "version": CASSETTE_VERSION,
+                "model": self.model_name,
+                "fast_model": self.fast_model_name,
+                "created_at": time.time(),
+            })
+
+        print(f" Recording LLM traffic to {self.cassette_path}")
+
+    def _append(self, entry: Dict[str, Any]):
+        # Each append is its own gzip member; gzip readers concatenate them
+        with gzip.open(self.cassette_path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def record_message(
+        self,
+        message: str,
+        conversation_id: str,
+        project_context: Optional[Dict[str, Any]] = None
+    ):
+        """Record a user message so the session can be replayed end to end."""
+        self._append({
+            "kind": KIND_MESSAGE,
+            "conversation_id": conversation_id,
+            "message": message,
+            "project_context": project_context or {},
+            "recorded_at": time.time(),
+        })
+        self.messages_recorded += 1
+
+    async def stream(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        context: Optional[List[Dict[str, str]]] = None,
+        temperature: Optional[float] = None,
+        call_type: Optional[LLMCallType] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        started_at = time.time()
+        start = time.perf_counter()
+        chunks: List[List[Any]] = []
+        error: Optional[str] = None
+        usage = usage if usage is not None else {}
+
+        try:
+            async for chunk_text in self.inner.stream(
+                prompt,
+                system_instruction=system_instruction,
+                context=context,
+                temperature=temperature,
+                call_type=call_type,
+                usage=usage,
+                model=model,
+                max_output_tokens=max_output_tokens,
+                cached_prefix=cached_prefix
+            ):
+                chunks.append([round(time.perf_counter() - start, 4), chunk_text])
+                yield chunk_text
+        except asyncio.CancelledError:
+            raise  # Abandoned calls are not worth replaying
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            if error is not None or chunks:
+                self._append({
+                    "kind": KIND_CALL,
+                    "key": request_key(model or self.model_name, prompt, system_instruction, context, temperature, call_type),
+                    "call_type": call_type.value if call_type else None,
+                    "conversation_id": get_call_context().conversation_id,
+                    "model": model or self.model_name,
+                    "started_at": started_at,
+                    "duration": round(time.perf_counter() - start, 4),
+                    "chunks": chunks,
+                    "usage": usage,
+                    "error": error,
+                })
+                self.calls_recorded += 1
+
+    async def create_cached_prefix(self, model: str, system_instruction: str, ttl: float):
+        return await self.inner.create_cached_prefix(model, system_instruction, ttl)
+
+    async def refresh_cached_prefix(self, handle: str, ttl: float):
+        await self.inner.refresh_cached_prefix(handle, ttl)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cassette": str(self.cassette_path),
+            "calls_recorded": self.calls_recorded,
+            "messages_recorded": self.messages_recorded,
+        }
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Serves recorded calls from a cassette with original or scaled timing.
+    """
+
+    def __init__(self, cassette_path: str, timing_scale: float = 1.0):
+        self.cassette_path = Path(cassette_path)
+        self.timing_scale = max(0.0, timing_scale)
+
+        entries = load_cassette(str(self.cassette_path))
+        header = next((e for e in entries if e.get("kind") == KIND_HEADER), {})
+        self.name = "replay"
+        self.model_name = header.get("model", "replay")
+        self.fast_model_name = header.get("fast_model")
+
+        self.messages = [e for e in entries if e.get("kind") == KIND_MESSAGE]
+        calls = [e for e in entries if e.get("kind") == KIND_CALL]
+
+        # Three lookup tiers, each consumed in recorded order
+        self._by_key: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._by_conversation: Dict[tuple, Deque[Dict[str, Any]]] = {}
+        self._by_call_type: Dict[Optional[str], Deque[Dict[str, Any]]] = {}
+        for call in calls:
+            self._by_key.setdefault(call["key"], deque()).append(call)
+            self._by_conversation.setdefault((call.get("conversation_id"), call.get("call_type")), deque()).append(call)
+            self._by_call_type.setdefault(call.get("call_type"), deque()).append(call)
+        self._used: set = set()
+
+        self.total_calls = len(calls)
+        self.exact_matches = 0
+        self.fallback_matches = 0
+        self.misses = 0
+
+        print(f" Replaying {self.total_calls} LLM calls from {self.cassette_path} (timing x{self.timing_scale})")
+
+    def _take(self, queue: Optional[Deque[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        while queue:
+            call = queue.popleft()
+            if id(call) not in self._used:
+                self._used.add(id(call))
+                return call
+        return None
+
+    def _match(
+        self,
+        key: str,
+        conversation_id: Optional[str],
+        call_type: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        call = self._take(self._by_key.get(key))
+        if call is not None:
+            self.exact_matches += 1
+            return call
+
+        # Prompts that embed ids or timestamps won't hash the same; fall back to order
+        call = (
+            self._take(self._by_conversation.get((conversation_id, call_type)))
+            or self._take(self._by_call_type.get(call_type))
+        )
+        if call is not None:
+            self.fallback_matches += 1
+        return call
+
+    async def stream(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        context: Optional[List[Dict[str, str]]] = None,
+        temperature: Optional[float] = None,
+        call_type: Optional[LLMCallType] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        call_type_value = call_type.value if call_type else None
+        key = request_key(model or self.model_name, prompt, system_instruction, context, temperature, call_type)
+        call = self._match(key, get_call_context().conversation_id, call_type_value)
+
+        if call is None:
+            self.misses += 1
+            raise LLMProviderError(f"No recorded {call_type_value or 'LLM'} call left in cassette {self.cassette_path}")
+
+        if usage is not None:
+            usage.update(call.get("usage") or {})
+
+        start = time.perf_counter()
+        for offset, chunk_text in call["chunks"]:
+            delay = offset * self.timing_scale - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk_text
+
+        if call.get("error"):
+            delay = call["duration"] * self.timing_scale - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            raise LLMProviderError(call["error"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cassette": str(self.cassette_path),
+            "timing_scale": self.timing_scale,
+            "total_calls": self.total_calls,
+            "remaining_calls": self.total_calls - len(self._used),
+            "exact_matches": self.exact_matches,
+            "fallback_matches": self.fallback_matches,
+            "misses": self.misses,
+        }
+
+
+__all__ = [
+    'RecordingProvider',
+    'ReplayProvider',
+    'load_cassette',
+    'request_key'
+]
@@ -0,0 +1,644 @@
+"""
+LLM Providers
+=============
+The AI service talks to a provider through one small interface:
+
+    async for chunk in provider.stream(prompt, system_instruction, context, temperature, call_type):
+        ...
+
+Two providers ship with F3:
+- GeminiProvider: the real thing (google-generativeai async API)
+- FakeProvider:   deterministic, offline backend that streams canned or
+                  templated responses with configurable time-to-first-token,
+                  tokens/sec and error rate. Use it to load-test the
+                  coordinator, WebSocket fan-out and persistence on a laptop.
+
+Pick one with LLM_PROVIDER=gemini|fake (default: gemini). Set
+LLM_CASSETTE_MODE=record|replay to capture or replay traffic (llm_cassettes.py).
+
+SERVER SIDE FILE - GeminiProvider holds your API key.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+
+from ..models.message_models import LLMCallType
+
+
+class LLMProviderError(Exception):
+    """Raised by a provider when a generation fails."""
+    pass
+
+
+class LLMProvider:
+    """
+    Base class for LLM backends.
+    """
+
+    name = "base"
+    model_name = "unknown"
+    fast_model_name: Optional[str] = None  # Cheaper/faster model for small calls (None = same model)
+    supports_prompt_cache = False          # Can store a static prompt prefix (see prompt_cache.py)
+
+    async def stream(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        context: Optional[List[Dict[str, str]]] = None,
+        temperature: Optional[float] = None,
+        call_type: Optional[LLMCallType] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield text chunks for one generation.
+
+        Providers that know their token counts write them into `usage`
+        ("prompt_tokens", "completion_tokens"); the caller estimates otherwise.
+
+        `model` is a concrete model name (see resolve_model); None means
+        the provider's default model. With `cached_prefix` (a handle from
+        create_cached_prefix) the system instruction is already stored on
+        the provider side and is not sent again; cached prompt tokens are
+        reported as usage["cached_tokens"].
+        """
+        raise NotImplementedError
+        yield ""  # pragma: no cover - makes this an async generator
+
+    async def create_cached_prefix(self, model: str, system_instruction: str, ttl: float) -> Tuple[str, int]:
+        """Store a static prefix. Returns (handle, cached token count)."""
+        raise LLMProviderError(f"{self.name} provider does not support prompt caching")
+
+    async def refresh_cached_prefix(self, handle: str, ttl: float):
+        """Extend a cached prefix's lifetime."""
+        raise LLMProviderError(f"{self.name} provider does not support prompt caching")
+
+    def resolve_model(self, model: Optional[str]) -> str:
+        """Turn a route's model ("default", "fast" or a concrete name) into a model name."""
+        if model is None or model == "default":
+            return self.model_name
+        if model == "fast":
+            return self.fast_model_name or self.model_name
+        return model
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Provider-specific counters (shown in /health)."""
+        return {}
+
+
+# ============================================================================
+# GEMINI PROVIDER.............................................................
+# ============================================================================
+
+class GeminiProvider(LLMProvider):
+    """
+    Streams from Google's Gemini through the SDK's async API.
+    """
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gemini-2.5-flash",
+        fast_model_name: Optional[str] = "gemini-2.5-flash-lite"
+    ):
+        import google.generativeai as genai
+        from google.generativeai.types import GenerationConfig
+
+        self._genai = genai
+        self._GenerationConfig = GenerationConfig
+
+        # Configure Gemini
+        genai.configure(api_key=api_key)
+
+        # Initialize the model
+        self.model = genai.GenerativeModel(model_name)
+        self.model_name = self.model.model_name
+        self.fast_model_name = fast_model_name
+        self._models = {model_name: self.model, self.model_name: self.model}
+
+        # Cached content needs google.generativeai.caching (SDK 0.7+, pinned in
+        # requirements.txt); on an older SDK every call simply sends its full prompt
+        try:
+            from google.generativeai import caching
+            self._caching = caching
+        except ImportError:
+            self._caching = None
+        self.supports_prompt_cache = self._caching is not None
+        self._cached_models: Dict[str, Any] = {}  # handle -> GenerativeModel bound to it
+
+        # Generation config for consistent responses
+        self.generation_config = GenerationConfig(
+            temperature=0.7,      # Creativity level (0.0 = deterministic, 1.0 = creative)
+            top_p=0.95,           # Nucleus sampling
+            top_k=40,             # Top-k sampling
+            max_output_tokens=8192,  # Maximum response length
+        )
+
+        # Safety settings - prevent harmful content
+        self.safety_settings = [
+            {
+                "category": "HARM_CATEGORY_HARASSMENT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+            {
+                "category": "HARM_CATEGORY_HATE_SPEECH",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+            {
+                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+            {
+                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+        ]
+
+    def _build_chat_history(self, context: Optional[List[Dict[str, str]]]) -> List[Dict[str, Any]]:
+        """Convert our message dicts into Gemini's chat history format."""
+        chat_history = []
+        if context:
+            for msg in context:
+                role = "user" if msg["role"] == "user" else "model"
+                chat_history.append({
+                    "role": role,
+                    "parts": [msg["content"]]
+                })
+        return chat_history
+
+    def _get_model(self, model: Optional[str]):
+        """GenerativeModel for a model name (created once, then reused)."""
+        if model is None:
+            return self.model
+        if model not in self._models:
+            self._models[model] = self._genai.GenerativeModel(model)
+        return self._models[model]
+
+    async def create_cached_prefix(self, model: str, system_instruction: str, ttl: float) -> Tuple[str, int]:
+        if self._caching is None:
+            return await super().create_cached_prefix(model, system_instruction, ttl)
+        cached_content = await asyncio.to_thread(
+            self._caching.CachedContent.create,
+            model=model,
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=ttl)
+        )
+        self._cached_models[cached_content.name] = self._genai.GenerativeModel.from_cached_content(cached_content)
+        tokens = getattr(getattr(cached_content, "usage_metadata", None), "total_token_count", 0) or 0
+        return cached_content.name, tokens
+
+    async def refresh_cached_prefix(self, handle: str, ttl: float):
+        if self._caching is None:
+            return await super().refresh_cached_prefix(handle, ttl)
+        cached_content = await asyncio.to_thread(self._caching.CachedContent.get, handle)
+        await asyncio.to_thread(cached_content.update, ttl=datetime.timedelta(seconds=ttl))
+
+    def _build_generation_config(self, temperature: Optional[float] = None, max_output_tokens: Optional[int] = None):
+        """Return the default generation config, with temperature / output cap overridden if provided."""
+        if temperature is None and max_output_tokens is None:
+            return self.generation_config
+        return self._GenerationConfig(
+            temperature=temperature if temperature is not None else self.generation_config.temperature,
+            top_p=self.generation_config.top_p,
+            top_k=self.generation_config.top_k,
+            max_output_tokens=max_output_tokens or self.generation_config.max_output_tokens,
+        )
+
+    def _extract_chunk_text(self, chunk) -> str:
+        """Pull the text out of a streamed Gemini chunk (simple or multi-part)."""
+        try:
+            if chunk.text:
+                return chunk.text
+        except (ValueError, AttributeError):
+            # .text raises when the chunk has no simple text part
+            pass
+
+        chunk_text = ""
+        for candidate in getattr(chunk, "candidates", None) or []:
+            content = getattr(candidate, "content", None)
+            for part in getattr(content, "parts", None) or []:
+                if getattr(part, "text", None):
+                    chunk_text += part.text
+        return chunk_text
+
+    def _record_usage(self, chunk, usage: Optional[Dict[str, int]]):
+        """Copy token counts from a chunk's usage metadata (when the API sends it)."""
+        usage_metadata = getattr(chunk, "usage_metadata", None)
+        if usage is None or usage_metadata is None:
+            return
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0)
+        completion_tokens = getattr(usage_metadata, "candidates_token_count", 0)
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", 0)
+        if prompt_tokens:
+            usage["prompt_tokens"] = prompt_tokens
+        if completion_tokens:
+            usage["completion_tokens"] = completion_tokens
+        if cached_tokens:
+            usage["cached_tokens"] = cached_tokens
+
+    async def stream(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        context: Optional[List[Dict[str, str]]] = None,
+        temperature: Optional[float] = None,
+        call_type: Optional[LLMCallType] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream text chunks from Gemini.
+
+        Uses the SDK's async API (grpc.aio under the hood, one pooled
+        keep-alive channel per process), so waiting for the next chunk
+        yields to the event loop instead of blocking it.
+        """
+        chat_history = self._build_chat_history(context)
+        config = self._build_generation_config(temperature, max_output_tokens)
+        generative_model = self._get_model(model)
+
+        # Combine system instruction with prompt if provided
+        full_prompt = prompt
+        if cached_prefix:
+            if cached_prefix not in self._cached_models:
+                raise LLMProviderError(f"Cached content {cached_prefix} not found")
+            # The system instruction lives in the cached content
+            generative_model = self._cached_models[cached_prefix]
+            full_prompt = f"User: {prompt}\n\nAssistant:"
+        elif system_instruction:
+            full_prompt = f"{system_instruction}\n\nUser: {prompt}\n\nAssistant:"
+
+        # Create streaming response
+        if chat_history:
+            chat = generative_model.start_chat(history=chat_history)
+            response_stream = await chat.send_message_async(
+                full_prompt,
+                generation_config=config,
+                safety_settings=self.safety_settings,
+                stream=True
+            )
+        else:
+            response_stream = await generative_model.generate_content_async(
+                full_prompt,
+                generation_config=config,
+                safety_settings=self.safety_settings,
+                stream=True
+            )
+
+        async for chunk in response_stream:
+            self._record_usage(chunk, usage)
+            chunk_text = self._extract_chunk_text(chunk)
+            if chunk_text:
+                yield chunk_text
+
+
+# ============================================================================
+# FAKE PROVIDER...............................................................
+# ============================================================================
+
+FAKE_RESPONSE_TEMPLATES: Dict[str, str] = {
+    LLMCallType.NARRATION.value: (
+        "I'm working through {subject} right now. I'm looking at the structure, "
+        "picking the right Flutter widgets and making sure everything fits together cleanly."
+    ),
+    LLMCallType.CHAT.value: (
+        "Good question about {subject}. In Flutter the usual approach is to keep widgets small "
+        "and composable, lift state only as high as it needs to go, and lean on the theme for "
+        "colors and typography so everything stays consistent."
+    ),
+    LLMCallType.ERROR_ANALYSIS.value: json.dumps({
+        "can_auto_fix": False,
+        "severity": "medium",
+        "error_type": "validation",
+        "explanation": "The generated output did not match what was expected.",
+        "suggested_fix": None,
+        "user_questions": ["Could you describe the widget in a bit more detail?"]
+    }),
+}
+
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline provider for load testing.
+
+    Args:
+        time_to_first_token: Seconds before the first chunk is emitted
+        tokens_per_second: Streaming speed after the first token
+        error_rate: Probability (0.0-1.0) that a call fails with a fake 429
+        slow_start_rate: Probability (0.0-1.0) that a call's first token takes
+                         `slow_start_factor` times longer (simulated tail latency)
+        slow_start_factor: Multiplier applied to time_to_first_token for slow starts
+
+    The fast model ("fake-model-fast") starts twice as quickly and streams
+    twice as fast, to mimic a small model. Cached prefixes are simulated:
+    handles expire after their TTL and calls using them report the prefix
+    as cached tokens.
+        seed: Seed for error injection and template choices
+        responses: Optional {call_type: template} overrides. Templates can use
+                   {subject}, {target_file} and {widget_name}.
+    """
+
+    name = "fake"
+    model_name = "fake-model"
+    fast_model_name = "fake-model-fast"
+    supports_prompt_cache = True
+
+    WORD_PATTERN = re.compile(r"\S+\s*|\s+")
+
+    def __init__(
+        self,
+        time_to_first_token: float = 0.3,
+        tokens_per_second: float = 80.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        responses: Optional[Dict[str, str]] = None,
+        slow_start_rate: float = 0.0,
+        slow_start_factor: float = 10.0
+    ):
+        self.time_to_first_token = max(0.0, time_to_first_token)
+        self.tokens_per_second = max(0.0, tokens_per_second)
+        self.error_rate = min(1.0, max(0.0, error_rate))
+        self.slow_start_rate = min(1.0, max(0.0, slow_start_rate))
+        self.slow_start_factor = max(1.0, slow_start_factor)
+        self.seed = seed
+        self.responses = {**FAKE_RESPONSE_TEMPLATES, **(responses or {})}
+        self._error_random = random.Random(seed)
+        self._latency_random = random.Random(seed + 1)
+        self.calls = 0
+        self.calls_by_model: Dict[str, int] = {}
+        self._cached_prefixes: Dict[str, Tuple[int, float]] = {}  # handle -> (tokens, expires_at)
+        self.errors_injected = 0
+        self.slow_starts = 0
+
+    # ------------------------------------------------------------------
+    # Templating
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _extract_quoted(prompt: str, label: str) -> Optional[str]:
+        match = re.search(label + r'[:*\s]*"(.*?)"', prompt, flags=re.DOTALL)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def _widget_name(text: str) -> str:
+        skip = {"a", "an", "the", "create", "make", "build", "add", "generate", "please", "with", "me", "for"}
+        words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in skip]
+        name = "_".join(words[:3]) or "custom"
+        return name if name.endswith("widget") else f"{name}_widget"
+
+    @staticmethod
+    def _class_name(widget_name: str) -> str:
+        return "".join(part.capitalize() for part in widget_name.split("_"))
+
+    def _render(self, prompt: str, call_type: Optional[LLMCallType]) -> str:
+        call_key = call_type.value if call_type else LLMCallType.CHAT.value
+
+        first_line = prompt.strip().splitlines()[0][:120] if prompt.strip() else "your request"
+        subject = (
+            self._extract_quoted(prompt, "User Message")
+            or self._extract_quoted(prompt, "User Request")
+            or first_line
+        )
+        target_match = re.search(r"Target File:\**\s*(\S+)", prompt)
+        target_file = target_match.group(1) if target_match else "lib/widgets/custom_widget.dart"
+        widget_name = self._widget_name(subject)
+
+        if call_key in self.responses:
+            return self.responses[call_key].format(
+                subject=subject, target_file=target_file, widget_name=widget_name
+            )
+
+        if call_type == LLMCallType.INTENT:
+            wants_code = re.search(r"\b(create|build|make|add|generate|change|implement)\b", subject.lower())
+            intent = "code" if wants_code else "chat"
+            return json.dumps({
+                "intent": intent,
+                "confidence": 0.9,
+                "reasoning": f"Fake classifier: looks like a {intent} request",
+                "suggested_mode": intent
+            })
+
+        if call_type == LLMCallType.PLAN:
+            return json.dumps({
+                "plan_id": f"fake-{hashlib.sha1(subject.encode()).hexdigest()[:8]}",
+                "steps": [
+                    {
+                        "step_number": 1,
+                        "action_type": "create_file",
+                        "description": f"Create {widget_name}",
+                        "target_file": f"lib/widgets/{widget_name}.dart"
+                    },
+                    {
+                        "step_number": 2,
+                        "action_type": "create_file",
+                        "description": f"Create preview for {widget_name}",
+                        "target_file": f"lib/preview/{widget_name}_preview.dart"
+                    },
+                    {
+                        "step_number": 3,
+                        "action_type": "create_file",
+                        "description": "Document the widget",
+                        "target_file": "README.md"
+                    }
+                ],
+                "estimated_files": [
+                    f"lib/widgets/{widget_name}.dart",
+                    f"lib/preview/{widget_name}_preview.dart",
+                    "README.md"
+                ],
+                "dependencies": [],
+                "notes": "Generated by the fake provider"
+            })
+
+        if call_type == LLMCallType.CODE:
+            if target_file.endswith(".md"):
+                return f"# Widget\n\nThis widget was generated for: {subject}\n"
+            class_name = self._class_name(target_file.rsplit("/", 1)[-1].replace(".dart", ""))
+            return (
+                "import 'package:flutter/material.dart';\n\n"
+                f"class {class_name} extends StatelessWidget {{\n"
+                f"  const {class_name}({{super.key}});\n\n"
+                "  @override\n"
+                "  Widget build(BuildContext context) {\n"
+                "    return Container(\n"
+                "      padding: const EdgeInsets.all(16),\n"
+                f"      child: const Text('{class_name}'),\n"
+                "    );\n"
+                "  }\n"
+                "}\n"
+            )
+
+        return f"Here is a response about {subject}."
+
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+
+    async def stream(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        context: Optional[List[Dict[str, str]]] = None,
+        temperature: Optional[float] = None,
+        call_type: Optional[LLMCallType] = None,
+        usage: Optional[Dict[str, int]] = None,
+        model: Optional[str] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream a templated response with simulated latency."""
+        self.calls += 1
+        self.calls_by_model[model or self.model_name] = self.calls_by_model.get(model or self.model_name, 0) + 1
+        speedup = 2.0 if model == self.fast_model_name else 1.0
+
+        time_to_first_token = self.time_to_first_token / speedup
+        if self.slow_start_rate and self._latency_random.random() < self.slow_start_rate:
+            self.slow_starts += 1
+            time_to_first_token *= self.slow_start_factor
+        if time_to_first_token:
+            await asyncio.sleep(time_to_first_token)
+
+        if self.error_rate and self._error_random.random() < self.error_rate:
+            self.errors_injected += 1
+            raise LLMProviderError("429 Resource has been exhausted (fake provider error injection)")
+
+        cached_tokens = 0
+        if cached_prefix:
+            tokens_and_expiry = self._cached_prefixes.get(cached_prefix)
+            if tokens_and_expiry is None or tokens_and_expiry[1] < time.monotonic():
+                raise LLMProviderError(f"Cached content {cached_prefix} not found (fake provider)")
+            cached_tokens = tokens_and_expiry[0]
+
+        text = self._render(prompt, call_type)
+        delay = 1.0 / (self.tokens_per_second * speedup) if self.tokens_per_second else 0.0
+        tokens = self.WORD_PATTERN.findall(text)
+        if max_output_tokens:
+            tokens = tokens[:max_output_tokens]
+
+        if usage is not None:
+            prompt_text = (system_instruction or "") + prompt + "".join(m["content"] for m in context or [])
+            usage["prompt_tokens"] = len(self.WORD_PATTERN.findall(prompt_text))
+            usage["completion_tokens"] = len(tokens)
+            if cached_tokens:
+                usage["cached_tokens"] = cached_tokens
+
+        for index, token in enumerate(tokens):
+            if index and delay:
+                await asyncio.sleep(delay)
+            yield token
+
+    async def create_cached_prefix(self, model: str, system_instruction: str, ttl: float) -> Tuple[str, int]:
+        handle = f"cachedContents/fake-{hashlib.sha1((model + system_instruction).encode()).hexdigest()[:12]}"
+        tokens = len(self.WORD_PATTERN.findall(system_instruction))
+        self._cached_prefixes[handle] = (tokens, time.monotonic() + ttl)
+        return handle, tokens
+
+    async def refresh_cached_prefix(self, handle: str, ttl: float):
+        if handle not in self._cached_prefixes:
+            raise LLMProviderError(f"Cached content {handle} not found (fake provider)")
+        tokens, _ = self._cached_prefixes[handle]
+        self._cached_prefixes[handle] = (tokens, time.monotonic() + ttl)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "tokens_per_second": self.tokens_per_second,
+            "error_rate": self.error_rate,
+            "calls": self.calls,
+            "calls_by_model": self.calls_by_model,
+            "errors_injected": self.errors_injected,
+            "slow_starts": self.slow_starts,
+        }
+
+
+# ============================================================================
+# FACTORY.....................................................................
+# ============================================================================
+
+def _create_base_provider() -> LLMProvider:
+    """Build the provider selected by LLM_PROVIDER (gemini|fake)."""
+    provider_name = os.getenv("LLM_PROVIDER", "gemini").lower()
+
+    if provider_name == "fake":
+        responses = None
+        responses_path = os.getenv("FAKE_LLM_RESPONSES")
+        if responses_path:
+            with open(responses_path, "r", encoding="utf-8") as f:
+                responses = json.load(f)
+        return FakeProvider(
+            time_to_first_token=float(os.getenv("FAKE_LLM_TTFT_MS", "300")) / 1000.0,
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "80")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            responses=responses,
+            slow_start_rate=float(os.getenv("FAKE_LLM_SLOW_START_RATE", "0")),
+            slow_start_factor=float(os.getenv("FAKE_LLM_SLOW_START_FACTOR", "10"))
+        )
+
+    if provider_name != "gemini":
+        raise ValueError(f"Unknown LLM_PROVIDER '{provider_name}' (expected 'gemini' or 'fake')")
+
+    # Get API key from environment variables
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment variables!")
+
+    # Using gemini-2.5-flash for latest capabilities and performance;
+    # the fast model serves small calls (see model_routing.py)
+    return GeminiProvider(
+        api_key=api_key,
+        model_name=os.getenv("LLM_DEFAULT_MODEL", "gemini-2.5-flash"),
+        fast_model_name=os.getenv("LLM_FAST_MODEL", "gemini-2.5-flash-lite")
+    )
+
+
+def create_provider_from_env() -> LLMProvider:
+    """
+    Build the provider the AI service should use.
+
+    LLM_PROVIDER picks the backend (gemini|fake). Fake provider settings:
+        FAKE_LLM_TTFT_MS, FAKE_LLM_TOKENS_PER_SECOND, FAKE_LLM_ERROR_RATE,
+        FAKE_LLM_SEED, FAKE_LLM_RESPONSES (path to a JSON {call_type: template} file)
+
+    LLM_CASSETTE_MODE=record wraps that backend in a recorder;
+    LLM_CASSETTE_MODE=replay serves a cassette instead (see llm_cassettes.py).
+    """
+    cassette_mode = os.getenv("LLM_CASSETTE_MODE", "").lower()
+    cassette_path = os.getenv("LLM_CASSETTE_PATH", "cassettes/session.jsonl.gz")
+
+    if cassette_mode == "replay":
+        from .llm_cassettes import ReplayProvider
+        return ReplayProvider(
+            cassette_path,
+            timing_scale=float(os.getenv("LLM_CASSETTE_TIMING_SCALE", "1.0"))
+        )
+
+    provider = _create_base_provider()
+
+    if cassette_mode == "record":
+        from .llm_cassettes import RecordingProvider
+        return RecordingProvider(provider, cassette_path)
+
+    return provider
+
+
+__all__ = [
+    'LLMProvider',
+    'LLMProviderError',
+    'GeminiProvider',
+    'FakeProvider',
+    'create_provider_from_env'
+]
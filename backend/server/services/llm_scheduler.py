@@ -0,0 +1,346 @@
+"""
+LLM Scheduler
+=============
+Central gatekeeper between the agents and the Gemini provider.
+
+Every LLM call asks the scheduler for a slot before it starts streaming:
+- At most `concurrency_limit` calls run against the provider at once
+- The limit adapts AIMD-style: it grows by one slot per window of
+  successful calls and is halved when the provider answers with a rate
+  limit or times out (never below `min_concurrency` or above
+  `max_concurrency`)
+- Queued calls are served by priority: interactive code > chat > narration
+- Queued calls belonging to a conversation can be cancelled when that
+  conversation goes away
+- Queue depth and per-priority wait times are tracked for /health
+
+Slots and the adaptive limit are per process. With JOB_BACKEND=sqlite
+the API and each job worker process get an equal share of
+LLM_MAX_CONCURRENCY / LLM_INITIAL_CONCURRENCY (see
+rate_limiter.limit_processes).
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from ..models.message_models import LLMCallType
+from .rate_limiter import limit_processes
+
+
+# Priority classes (lower value = served first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_CHAT = 1
+PRIORITY_NARRATION = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_CHAT: "chat",
+    PRIORITY_NARRATION: "narration",
+}
+
+CALL_TYPE_PRIORITIES = {
+    LLMCallType.INTENT: PRIORITY_INTERACTIVE,
+    LLMCallType.PLAN: PRIORITY_INTERACTIVE,
+    LLMCallType.CODE: PRIORITY_INTERACTIVE,
+    LLMCallType.ERROR_ANALYSIS: PRIORITY_INTERACTIVE,
+    LLMCallType.CHAT: PRIORITY_CHAT,
+    LLMCallType.NARRATION: PRIORITY_NARRATION,
+}
+
+
+class AIMDLimit:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+
+    Every success adds 1/limit (about +1 slot per `limit` successes);
+    an overload signal multiplies the limit by `backoff`, at most once
+    per `decrease_cooldown` seconds so one burst of 429s counts once.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float = 1,
+        maximum: float = 16,
+        backoff: float = 0.5,
+        decrease_cooldown: float = 2.0
+    ):
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.value = min(self.maximum, max(self.minimum, initial))
+        self.backoff = backoff
+        self.decrease_cooldown = decrease_cooldown
+        self.last_decrease = 0.0
+
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def slots(self) -> int:
+        return int(self.value)
+
+    def on_success(self):
+        before = self.slots
+        self.value = min(self.maximum, self.value + 1.0 / self.value)
+        if self.slots > before:
+            self.increases += 1
+
+    def on_overload(self) -> bool:
+        """Returns True if the limit was cut."""
+        now = time.monotonic()
+        if now - self.last_decrease < self.decrease_cooldown:
+            return False
+        self.last_decrease = now
+        self.value = max(self.minimum, self.value * self.backoff)
+        self.decreases += 1
+        return True
+
+
+class LLMCallCancelled(Exception):
+    """Raised when a queued LLM call is cancelled before it got a slot."""
+    pass
+
+
+@dataclass(order=True)
+class _QueuedCall:
+    priority: int
+    sequence: int
+    future: asyncio.Future = field(compare=False)
+    owner_id: Optional[str] = field(default=None, compare=False)
+    call_type: Optional[LLMCallType] = field(default=None, compare=False)
+    enqueued_at: float = field(default_factory=time.monotonic, compare=False)
+
+
+class LLMScheduler:
+    """
+    Priority queue with bounded concurrency for LLM calls.
+
+    Usage:
+        async with llm_scheduler.slot(LLMCallType.CODE, owner_id=conversation_id) as wait_time:
+            ... stream from the provider ...
+    """
+
+    def __init__(self, max_concurrency: int = 16, min_concurrency: int = 1, initial_concurrency: int = 4):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = AIMDLimit(initial=initial_concurrency, minimum=min_concurrency, maximum=self.max_concurrency)
+        self.running = 0
+        self._queue: List[_QueuedCall] = []
+        self._sequence = itertools.count()
+
+        # Statistics
+        self.total_scheduled = 0
+        self.total_cancelled = 0
+        self.max_queue_depth = 0
+        self.recent_waits: Dict[int, deque] = {
+            priority: deque(maxlen=200) for priority in PRIORITY_NAMES
+        }
+        self.wait_totals: Dict[int, Dict[str, float]] = {
+            priority: {"calls": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+        print(f" LLMScheduler initialized (concurrency limit: {self.limit.slots}, adaptive "
+              f"{int(self.limit.minimum)}-{int(self.limit.maximum)})")
+
+    @property
+    def concurrency_limit(self) -> int:
+        return self.limit.slots
+
+    def priority_for(self, call_type: Optional[LLMCallType]) -> int:
+        """Map an LLM call type to its scheduling priority."""
+        return CALL_TYPE_PRIORITIES.get(call_type, PRIORITY_CHAT)
+
+    def _dispatch(self):
+        """Hand free slots to the highest priority queued calls."""
+        while self._queue and self.running < self.concurrency_limit:
+            queued = heapq.heappop(self._queue)
+            if queued.future.done():
+                continue  # Cancelled while queued
+            self.running += 1
+            queued.future.set_result(True)
+
+    async def acquire(
+        self,
+        call_type: Optional[LLMCallType] = None,
+        owner_id: Optional[str] = None
+    ) -> float:
+        """
+        Wait for a free slot.
+
+        Returns:
+            Seconds spent queued
+
+        Raises:
+            LLMCallCancelled: if cancel_owner() was called for this owner while queued
+        """
+        priority = self.priority_for(call_type)
+        start = time.monotonic()
+
+        if self.running < self.concurrency_limit and not self._queue:
+            self.running += 1
+        else:
+            queued = _QueuedCall(
+                priority=priority,
+                sequence=next(self._sequence),
+                future=asyncio.get_running_loop().create_future(),
+                owner_id=owner_id,
+                call_type=call_type
+            )
+            heapq.heappush(self._queue, queued)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            self._dispatch()
+
+            try:
+                await queued.future
+            except asyncio.CancelledError:
+                # The waiting task itself was cancelled. If a slot was already
+                # handed to us, give it back so it isn't leaked (a call failed
+                # by cancel_owner never got one).
+                if queued.future.done() and not queued.future.cancelled():
+                    if queued.future.exception() is None:
+                        self.release()
+                else:
+                    queued.future.cancel()
+                raise
+
+        wait_time = time.monotonic() - start
+        self._record_wait(priority, wait_time)
+        return wait_time
+
+    def try_acquire(self) -> bool:
+        """
+        Take a free slot without waiting (e.g. for a hedge request).
+        Fails if the limit is reached or calls are queued - they go first.
+        Give the slot back with release().
+        """
+        if self.running < self.concurrency_limit and not self._queue:
+            self.running += 1
+            return True
+        return False
+
+    def release(self):
+        """Give a slot back and wake the next queued call."""
+        self.running = max(0, self.running - 1)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        call_type: Optional[LLMCallType] = None,
+        owner_id: Optional[str] = None
+    ):
+        """Hold a scheduler slot for the duration of the `async with` block."""
+        wait_time = await self.acquire(call_type, owner_id)
+        try:
+            yield wait_time
+        finally:
+            self.release()
+
+    def on_success(self):
+        """A provider call succeeded: grow the limit a little."""
+        before = self.limit.slots
+        self.limit.on_success()
+        if self.limit.slots > before:
+            self._dispatch()
+
+    def on_overload(self, reason: str):
+        """The provider pushed back (rate limit or timeout): cut the limit."""
+        if self.limit.on_overload():
+            print(f" LLMScheduler concurrency limit cut to {self.limit.slots} ({reason})")
+
+    def queued_for(self, owner_id: str) -> int:
+        """Number of calls `owner_id` currently has waiting for a slot."""
+        return sum(1 for queued in self._queue if queued.owner_id == owner_id and not queued.future.done())
+
+    def cancel_owner(self, owner_id: str) -> int:
+        """
+        Cancel every queued call belonging to `owner_id` (e.g. a conversation).
+
+        Returns:
+            Number of queued calls that were cancelled
+        """
+        cancelled = 0
+        for queued in self._queue:
+            if queued.owner_id == owner_id and not queued.future.done():
+                queued.future.set_exception(
+                    LLMCallCancelled(f"LLM call cancelled: {owner_id} went away")
+                )
+                cancelled += 1
+
+        if cancelled:
+            self._queue = [q for q in self._queue if not q.future.done()]
+            heapq.heapify(self._queue)
+            self.total_cancelled += cancelled
+            print(f" LLMScheduler cancelled {cancelled} queued call(s) for {owner_id}")
+
+        return cancelled
+
+    def _record_wait(self, priority: int, wait_time: float):
+        self.total_scheduled += 1
+        self.recent_waits.setdefault(priority, deque(maxlen=200)).append(wait_time)
+        totals = self.wait_totals.setdefault(priority, {"calls": 0, "total_wait": 0.0, "max_wait": 0.0})
+        totals["calls"] += 1
+        totals["total_wait"] += wait_time
+        totals["max_wait"] = max(totals["max_wait"], wait_time)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and per-priority wait statistics."""
+        queue_depth: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for queued in self._queue:
+            if not queued.future.done():
+                queue_depth[PRIORITY_NAMES.get(queued.priority, str(queued.priority))] += 1
+
+        wait_stats = {}
+        for priority, totals in self.wait_totals.items():
+            recent = sorted(self.recent_waits.get(priority, []))
+            wait_stats[PRIORITY_NAMES.get(priority, str(priority))] = {
+                "calls": int(totals["calls"]),
+                "avg_wait_seconds": totals["total_wait"] / totals["calls"] if totals["calls"] else 0.0,
+                "p95_wait_seconds": recent[int(len(recent) * 0.95) - 1] if len(recent) >= 20 else (recent[-1] if recent else 0.0),
+                "max_wait_seconds": totals["max_wait"],
+            }
+
+        return {
+            "concurrency_limit": self.concurrency_limit,
+            "concurrency_limit_exact": round(self.limit.value, 2),
+            "min_concurrency": int(self.limit.minimum),
+            "max_concurrency": self.max_concurrency,
+            "limit_increases": self.limit.increases,
+            "limit_decreases": self.limit.decreases,
+            "running": self.running,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "total_scheduled": self.total_scheduled,
+            "total_cancelled": self.total_cancelled,
+            "wait_by_priority": wait_stats,
+        }
+
+
+# Create singleton instance (this process's share of the configured concurrency)
+_processes = limit_processes()
+llm_scheduler = LLMScheduler(
+    max_concurrency=max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "16")) // _processes),
+    min_concurrency=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+    initial_concurrency=max(1, int(os.getenv("LLM_INITIAL_CONCURRENCY", "4")) // _processes)
+)
+
+
+# Export
+__all__ = [
+    'LLMScheduler',
+    'AIMDLimit',
+    'LLMCallCancelled',
+    'llm_scheduler',
+    'PRIORITY_INTERACTIVE',
+    'PRIORITY_CHAT',
+    'PRIORITY_NARRATION'
+]
@@ -0,0 +1,140 @@
+"""
+Model Routing - Per-Call-Type Model, Temperature, Output Cap and Timeout
+========================================================================
+Not every LLM call needs the big model. A one-word intent label or a
+two-sentence progress narration is served faster (and cheaper) by the
+provider's fast model, while planning and code generation keep the
+default model.
+
+Each call type has a ModelRoute:
+- model:             "default", "fast" (resolved by the provider) or a concrete model name
+- temperature:       used when the caller doesn't pass one
+- max_output_tokens: output cap for the call
+- timeout:           seconds the whole stream may take before it counts as a timeout
+- escalate_to:       optional stronger model for a cascade (structured calls only):
+                     the cheap model answers first, and the call is repeated on
+                     `escalate_to` if the JSON is invalid or its "confidence"
+                     is below `min_confidence`
+
+Override any route with a JSON file (LLM_ROUTES=routes.json):
+    {"plan": {"model": "fast", "escalate_to": "default"}, "code": {"timeout": 240}}
+
+SERVER SIDE FILE
+"""
+
+import json
+import os
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, Any, List, Optional
+
+from ..models.message_models import LLMCallType
+
+
+MODEL_DEFAULT = "default"
+MODEL_FAST = "fast"
+
+
+@dataclass
+class ModelRoute:
+    """
+    How calls of one type are served.
+    """
+    model: str = MODEL_DEFAULT
+    temperature: float = 0.7
+    max_output_tokens: int = 8192
+    timeout: float = 120.0
+    escalate_to: Optional[str] = None       # Cascade target (None = no cascade)
+    min_confidence: Optional[float] = None  # Escalate when result["confidence"] is below this
+
+    def cascade(self) -> List[str]:
+        """Models to try, cheapest first."""
+        if self.escalate_to and self.escalate_to != self.model:
+            return [self.model, self.escalate_to]
+        return [self.model]
+
+
+DEFAULT_ROUTES: Dict[LLMCallType, ModelRoute] = {
+    LLMCallType.INTENT: ModelRoute(
+        model=MODEL_FAST, temperature=0.3, max_output_tokens=512, timeout=20,
+        escalate_to=MODEL_DEFAULT, min_confidence=0.6
+    ),
+    LLMCallType.PLAN: ModelRoute(model=MODEL_DEFAULT, temperature=0.3, max_output_tokens=4096, timeout=60),
+    LLMCallType.CODE: ModelRoute(model=MODEL_DEFAULT, temperature=0.5, max_output_tokens=8192, timeout=180),
+    LLMCallType.ERROR_ANALYSIS: ModelRoute(
+        model=MODEL_FAST, temperature=0.3, max_output_tokens=1024, timeout=30,
+        escalate_to=MODEL_DEFAULT
+    ),
+    LLMCallType.NARRATION: ModelRoute(model=MODEL_FAST, temperature=0.7, max_output_tokens=300, timeout=20),
+    LLMCallType.CHAT: ModelRoute(model=MODEL_DEFAULT, temperature=0.7, max_output_tokens=2048, timeout=90),
+}
+
+
+class ModelRouter:
+    """
+    Looks up the route for a call type and counts cascade escalations.
+    """
+
+    def __init__(self, routes: Optional[Dict[LLMCallType, ModelRoute]] = None):
+        self.routes: Dict[LLMCallType, ModelRoute] = dict(DEFAULT_ROUTES)
+        self.routes.update(routes or {})
+
+        # Statistics
+        self.cascade_calls: Dict[str, int] = {}
+        self.escalations: Dict[str, Dict[str, int]] = {}  # call type -> reason -> count
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        routes_path = os.getenv("LLM_ROUTES")
+        if not routes_path:
+            return cls()
+
+        with open(routes_path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+
+        routes = {}
+        for call_type_name, fields in overrides.items():
+            call_type = LLMCallType(call_type_name)
+            routes[call_type] = replace(DEFAULT_ROUTES.get(call_type, ModelRoute()), **fields)
+        print(f" Model routes loaded from {routes_path} ({', '.join(overrides)})")
+        return cls(routes)
+
+    def route(self, call_type: LLMCallType) -> ModelRoute:
+        return self.routes.get(call_type) or ModelRoute()
+
+    def escalation_reason(self, route: ModelRoute, result: Any) -> Optional[str]:
+        """Why a cheap model's parsed result should be retried on the stronger model (None = accept it)."""
+        if route.min_confidence is None or not isinstance(result, dict):
+            return None
+        confidence = result.get("confidence")
+        if isinstance(confidence, (int, float)) and confidence < route.min_confidence:
+            return "low_confidence"
+        return None
+
+    def record_cascade(self, call_type: LLMCallType, escalated_because: Optional[str] = None):
+        if escalated_because is None:
+            self.cascade_calls[call_type.value] = self.cascade_calls.get(call_type.value, 0) + 1
+            return
+        reasons = self.escalations.setdefault(call_type.value, {})
+        reasons[escalated_because] = reasons.get(escalated_because, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Routing table and escalation counts (shown in /health)."""
+        escalation_rates = {}
+        for call_type, calls in self.cascade_calls.items():
+            escalated = sum(self.escalations.get(call_type, {}).values())
+            escalation_rates[call_type] = escalated / calls if calls else 0.0
+        return {
+            "routes": {call_type.value: asdict(route) for call_type, route in self.routes.items()},
+            "cascade_calls": self.cascade_calls,
+            "escalations": self.escalations,
+            "escalation_rates": escalation_rates,
+        }
+
+
+__all__ = [
+    'ModelRoute',
+    'ModelRouter',
+    'DEFAULT_ROUTES',
+    'MODEL_DEFAULT',
+    'MODEL_FAST'
+]
@@ -0,0 +1,344 @@
+"""
+Plan Cache - Near-Duplicate Request Matching
+============================================
+Users phrase the same request in slightly different ways
+("create a rounded blue button" vs "please make me a rounded blue buttons").
+Each phrasing used to cost a full planning round trip.
+
+This cache keeps a local similarity index over normalized request text:
+1. Normalize: lowercase, strip punctuation, drop filler/request verbs
+2. Shingle: single words plus sorted word pairs within each phrase, so
+   "blue rounded button" and "rounded blue button" shingle the same
+3. MinHash: fixed-size signature estimating Jaccard similarity
+4. LSH: band the signatures so lookups only compare likely candidates
+
+Ignoring word order would let "red button with blue text" match "blue
+button with red text". Words are bound to the others in their phrase
+(the run between filler words), and a match is vetoed when the two
+requests bind a shared word to different shared words: "red" goes with
+"button" in one and with "text" in the other. Anything else - extra or
+missing words, a phrase split differently - is left to the similarity.
+
+Entries are scoped by project_id, so a plan is only reused in the project
+it was made for (and keeps matching after that plan has written files).
+Requests without a project aren't cached.
+
+When a new request is at least `threshold` similar to a stored one, the
+stored ExecutionPlan is reused and the planning LLM call is skipped.
+
+No network model is involved - everything runs locally.
+
+SERVER SIDE FILE
+"""
+
+import copy
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Any, FrozenSet, List, Optional, Set, Tuple
+
+from ..models.message_models import ExecutionPlan
+
+
+# Words that don't change what the user is asking for
+STOPWORDS = {
+    "a", "an", "the", "please", "can", "could", "would", "you", "me", "i", "my",
+    "for", "to", "of", "with", "and", "that", "this", "it", "some", "which",
+    "want", "need", "like", "id", "lets", "let", "us", "just", "also", "new",
+    "create", "make", "build", "generate", "add", "write", "implement", "give",
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+@dataclass
+class _PlanEntry:
+    request: str
+    scope: str
+    shingles: Set[str]
+    bindings: Dict[str, FrozenSet[str]]
+    signature: Tuple[int, ...]
+    plan: ExecutionPlan
+    stored_at: float
+    hits: int = 0
+
+
+class PlanCache:
+    """
+    MinHash/LSH index mapping request text to previously created plans.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_permutations: int = 64,
+        bands: int = 16,
+        max_entries: int = 1000,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        if num_permutations % bands != 0:
+            raise ValueError("num_permutations must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_permutations = num_permutations
+        self.bands = bands
+        self.rows_per_band = num_permutations // bands
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # Deterministic permutation parameters (stable across restarts)
+        self._permutations = [
+            (
+                int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_MERSENNE_PRIME - 1) + 1,
+                int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME,
+            )
+            for i in range(num_permutations)
+        ]
+
+        self._entries: "OrderedDict[str, _PlanEntry]" = OrderedDict()  # entry_id -> entry
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}  # (band, band_hash) -> entry_ids
+
+        # Statistics
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.candidates_checked = 0
+        self.binding_conflicts = 0
+        self.unscoped = 0
+        self.recent_hits: deque = deque(maxlen=50)
+
+        print(f" PlanCache initialized (threshold: {self.threshold})")
+
+    # ------------------------------------------------------------------
+    # Text processing
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _singular(word: str) -> str:
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            return word[:-1]
+        return word
+
+    def phrases(self, text: str) -> List[List[str]]:
+        """Runs of content words between filler words, singularized ("red button with blue text" -> [red, button], [blue, text])."""
+        phrases: List[List[str]] = [[]]
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word in STOPWORDS:
+                if phrases[-1]:
+                    phrases.append([])
+                continue
+            phrases[-1].append(self._singular(word))
+        return [phrase for phrase in phrases if phrase]
+
+    def normalize(self, text: str) -> List[str]:
+        """Lowercase, strip punctuation and filler words, crude singularization."""
+        return [word for phrase in self.phrases(text) for word in phrase]
+
+    def shingles(self, text: str) -> Set[str]:
+        """Single words plus every sorted word pair within a phrase (order-insensitive)."""
+        shingles: Set[str] = set()
+        for phrase in self.phrases(text):
+            shingles.update(phrase)
+            shingles.update(
+                " ".join(sorted((first, second)))
+                for i, first in enumerate(phrase)
+                for second in phrase[i + 1:]
+                if first != second
+            )
+        return shingles
+
+    def bindings(self, text: str) -> Dict[str, FrozenSet[str]]:
+        """Each word with the other words of its phrases ("red button" -> red: {button}, button: {red})."""
+        bound: Dict[str, Set[str]] = {}
+        for phrase in self.phrases(text):
+            for word in phrase:
+                bound.setdefault(word, set()).update(other for other in phrase if other != word)
+        return {word: frozenset(others) for word, others in bound.items()}
+
+    @staticmethod
+    def swapped(bindings_a: Dict[str, FrozenSet[str]], bindings_b: Dict[str, FrozenSet[str]]) -> bool:
+        """Whether a word both requests share is bound to different shared words in each (swapped attributes)."""
+        shared = bindings_a.keys() & bindings_b.keys()
+        for word in shared:
+            in_a = bindings_a[word] & shared
+            in_b = bindings_b[word] & shared
+            if in_a - in_b and in_b - in_a:
+                return True
+        return False
+
+    @staticmethod
+    def scope(project_context: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Plans are only shared within one project (None: no project, not cached)."""
+        project_id = (project_context or {}).get("project_id")
+        return str(project_id) if project_id else None
+
+    def _signature(self, shingles: Set[str]) -> Tuple[int, ...]:
+        hashed = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "big")
+            for s in shingles
+        ]
+        if not hashed:
+            return tuple([_MAX_HASH] * self.num_permutations)
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashed)
+            for a, b in self._permutations
+        )
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * self.rows_per_band:(band + 1) * self.rows_per_band])
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def _estimated_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+        return matches / len(sig_a)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def lookup(self, request: str, project_context: Optional[Dict[str, Any]] = None) -> Optional[ExecutionPlan]:
+        """
+        Find a stored plan for a near-duplicate request in the same project.
+
+        Returns:
+            A copy of the stored plan (with a fresh plan_id), or None
+        """
+        self.lookups += 1
+        scope = self.scope(project_context)
+        if scope is None:
+            self.unscoped += 1
+            self.misses += 1
+            return None
+        shingles = self.shingles(request)
+        if not shingles:
+            self.misses += 1
+            return None
+
+        bindings = self.bindings(request)
+        signature = self._signature(shingles)
+        candidate_ids: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidate_ids.update(self._buckets.get(band_key, ()))
+
+        now = time.time()
+        best: Optional[Tuple[float, str]] = None
+        for entry_id in candidate_ids:
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.scope != scope:
+                continue
+            if now - entry.stored_at > self.ttl_seconds:
+                self._remove(entry_id)
+                continue
+            self.candidates_checked += 1
+            similarity = self._estimated_similarity(signature, entry.signature)
+            if similarity < self.threshold:
+                continue
+            if self.swapped(entry.bindings, bindings):
+                # Same words, different pairing ("red button, blue text" vs "blue button, red text")
+                self.binding_conflicts += 1
+                continue
+            if best is None or similarity > best[0]:
+                best = (similarity, entry_id)
+
+        if best is None:
+            self.misses += 1
+            return None
+
+        similarity, entry_id = best
+        entry = self._entries[entry_id]
+        entry.hits += 1
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        self.recent_hits.append({
+            "request": request[:100],
+            "matched_request": entry.request[:100],
+            "similarity": round(similarity, 3),
+            "timestamp": now,
+        })
+        print(f" PlanCache hit ({similarity:.2f}): '{request[:50]}' ~ '{entry.request[:50]}'")
+
+        plan = copy.deepcopy(entry.plan)
+        plan.plan_id = str(uuid.uuid4())
+        return plan
+
+    def store(self, request: str, plan: ExecutionPlan, project_context: Optional[Dict[str, Any]] = None):
+        """Remember the plan created for a request in a project."""
+        scope = self.scope(project_context)
+        shingles = self.shingles(request)
+        if scope is None or not shingles:
+            return
+
+        signature = self._signature(shingles)
+        entry_id = hashlib.sha256((scope + "|" + " ".join(sorted(shingles))).encode("utf-8")).hexdigest()
+        if entry_id in self._entries:
+            self._remove(entry_id)
+
+        self._entries[entry_id] = _PlanEntry(
+            request=request,
+            scope=scope,
+            shingles=shingles,
+            bindings=self.bindings(request),
+            signature=signature,
+            plan=copy.deepcopy(plan),
+            stored_at=time.time()
+        )
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(entry_id)
+        self.stores += 1
+
+        while len(self._entries) > self.max_entries:
+            oldest_id = next(iter(self._entries))
+            self._remove(oldest_id)
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band_key in self._band_keys(entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self):
+        """Forget every stored plan."""
+        self._entries.clear()
+        self._buckets.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit metrics (shown in /health)."""
+        recent_similarities = [hit["similarity"] for hit in self.recent_hits]
+        return {
+            "threshold": self.threshold,
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "stores": self.stores,
+            "binding_conflicts": self.binding_conflicts,
+            "unscoped_lookups": self.unscoped,
+            "avg_candidates_per_lookup": self.candidates_checked / self.lookups if self.lookups else 0.0,
+            "avg_hit_similarity": sum(recent_similarities) / len(recent_similarities) if recent_similarities else 0.0,
+            "recent_hits": list(self.recent_hits)[-10:],
+        }
+
+
+# Create singleton instance
+plan_cache = PlanCache(
+    threshold=float(os.getenv("PLAN_CACHE_THRESHOLD", "0.8"))
+)
+
+
+# Export
+__all__ = ['PlanCache', 'plan_cache']
@@ -0,0 +1,188 @@
+"""
+Prompt Cache - Reuse Large Static Prompt Prefixes
+=================================================
+Agents send the same large, static system instruction with every call
+(the coding agent's instructions are several KB and go out once per
+plan step). Providers that support cached content can store that prefix
+once and bill later calls at the cached-token rate.
+
+PromptCache manages the cache handles:
+- A handle is created per (model, system instruction) the first time a
+  large enough prefix is seen (concurrent callers share one creation)
+- Handles live for `ttl` seconds; a handle close to expiry is refreshed
+  on its next use instead of being recreated
+- If creating or refreshing fails, or the provider has no caching, calls
+  fall back to sending the full prompt; a failing model is not retried
+  for `retry_unavailable_after` seconds
+- A handle the provider no longer knows is invalidated and recreated
+
+Cached tokens are recorded per call in api_usage (cached_tokens), so the
+savings show up in /api/usage.
+
+Configure with:
+    PROMPT_CACHE_ENABLED=true
+    PROMPT_CACHE_TTL_SECONDS=3600
+    PROMPT_CACHE_MIN_TOKENS=1024
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+from ..utils.prompt_budget import estimate_tokens
+from .llm_providers import LLMProvider
+
+
+@dataclass
+class CachedPrefix:
+    """
+    One provider-side cached prompt prefix.
+    """
+    name: str           # Provider handle
+    model: str
+    tokens: int         # Tokens stored in the cache
+    expires_at: float   # time.monotonic() deadline
+    uses: int = 0
+
+
+class PromptCache:
+    """
+    Creates, refreshes and hands out cached-prefix handles.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        min_tokens: int = 1024,
+        max_entries: int = 32,
+        retry_unavailable_after: float = 600.0
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.retry_unavailable_after = retry_unavailable_after
+
+        self._entries: "OrderedDict[str, CachedPrefix]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._unavailable_until: Dict[str, float] = {}  # model -> monotonic time
+
+        # Statistics
+        self.hits = 0
+        self.creates = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.invalidations = 0
+        self.skipped_small = 0
+
+        print(f" PromptCache initialized ({'enabled' if enabled else 'disabled'}, ttl: {ttl:g}s, "
+              f"min prefix: {min_tokens} tokens)")
+
+    @staticmethod
+    def _key(model: str, system_instruction: str) -> str:
+        return hashlib.sha256(f"{model}\x00{system_instruction}".encode("utf-8")).hexdigest()
+
+    def _mark_unavailable(self, model: str, error: Exception, action: str):
+        self.failures += 1
+        self._unavailable_until[model] = time.monotonic() + self.retry_unavailable_after
+        print(f" Prompt cache {action} failed for {model}, sending full prompts for "
+              f"{self.retry_unavailable_after:g}s: {error}")
+
+    async def get_prefix(
+        self,
+        provider: LLMProvider,
+        model: str,
+        system_instruction: Optional[str]
+    ) -> Optional[CachedPrefix]:
+        """
+        Handle for this static prefix, or None when the call should send the full prompt.
+        """
+        if not self.enabled or not system_instruction or not provider.supports_prompt_cache:
+            return None
+        if estimate_tokens(system_instruction) < self.min_tokens:
+            self.skipped_small += 1
+            return None
+        if self._unavailable_until.get(model, 0.0) > time.monotonic():
+            return None
+
+        key = self._key(model, system_instruction)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:  # One create/refresh per prefix at a time
+            entry = self._entries.get(key)
+            now = time.monotonic()
+
+            if entry is not None and entry.expires_at - now <= self.refresh_margin:
+                if entry.expires_at > now:
+                    try:
+                        await provider.refresh_cached_prefix(entry.name, self.ttl)
+                        entry.expires_at = time.monotonic() + self.ttl
+                        self.refreshes += 1
+                    except Exception as e:
+                        print(f" Prompt cache refresh failed for {entry.name}, recreating: {e}")
+                        entry = None
+                else:
+                    entry = None  # Expired on the provider side already
+                if entry is None:
+                    self._entries.pop(key, None)
+
+            if entry is None:
+                try:
+                    name, tokens = await provider.create_cached_prefix(model, system_instruction, self.ttl)
+                except Exception as e:
+                    self._mark_unavailable(model, e, "create")
+                    return None
+                entry = CachedPrefix(name=name, model=model, tokens=tokens, expires_at=time.monotonic() + self.ttl)
+                self._entries[key] = entry
+                self.creates += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)  # Oldest handle just expires on the provider side
+            else:
+                self.hits += 1
+
+            self._entries.move_to_end(key)
+            entry.uses += 1
+            return entry
+
+    def invalidate(self, prefix: CachedPrefix):
+        """Forget a handle the provider rejected (it is recreated on next use)."""
+        for key, entry in list(self._entries.items()):
+            if entry.name == prefix.name:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache handle counters (shown in /health)."""
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "active_handles": len(self._entries),
+            "cached_prefix_tokens": sum(entry.tokens for entry in self._entries.values()),
+            "hits": self.hits,
+            "creates": self.creates,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "invalidations": self.invalidations,
+            "skipped_small": self.skipped_small,
+            "unavailable_models": [model for model, until in self._unavailable_until.items() if until > now],
+        }
+
+
+# Create singleton instance
+prompt_cache = PromptCache(
+    enabled=os.getenv("PROMPT_CACHE_ENABLED", "true").lower() != "false",
+    ttl=float(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600")),
+    min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+)
+
+
+# Export
+__all__ = ['PromptCache', 'CachedPrefix', 'prompt_cache']
@@ -0,0 +1,312 @@
+"""
+Rate Limiter - Per-Tenant Token Buckets
+=======================================
+Decides when an LLM call is allowed to go out to Gemini.
+
+Every tenant (user/project) gets its own token bucket, so one busy user can
+only burn through their own budget. A shared global bucket enforces the
+provider-wide ceiling. When calls have to queue, user-visible calls
+(intent, planning, code, chat) are served before background calls
+(progress narration).
+
+The buckets live in this process. With JOB_BACKEND=sqlite the API and
+its job worker processes each get an equal share of the configured
+limits (see limit_processes).
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import bisect
+import itertools
+import os
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from ..models.message_models import LLMCallType
+
+
+# Priority classes (lower value = served first)
+PRIORITY_USER_VISIBLE = 0
+PRIORITY_BACKGROUND = 1
+
+PRIORITY_NAMES = {
+    PRIORITY_USER_VISIBLE: "user_visible",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# Calls nobody is actively waiting on
+BACKGROUND_CALL_TYPES = {LLMCallType.NARRATION}
+
+
+def limit_processes() -> int:
+    """
+    How many processes share the configured provider limits.
+
+    LLM_LIMIT_PROCESSES if set; with JOB_BACKEND=sqlite the API process
+    plus its JOB_WORKER_PROCESSES job workers; otherwise 1.
+    """
+    default = 1
+    if os.getenv("JOB_BACKEND", "memory").lower() == "sqlite":
+        default = int(os.getenv("JOB_WORKER_PROCESSES", "2")) + 1
+    return max(1, int(os.getenv("LLM_LIMIT_PROCESSES", str(default))))
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills
+    continuously at `refill_per_second`. One token = one request.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.last_used = self.last_refill
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.last_refill = now
+
+    def available(self) -> bool:
+        """True if at least one whole token is available right now."""
+        self._refill()
+        return self.tokens >= 1.0
+
+    def consume(self):
+        """Take one token (caller must check available() first)."""
+        self._refill()
+        self.tokens -= 1.0
+        self.last_used = time.monotonic()
+
+    def time_until_available(self) -> float:
+        """Seconds until one whole token will be available."""
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.refill_per_second
+
+    def is_idle(self, idle_seconds: float) -> bool:
+        """True if the bucket is full and hasn't been used for a while."""
+        self._refill()
+        return self.tokens >= self.capacity and time.monotonic() - self.last_used > idle_seconds
+
+
+class RateLimiter:
+    """
+    Per-tenant token bucket rate limiter with a global ceiling and priority classes.
+
+    Usage:
+        wait_time = await rate_limiter.acquire(tenant_key, PRIORITY_USER_VISIBLE)
+    """
+
+    MIN_POLL_INTERVAL = 0.01  # Avoid spinning while a higher priority waiter claims a token
+
+    def __init__(
+        self,
+        global_requests_per_minute: float = 15,  # Conservative limit for free tier
+        global_burst: float = 3,
+        tenant_requests_per_minute: float = 8,
+        tenant_burst: float = 3,
+        idle_bucket_seconds: float = 600
+    ):
+        self.global_requests_per_minute = global_requests_per_minute
+        self.tenant_requests_per_minute = tenant_requests_per_minute
+        self.tenant_burst = tenant_burst
+        self.idle_bucket_seconds = idle_bucket_seconds
+
+        self.global_bucket = TokenBucket(global_burst, global_requests_per_minute / 60.0)
+        self.tenant_buckets: Dict[str, TokenBucket] = {}
+
+        # Waiters sorted by (priority, arrival order)
+        self._waiters: List[Tuple[int, int, str]] = []
+        self._sequence = itertools.count()
+        self._condition = asyncio.Condition()
+
+        # Statistics
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.recent_waits: deque = deque(maxlen=200)  # (tenant_key, priority, wait_seconds)
+        self.priority_stats: Dict[int, Dict[str, float]] = {
+            priority: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+        self.tenant_stats: Dict[str, Dict[str, float]] = {}
+
+        print(f" RateLimiter initialized ({global_requests_per_minute:g} rpm global, "
+              f"{tenant_requests_per_minute:g} rpm per tenant)")
+
+    def priority_for(self, call_type: Optional[LLMCallType]) -> int:
+        """Map an LLM call type to its priority class."""
+        if call_type in BACKGROUND_CALL_TYPES:
+            return PRIORITY_BACKGROUND
+        return PRIORITY_USER_VISIBLE
+
+    def _get_bucket(self, tenant_key: str) -> TokenBucket:
+        bucket = self.tenant_buckets.get(tenant_key)
+        if bucket is None:
+            bucket = TokenBucket(self.tenant_burst, self.tenant_requests_per_minute / 60.0)
+            self.tenant_buckets[tenant_key] = bucket
+        return bucket
+
+    def _prune_idle_buckets(self):
+        """Drop buckets for tenants that have gone quiet so memory stays flat."""
+        waiting_tenants = {tenant_key for _, _, tenant_key in self._waiters}
+        for tenant_key in list(self.tenant_buckets.keys()):
+            if tenant_key in waiting_tenants:
+                continue
+            if self.tenant_buckets[tenant_key].is_idle(self.idle_bucket_seconds):
+                del self.tenant_buckets[tenant_key]
+
+    def _try_grant(self, waiter: Tuple[int, int, str]) -> bool:
+        """Grant a token to `waiter` if its tenant and the global bucket allow it."""
+        tenant_bucket = self._get_bucket(waiter[2])
+        if not tenant_bucket.available() or not self.global_bucket.available():
+            return False
+
+        # A waiter ahead of us that could go right now has first claim
+        # on the shared global token.
+        for other in self._waiters:
+            if other == waiter:
+                break
+            if self._get_bucket(other[2]).available():
+                return False
+
+        tenant_bucket.consume()
+        self.global_bucket.consume()
+        return True
+
+    def _time_until_grantable(self, waiter: Tuple[int, int, str]) -> float:
+        tenant_wait = self._get_bucket(waiter[2]).time_until_available()
+        global_wait = self.global_bucket.time_until_available()
+        return max(tenant_wait, global_wait, self.MIN_POLL_INTERVAL)
+
+    async def acquire(self, tenant_key: str, priority: int = PRIORITY_USER_VISIBLE) -> float:
+        """
+        Wait until this tenant may make one request.
+
+        Returns:
+            Seconds spent queued (0.0 if the call went straight through)
+        """
+        start = time.monotonic()
+        waiter = (priority, next(self._sequence), tenant_key)
+
+        async with self._condition:
+            bisect.insort(self._waiters, waiter)
+            try:
+                while not self._try_grant(waiter):
+                    try:
+                        await asyncio.wait_for(
+                            self._condition.wait(),
+                            timeout=self._time_until_grantable(waiter)
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiters.remove(waiter)
+                self._condition.notify_all()
+
+            self._prune_idle_buckets()
+
+        wait_time = time.monotonic() - start
+        self._record_wait(tenant_key, priority, wait_time)
+        return wait_time
+
+    def try_acquire(self, tenant_key: str) -> bool:
+        """
+        Take a token only if one is free right now and nobody is queued.
+
+        Used for optional extra calls (e.g. hedged requests) that should
+        never wait or jump ahead of queued callers.
+        """
+        if self._waiters:
+            return False
+        tenant_bucket = self._get_bucket(tenant_key)
+        if not tenant_bucket.available() or not self.global_bucket.available():
+            return False
+        tenant_bucket.consume()
+        self.global_bucket.consume()
+        self._record_wait(tenant_key, PRIORITY_BACKGROUND, 0.0)
+        return True
+
+    def _record_wait(self, tenant_key: str, priority: int, wait_time: float):
+        self.total_requests += 1
+        self.total_wait += wait_time
+        self.recent_waits.append((tenant_key, priority, wait_time))
+
+        stats = self.priority_stats.setdefault(priority, {"requests": 0, "total_wait": 0.0, "max_wait": 0.0})
+        stats["requests"] += 1
+        stats["total_wait"] += wait_time
+        stats["max_wait"] = max(stats["max_wait"], wait_time)
+
+        tenant = self.tenant_stats.setdefault(tenant_key, {"requests": 0, "total_wait": 0.0, "max_wait": 0.0})
+        tenant["requests"] += 1
+        tenant["total_wait"] += wait_time
+        tenant["max_wait"] = max(tenant["max_wait"], wait_time)
+
+        # Keep tenant stats bounded
+        if len(self.tenant_stats) > 1000:
+            for key in sorted(self.tenant_stats, key=lambda k: self.tenant_stats[k]["requests"])[:500]:
+                del self.tenant_stats[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get throttling statistics (useful for /health and debugging)."""
+        queued: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _ in self._waiters:
+            queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+
+        most_throttled = sorted(
+            self.tenant_stats.items(),
+            key=lambda item: item[1]["total_wait"],
+            reverse=True
+        )[:10]
+
+        return {
+            "global_requests_per_minute": self.global_requests_per_minute,
+            "tenant_requests_per_minute": self.tenant_requests_per_minute,
+            "tracked_tenants": len(self.tenant_buckets),
+            "queued": queued,
+            "total_requests": self.total_requests,
+            "avg_wait_seconds": self.total_wait / self.total_requests if self.total_requests else 0.0,
+            "by_priority": {
+                PRIORITY_NAMES.get(priority, str(priority)): {
+                    "requests": int(stats["requests"]),
+                    "avg_wait_seconds": stats["total_wait"] / stats["requests"] if stats["requests"] else 0.0,
+                    "max_wait_seconds": stats["max_wait"],
+                }
+                for priority, stats in self.priority_stats.items()
+            },
+            "most_throttled_tenants": {
+                tenant_key: {
+                    "requests": int(stats["requests"]),
+                    "total_wait_seconds": stats["total_wait"],
+                    "max_wait_seconds": stats["max_wait"],
+                }
+                for tenant_key, stats in most_throttled
+            },
+        }
+
+
+# Create singleton instance (this process's share of the configured limits)
+_processes = limit_processes()
+rate_limiter = RateLimiter(
+    global_requests_per_minute=float(os.getenv("LLM_RATE_LIMIT_RPM", "15")) / _processes,
+    global_burst=max(1.0, float(os.getenv("LLM_RATE_LIMIT_BURST", "3")) / _processes),
+    tenant_requests_per_minute=float(os.getenv("LLM_TENANT_RATE_LIMIT_RPM", "8")) / _processes,
+    tenant_burst=max(1.0, float(os.getenv("LLM_TENANT_RATE_LIMIT_BURST", "3")) / _processes)
+)
+
+
+# Export
+__all__ = [
+    'RateLimiter',
+    'TokenBucket',
+    'rate_limiter',
+    'limit_processes',
+    'PRIORITY_USER_VISIBLE',
+    'PRIORITY_BACKGROUND'
+]
@@ -0,0 +1,184 @@
+"""
+Request Deadlines - Degrade Gracefully to Fit a Latency Budget
+==============================================================
+A code-mode message runs intent → plan → several coding steps →
+narration → save, which can take minutes. A client can send a latency
+budget with /api/chat; the coordinator turns it into a deadline on the
+request's LLMCallContext, and every stage checks the time left:
+
+- Narration (progress messages) is skipped once less than
+  `narration_reserve` seconds remain - the fixed fallback text is shown
+- Plan, code and chat calls switch to the fast model, and structured
+  calls stop escalating to the stronger model, below `fast_model_below`
+  seconds
+- Coding stops taking new plan steps when the time left is shorter than
+  one step (the step time is learned from completed steps); the first
+  step always runs
+- Every LLM call's timeout is capped by the time left (never below
+  `min_call_timeout`); a call that runs into that cap fails with
+  DeadlineExceeded - it isn't retried and isn't held against the
+  provider (no circuit breaker failure, no concurrency cut)
+
+Each shortcut is recorded on the call context and reported in the
+response metadata ("deadline").
+
+Configure with:
+    DEADLINE_NARRATION_RESERVE_SECONDS=20
+    DEADLINE_FAST_MODEL_BELOW_SECONDS=45
+    DEADLINE_STEP_SECONDS=15
+
+SERVER SIDE FILE
+"""
+
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+from ..models.message_models import LLMCallType
+from .call_context import LLMCallContext, get_call_context
+from .model_routing import MODEL_FAST
+
+
+# Call types that may be moved to the fast model when time is short
+FAST_MODEL_CALL_TYPES = {LLMCallType.PLAN, LLMCallType.CODE, LLMCallType.CHAT}
+
+
+class DeadlineSkipped(Exception):
+    """An optional LLM call (narration) was skipped to meet the request deadline."""
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """An LLM call timed out because the request's latency budget ran out (not a provider timeout)."""
+    pass
+
+
+class DeadlinePolicy:
+    """
+    Decides which shortcuts a request takes given its remaining time.
+    """
+
+    def __init__(
+        self,
+        narration_reserve: float = 20.0,
+        fast_model_below: float = 45.0,
+        step_seconds: float = 15.0,
+        min_call_timeout: float = 5.0
+    ):
+        self.narration_reserve = narration_reserve
+        self.fast_model_below = fast_model_below
+        self.step_seconds = step_seconds  # Moving average of a coding step's duration
+        self.min_call_timeout = min_call_timeout
+
+        # Statistics
+        self.requests_with_deadline = 0
+        self.deadlines_missed = 0
+        self.calls_out_of_time = 0
+        self.degradations: Dict[str, int] = {}
+
+        print(f" DeadlinePolicy initialized (narration reserve: {narration_reserve:g}s, "
+              f"fast model below: {fast_model_below:g}s, step estimate: {step_seconds:g}s)")
+
+    @classmethod
+    def from_env(cls) -> "DeadlinePolicy":
+        return cls(
+            narration_reserve=float(os.getenv("DEADLINE_NARRATION_RESERVE_SECONDS", "20")),
+            fast_model_below=float(os.getenv("DEADLINE_FAST_MODEL_BELOW_SECONDS", "45")),
+            step_seconds=float(os.getenv("DEADLINE_STEP_SECONDS", "15"))
+        )
+
+    def _degrade(self, call_context: LLMCallContext, what: str, count: int = 1):
+        call_context.degrade(what, count)
+        self.degradations[what] = self.degradations.get(what, 0) + count
+
+    def skip_narration(self) -> bool:
+        """True if narration should be skipped (and records it)."""
+        call_context = get_call_context()
+        remaining = call_context.remaining()
+        if remaining is None or remaining >= self.narration_reserve:
+            return False
+        self._degrade(call_context, "skip_narration")
+        return True
+
+    def cascade(self, call_type: LLMCallType, cascade: List[str]) -> List[str]:
+        """Models to try for a call, cut down when time is short."""
+        call_context = get_call_context()
+        remaining = call_context.remaining()
+        if remaining is None or remaining >= self.fast_model_below:
+            return cascade
+
+        if len(cascade) > 1:
+            self._degrade(call_context, f"skip_escalation_{call_type.value}")
+            cascade = cascade[:1]
+        if call_type in FAST_MODEL_CALL_TYPES and cascade[0] != MODEL_FAST:
+            self._degrade(call_context, f"fast_model_{call_type.value}")
+            cascade = [MODEL_FAST]
+        return cascade
+
+    def call_timeout(self, timeout: float) -> float:
+        """A call's timeout, capped by the time left."""
+        remaining = get_call_context().remaining()
+        if remaining is None:
+            return timeout
+        return min(timeout, max(remaining, self.min_call_timeout))
+
+    def deadline_hit(self, timeout: float, route_timeout: float) -> bool:
+        """Whether a timed-out call ran into the deadline cap rather than its own timeout (and records it)."""
+        if timeout >= route_timeout:
+            return False
+        self.calls_out_of_time += 1
+        self._degrade(get_call_context(), "call_out_of_time")
+        return True
+
+    def allow_step(self, executed: int) -> bool:
+        """Whether another coding step fits (the first one always runs; records a cut step)."""
+        call_context = get_call_context()
+        remaining = call_context.remaining()
+        if executed == 0 or remaining is None or remaining >= self.step_seconds:
+            return True
+        self._degrade(call_context, "cut_plan_steps")
+        return False
+
+    def observe_step(self, seconds: float):
+        """Learn how long a coding step takes."""
+        self.step_seconds = 0.7 * self.step_seconds + 0.3 * seconds
+
+    def start(self, call_context: LLMCallContext, budget_seconds: Optional[float]):
+        """Give a request its deadline."""
+        if budget_seconds is None:
+            return
+        call_context.deadline = time.monotonic() + budget_seconds
+        self.requests_with_deadline += 1
+
+    def report(self, call_context: LLMCallContext, budget_seconds: Optional[float]) -> Optional[Dict[str, Any]]:
+        """What the request's deadline led to (None if it had none)."""
+        if call_context.deadline is None or budget_seconds is None:
+            return None
+        remaining = call_context.remaining()
+        met = remaining >= 0
+        if not met:
+            self.deadlines_missed += 1
+        return {
+            "budget_seconds": budget_seconds,
+            "elapsed_seconds": round(budget_seconds - remaining, 3),
+            "met": met,
+            "degradations": dict(call_context.degradations),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get deadline counters (shown in /health)."""
+        return {
+            "requests_with_deadline": self.requests_with_deadline,
+            "deadlines_missed": self.deadlines_missed,
+            "calls_out_of_time": self.calls_out_of_time,
+            "step_seconds_estimate": round(self.step_seconds, 2),
+            "degradations": self.degradations,
+        }
+
+
+# Create singleton instance
+deadline_policy = DeadlinePolicy.from_env()
+
+
+# Export
+__all__ = ['DeadlinePolicy', 'DeadlineSkipped', 'DeadlineExceeded', 'deadline_policy', 'FAST_MODEL_CALL_TYPES']
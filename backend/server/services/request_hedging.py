@@ -0,0 +1,286 @@
+"""
+Request Hedging - Cut Tail Latency From Slow First Tokens
+=========================================================
+Most LLM calls start streaming quickly, but a few sit for a long time
+before the first token arrives. For hedged call types:
+
+- The primary request is started as usual
+- If no first chunk arrives within the call type's threshold, a second
+  identical request (the hedge) is started
+- Whichever stream produces a chunk first wins; the other is cancelled
+
+The threshold per call type is learned from recent time-to-first-token
+samples (p95 by default, clamped to [min_delay, max_delay]). Until
+`min_samples` calls have been seen, nothing is hedged.
+
+Extra spend is capped by a hedge budget: every eligible call earns
+`budget_ratio` of a hedge credit (up to `burst` credits) and each hedge
+costs one. A hedge also needs a scheduler slot of its own and a free
+provider rate limit token; it never waits for either, so hedges stay
+inside the concurrency limit and the rate limit. The hedge's slot is
+given back as soon as its request is cancelled or finished.
+
+Configure with:
+    LLM_HEDGE_CALL_TYPES=plan,code   (empty = hedging off)
+    LLM_HEDGE_PERCENTILE=0.95
+    LLM_HEDGE_BUDGET_RATIO=0.1
+    LLM_HEDGE_MIN_SAMPLES=20
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Callable, AsyncIterator, Deque, List, Set
+
+from ..models.message_models import LLMCallType
+
+
+class _Attempt:
+    """
+    One request of a (possibly) hedged call, with its first chunk being awaited.
+    """
+
+    def __init__(
+        self,
+        start: Callable[[Dict[str, int]], AsyncIterator[str]],
+        is_hedge: bool,
+        release: Optional[Callable[[], None]] = None
+    ):
+        self.is_hedge = is_hedge
+        self.usage: Dict[str, int] = {}
+        self._release = release  # Gives back a slot held only by this request
+        self.started = time.perf_counter()
+        self.iterator = start(self.usage).__aiter__()
+        self.first_chunk = asyncio.ensure_future(self._read_first_chunk())
+
+    async def _read_first_chunk(self) -> Optional[str]:
+        try:
+            return await self.iterator.__anext__()
+        except StopAsyncIteration:
+            return None  # Empty stream
+
+    async def cancel(self):
+        """Stop this request and close its provider stream."""
+        if not self.first_chunk.done():
+            self.first_chunk.cancel()
+        try:
+            await self.first_chunk
+        except BaseException:
+            pass
+        close = getattr(self.iterator, "aclose", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                pass
+        self.release()
+
+    def release(self):
+        """Give back this request's own slot (once)."""
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+
+class RequestHedger:
+    """
+    Races a second identical request against a slow-starting first one.
+
+    Usage:
+        async for chunk in hedger.stream(call_type, start, usage):
+            ...
+    where start(usage) returns a fresh provider stream.
+    """
+
+    def __init__(
+        self,
+        call_types: Set[LLMCallType],
+        percentile: float = 0.95,
+        budget_ratio: float = 0.1,
+        min_samples: int = 20,
+        min_delay: float = 0.25,
+        max_delay: float = 10.0,
+        burst: float = 3.0
+    ):
+        self.call_types = call_types
+        self.percentile = min(0.999, max(0.5, percentile))
+        self.budget_ratio = max(0.0, budget_ratio)
+        self.min_samples = max(1, min_samples)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.burst = burst
+
+        self.credits = burst
+        self.first_token_samples: Dict[LLMCallType, Deque[float]] = {}
+        self.call_stats: Dict[LLMCallType, Dict[str, int]] = {}
+
+        enabled = ", ".join(sorted(call_type.value for call_type in call_types)) or "off"
+        print(f" RequestHedger initialized (call types: {enabled}, p{int(self.percentile * 100)}, "
+              f"budget {self.budget_ratio:.0%})")
+
+    @classmethod
+    def from_env(cls) -> "RequestHedger":
+        names = [name.strip() for name in os.getenv("LLM_HEDGE_CALL_TYPES", "").split(",") if name.strip()]
+        return cls(
+            call_types={LLMCallType(name) for name in names},
+            percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+            budget_ratio=float(os.getenv("LLM_HEDGE_BUDGET_RATIO", "0.1")),
+            min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        )
+
+    def _stats_for(self, call_type: LLMCallType) -> Dict[str, int]:
+        return self.call_stats.setdefault(call_type, {
+            "calls": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "primary_wins": 0,
+            "budget_denied": 0,
+            "slot_denied": 0,
+            "rate_limit_denied": 0,
+        })
+
+    def threshold(self, call_type: LLMCallType) -> Optional[float]:
+        """Seconds to wait for a first chunk before hedging (None = not yet learned)."""
+        samples = self.first_token_samples.get(call_type)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def _observe_first_token(self, call_type: LLMCallType, latency: float):
+        self.first_token_samples.setdefault(call_type, deque(maxlen=200)).append(latency)
+
+    def _may_hedge(
+        self,
+        call_type: LLMCallType,
+        can_hedge: Optional[Callable[[], bool]],
+        acquire_slot: Optional[Callable[[], bool]],
+        release_slot: Optional[Callable[[], None]]
+    ) -> bool:
+        stats = self._stats_for(call_type)
+        if self.credits < 1.0:
+            stats["budget_denied"] += 1
+            return False
+        if acquire_slot is not None and not acquire_slot():
+            stats["slot_denied"] += 1
+            return False
+        if can_hedge is not None and not can_hedge():
+            if release_slot is not None:
+                release_slot()
+            stats["rate_limit_denied"] += 1
+            return False
+        self.credits -= 1.0
+        stats["hedges"] += 1
+        return True
+
+    async def _race(self, attempts: List[_Attempt]) -> _Attempt:
+        """Return the first attempt to produce a chunk (a failed attempt only wins if it is the last one left)."""
+        pending = list(attempts)
+        while True:
+            done, _ = await asyncio.wait({a.first_chunk for a in pending}, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in list(pending):
+                if attempt.first_chunk not in done:
+                    continue
+                if attempt.first_chunk.exception() is None or len(pending) == 1:
+                    return attempt
+                pending.remove(attempt)
+
+    async def stream(
+        self,
+        call_type: LLMCallType,
+        start: Callable[[Dict[str, int]], AsyncIterator[str]],
+        usage: Optional[Dict[str, int]] = None,
+        can_hedge: Optional[Callable[[], bool]] = None,
+        on_abandoned: Optional[Callable[[Dict[str, int], float], None]] = None,
+        acquire_slot: Optional[Callable[[], bool]] = None,
+        release_slot: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream one call, hedging it if its first chunk is slow.
+
+        Args:
+            call_type: What the call is for (only configured call types are hedged)
+            start: Starts a fresh provider stream, filling the usage dict it is given
+            usage: Receives the winning request's usage
+            can_hedge: Extra gate checked before a hedge is sent (e.g. a free rate limit token)
+            on_abandoned: Called with (usage, started) for each cancelled request
+            acquire_slot: Takes a concurrency slot for the hedge without waiting (False = don't hedge)
+            release_slot: Gives the hedge's slot back
+        """
+        if call_type not in self.call_types:
+            async for chunk_text in start(usage if usage is not None else {}):
+                yield chunk_text
+            return
+
+        self._stats_for(call_type)["calls"] += 1
+        self.credits = min(self.burst, self.credits + self.budget_ratio)
+
+        attempts = [_Attempt(start, is_hedge=False)]
+        winner: Optional[_Attempt] = None
+        try:
+            threshold = self.threshold(call_type)
+            if threshold is not None:
+                done, _ = await asyncio.wait({attempts[0].first_chunk}, timeout=threshold)
+                if not done and self._may_hedge(call_type, can_hedge, acquire_slot, release_slot):
+                    attempts.append(_Attempt(start, is_hedge=True, release=release_slot))
+
+            winner = await self._race(attempts)
+            first_chunk = winner.first_chunk.result()  # Re-raises if every attempt failed
+
+            # The winner's own start time: a censored primary sample would drag the threshold up
+            self._observe_first_token(call_type, time.perf_counter() - winner.started)
+            if len(attempts) > 1:
+                self._stats_for(call_type)["hedge_wins" if winner.is_hedge else "primary_wins"] += 1
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.cancel()
+                    if on_abandoned is not None:
+                        on_abandoned(attempt.usage, attempt.started)
+
+            if first_chunk is not None:
+                yield first_chunk
+            async for chunk_text in winner.iterator:
+                yield chunk_text
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.cancel()
+            if winner is not None:
+                close = getattr(winner.iterator, "aclose", None)
+                if close is not None:
+                    try:
+                        await close()
+                    finally:
+                        winner.release()
+                else:
+                    winner.release()
+                if usage is not None:
+                    usage.update(winner.usage)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hedge counts, win rates and current thresholds per call type (shown in /health)."""
+        per_call_type = {}
+        for call_type, stats in self.call_stats.items():
+            threshold = self.threshold(call_type)
+            per_call_type[call_type.value] = {
+                **stats,
+                "hedge_rate": stats["hedges"] / stats["calls"] if stats["calls"] else 0.0,
+                "hedge_win_rate": stats["hedge_wins"] / stats["hedges"] if stats["hedges"] else 0.0,
+                "threshold_seconds": round(threshold, 4) if threshold is not None else None,
+                "samples": len(self.first_token_samples.get(call_type, ())),
+            }
+        return {
+            "enabled_call_types": sorted(call_type.value for call_type in self.call_types),
+            "percentile": self.percentile,
+            "budget_ratio": self.budget_ratio,
+            "credits": round(self.credits, 2),
+            "by_call_type": per_call_type,
+        }
+
+
+__all__ = ['RequestHedger']
@@ -0,0 +1,313 @@
+"""
+Response Cache - Exact-Match Cache for Structured LLM Calls
+==========================================================
+Intent classification, planning and error analysis prompts recur constantly
+across users. This cache remembers the parsed JSON answer for an exact
+(model, system_instruction, prompt, temperature) combination so a repeat
+call skips the Gemini round trip - and the rate limiter - entirely.
+
+Two tiers:
+- Memory: small LRU (OrderedDict) for the hottest entries
+- Disk:   SQLite table that survives restarts, evicted by total size
+
+Both tiers honour a TTL. Entries can be invalidated one at a time, by call
+type, or all at once.
+
+SERVER SIDE FILE
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + SQLite) cache for parsed structured responses.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "llm_cache.db",
+        default_ttl_seconds: float = 24 * 3600,
+        max_memory_entries: int = 512,
+        max_disk_bytes: int = 50 * 1024 * 1024,
+        enabled: bool = True
+    ):
+        self.db_path = Path(db_path)
+        self.default_ttl_seconds = default_ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = enabled
+
+        # key -> (expires_at, call_type, value_json)
+        self._memory: "OrderedDict[str, Tuple[float, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+
+        # Statistics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if self.enabled:
+            self._init_database()
+
+        print(f" ResponseCache initialized ({'enabled' if self.enabled else 'disabled'}, {self.db_path})")
+
+    def _init_database(self):
+        try:
+            self.connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    call_type TEXT,
+                    value TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self.connection.execute("""
+                CREATE INDEX IF NOT EXISTS idx_response_cache_last_accessed
+                ON response_cache(last_accessed)
+            """)
+            self.connection.execute(
+                "DELETE FROM response_cache WHERE expires_at < ?", (time.time(),)
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            # Memory tier still works without the disk tier
+            print(f" ResponseCache disk tier unavailable: {e}")
+            self.connection = None
+
+    @staticmethod
+    def make_key(
+        model: str,
+        system_instruction: Optional[str],
+        prompt: str,
+        temperature: Optional[float]
+    ) -> str:
+        """Hash the inputs that fully determine a structured response."""
+        payload = json.dumps(
+            [model, system_instruction or "", prompt, temperature],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response.
+
+        Returns:
+            A fresh copy of the cached value, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, _, value_json = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(value_json)
+                del self._memory[key]
+
+            row = self._disk_get(key, now)
+            if row is not None:
+                call_type, value_json, expires_at = row
+                self._memory_put(key, expires_at, call_type, value_json)
+                self.disk_hits += 1
+                return json.loads(value_json)
+
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        key: str,
+        value: Dict[str, Any],
+        call_type: Optional[str] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        """Store a response in both tiers."""
+        if not self.enabled:
+            return
+
+        try:
+            value_json = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # Not cacheable
+
+        now = time.time()
+        expires_at = now + (ttl_seconds if ttl_seconds is not None else self.default_ttl_seconds)
+        call_type = call_type or ""
+
+        with self._lock:
+            self._memory_put(key, expires_at, call_type, value_json)
+            self._disk_put(key, call_type, value_json, now, expires_at)
+            self.stores += 1
+
+    def invalidate(self, key: str) -> bool:
+        """Remove one entry. Returns True if it existed in either tier."""
+        with self._lock:
+            existed = self._memory.pop(key, None) is not None
+            if self.connection is not None:
+                cursor = self.connection.execute(
+                    "DELETE FROM response_cache WHERE cache_key = ?", (key,)
+                )
+                self.connection.commit()
+                existed = existed or cursor.rowcount > 0
+            if existed:
+                self.invalidations += 1
+            return existed
+
+    def invalidate_call_type(self, call_type: str) -> int:
+        """Remove every entry stored for one call type (e.g. after a prompt change)."""
+        with self._lock:
+            keys = [k for k, (_, ct, _) in self._memory.items() if ct == call_type]
+            for k in keys:
+                del self._memory[k]
+            removed = len(keys)
+            if self.connection is not None:
+                cursor = self.connection.execute(
+                    "DELETE FROM response_cache WHERE call_type = ?", (call_type,)
+                )
+                self.connection.commit()
+                removed = max(removed, cursor.rowcount)
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        """Remove everything from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM response_cache")
+                self.connection.commit()
+            self.invalidations += 1
+
+    # ------------------------------------------------------------------
+    # Tier helpers (caller holds self._lock)
+    # ------------------------------------------------------------------
+
+    def _memory_put(self, key: str, expires_at: float, call_type: str, value_json: str):
+        self._memory[key] = (expires_at, call_type, value_json)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, str, float]]:
+        if self.connection is None:
+            return None
+        try:
+            row = self.connection.execute(
+                "SELECT call_type, value, expires_at FROM response_cache WHERE cache_key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= now:
+                self.connection.execute("DELETE FROM response_cache WHERE cache_key = ?", (key,))
+                self.connection.commit()
+                return None
+            self.connection.execute(
+                "UPDATE response_cache SET last_accessed = ? WHERE cache_key = ?",
+                (now, key)
+            )
+            self.connection.commit()
+            return row[0], row[1], row[2]
+        except sqlite3.Error as e:
+            print(f" ResponseCache disk read failed: {e}")
+            return None
+
+    def _disk_put(self, key: str, call_type: str, value_json: str, now: float, expires_at: float):
+        if self.connection is None:
+            return
+        try:
+            self.connection.execute(
+                """INSERT OR REPLACE INTO response_cache
+                   (cache_key, call_type, value, size_bytes, created_at, last_accessed, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (key, call_type, value_json, len(value_json.encode("utf-8")), now, now, expires_at)
+            )
+            self._evict_disk(now)
+            self.connection.commit()
+        except sqlite3.Error as e:
+            print(f" ResponseCache disk write failed: {e}")
+
+    def _evict_disk(self, now: float):
+        """Drop expired rows, then least recently used rows until under the size budget."""
+        self.connection.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM response_cache"
+        ).fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+
+        rows = self.connection.execute(
+            "SELECT cache_key, size_bytes FROM response_cache ORDER BY last_accessed ASC"
+        ).fetchall()
+        to_delete = []
+        for cache_key, size_bytes in rows:
+            if total <= self.max_disk_bytes:
+                break
+            to_delete.append((cache_key,))
+            total -= size_bytes
+        self.connection.executemany("DELETE FROM response_cache WHERE cache_key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters (shown in /health)."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        disk_entries = 0
+        disk_bytes = 0
+        if self.connection is not None:
+            with self._lock:
+                try:
+                    disk_entries, disk_bytes = self.connection.execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM response_cache"
+                    ).fetchone()
+                except sqlite3.Error:
+                    pass
+
+        return {
+            "enabled": self.enabled,
+            "hits": self.memory_hits + self.disk_hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "memory_entries": len(self._memory),
+            "disk_entries": disk_entries,
+            "disk_bytes": disk_bytes,
+        }
+
+
+# Create singleton instance
+response_cache = ResponseCache(
+    db_path=os.getenv("LLM_CACHE_PATH", "llm_cache.db"),
+    default_ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+    enabled=os.getenv("LLM_CACHE_ENABLED", "true").lower() != "false"
+)
+
+
+# Export
+__all__ = ['ResponseCache', 'response_cache']
@@ -0,0 +1,191 @@
+"""
+Single-Flight Request Coalescing
+================================
+When a client retries, or several tabs on the same conversation fire the
+same request, identical LLM calls can be in flight at the same time.
+Single-flight makes them share ONE generation:
+
+- The first caller (the "leader") starts a producer task
+- Later callers with the same key join the existing flight
+- Every event the producer publishes (start, chunk, error, complete) is
+  fanned out to every waiter, so each waiter can drive its own WebSocket
+  callback
+- Late joiners get the events of the current attempt replayed first
+
+If every waiter leaves, the producer task is cancelled.
+
+Each waiter brings its own producer. If the leader's producer fails with
+an error that only concerns the leader (`reelect_on`, e.g. its queued
+scheduler slot was cancelled), only the leader gets the error and the
+next waiter's producer takes over the flight.
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, Type
+
+
+# Event types published by a producer
+EVENT_START = "start"        # payload: seconds spent queued
+EVENT_CHUNK = "chunk"        # payload: text chunk
+EVENT_ERROR = "error"        # payload: error message (a retry may follow)
+EVENT_COMPLETE = "complete"  # payload: full response text
+EVENT_FAILED = "failed"      # payload: exception to raise in every waiter
+
+
+class Flight:
+    """
+    One in-flight generation shared by any number of waiters.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.history: List[Tuple[str, Any]] = []  # Events of the current attempt
+        self.subscribers: List[asyncio.Queue] = []
+        self.producers: Dict[int, Callable[["Flight"], Awaitable[None]]] = {}  # id(queue) -> that waiter's producer
+        self.leader: Optional[asyncio.Queue] = None  # Waiter whose producer is running
+        self.task: Optional[asyncio.Task] = None
+        self.done = False
+
+    def publish(self, event_type: str, payload: Any = None):
+        """Send an event to every waiter."""
+        if event_type == EVENT_START:
+            self.history = []  # A new attempt replaces the old one for late joiners
+        event = (event_type, payload)
+        self.history.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def subscribe(self, producer: Optional[Callable[["Flight"], Awaitable[None]]] = None) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.history:
+            queue.put_nowait(event)
+        self.subscribers.append(queue)
+        if producer is not None:
+            self.producers[id(queue)] = producer
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+        self.producers.pop(id(queue), None)
+        if not self.subscribers and self.task is not None and not self.task.done():
+            # Nobody is waiting for this generation any more
+            self.task.cancel()
+
+
+class SingleFlight:
+    """
+    Registry of in-flight generations keyed by their request parameters.
+    """
+
+    def __init__(self, reelect_on: Tuple[Type[BaseException], ...] = ()):
+        self._flights: Dict[str, Flight] = {}
+        self.reelect_on = reelect_on  # Leader-only failures: hand the flight to the next waiter
+
+        # Statistics
+        self.flights_started = 0
+        self.calls_collapsed = 0
+        self.max_waiters = 0
+        self.leaders_reelected = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash request parameters into a flight key."""
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def join(
+        self,
+        key: str,
+        producer: Callable[[Flight], Awaitable[None]]
+    ) -> Tuple[Flight, asyncio.Queue]:
+        """
+        Join the flight for `key`, starting it with `producer` if none is running.
+        A joining waiter's producer is kept in case the leader has to be replaced.
+
+        Returns:
+            (flight, queue) - read events from the queue, then call flight.unsubscribe(queue)
+        """
+        flight = self._flights.get(key)
+        if flight is None or flight.done:
+            flight = Flight(key)
+            self._flights[key] = flight
+            self.flights_started += 1
+            queue = flight.subscribe(producer)
+            flight.leader = queue
+            flight.task = asyncio.create_task(self._run(flight))
+        else:
+            self.calls_collapsed += 1
+            print(f" SingleFlight: joined in-flight generation ({len(flight.subscribers) + 1} waiters)")
+            queue = flight.subscribe(producer)
+
+        self.max_waiters = max(self.max_waiters, len(flight.subscribers))
+        return flight, queue
+
+    async def _lead(self, flight: Flight):
+        """Run the leader's producer; on a leader-only failure, fail just the leader and elect the next waiter."""
+        while True:
+            leader = flight.leader
+            producer = flight.producers.get(id(leader)) if leader is not None else None
+            if producer is None:
+                # The leader left: any remaining waiter's producer can carry on
+                leader = next((queue for queue in flight.subscribers if id(queue) in flight.producers), None)
+                if leader is None:
+                    raise RuntimeError("No waiter left to produce the flight")
+                flight.leader = leader
+                producer = flight.producers[id(leader)]
+            try:
+                await producer(flight)
+                return
+            except self.reelect_on as e:
+                successor = next(
+                    (queue for queue in flight.subscribers if queue is not leader and id(queue) in flight.producers),
+                    None
+                )
+                if successor is None:
+                    raise
+                leader.put_nowait((EVENT_FAILED, e))
+                flight.producers.pop(id(leader), None)
+                if leader in flight.subscribers:
+                    flight.subscribers.remove(leader)
+                flight.leader = successor
+                self.leaders_reelected += 1
+                print(f" SingleFlight: leader failed ({e}); {len(flight.subscribers)} waiter(s) continue with a new leader")
+
+    async def _run(self, flight: Flight):
+        try:
+            await self._lead(flight)
+        except asyncio.CancelledError:
+            flight.publish(EVENT_FAILED, asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.publish(EVENT_FAILED, e)
+        finally:
+            flight.done = True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing counters."""
+        return {
+            "in_flight": len(self._flights),
+            "flights_started": self.flights_started,
+            "calls_collapsed": self.calls_collapsed,
+            "max_waiters": self.max_waiters,
+            "leaders_reelected": self.leaders_reelected,
+        }
+
+
+__all__ = [
+    'SingleFlight',
+    'Flight',
+    'EVENT_START',
+    'EVENT_CHUNK',
+    'EVENT_ERROR',
+    'EVENT_COMPLETE',
+    'EVENT_FAILED'
+]
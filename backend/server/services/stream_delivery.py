@@ -0,0 +1,174 @@
+"""
+Stream Delivery - Bounded, Coalescing Queue Between LLM Streams and Clients
+==========================================================================
+The LLM stream consumer never waits for a client. Frames produced while
+reading a stream (stream_start, stream_token, stream_complete, ...) are
+put on a per-(conversation, callback, request) channel, and a background
+task hands them to the WebSocket callback in order. Internal callers
+reuse fixed ids ("intent_classification", "coding_narrative", ...), so
+the request keeps concurrent users' streams on separate channels; a
+caller that waits for its own stream to drain uses an id nobody else
+does.
+
+If the client is slow, frames pile up. Once a channel holds
+`max_pending` frames, new token text is merged into the newest pending
+token frame of the same stream, wherever it sits behind other streams'
+frames, instead of growing the queue. A stalled browser gets fewer,
+larger frames while generation keeps draining the provider at full
+speed. Control frames (start/complete/error) are never merged or
+dropped, and text never moves ahead of its own stream's control frames.
+
+Optional pacing (STREAM_PACING_MS) is applied here, after each token
+frame is sent, so it slows delivery but never generation.
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import os
+from collections import deque
+from typing import Dict, Any, Callable, Awaitable, Deque, Optional, Tuple
+
+
+FRAME_TOKEN = "stream_token"
+
+
+class DeliveryChannel:
+    """
+    Ordered frames for one (conversation, callback, request) and the task sending them.
+    """
+
+    def __init__(self, hub: "StreamDeliveryHub", key: Tuple[Any, Any, Any], callback: Callable[[Dict], Awaitable[None]]):
+        self.hub = hub
+        self.key = key
+        self.callback = callback
+        self.pending: Deque[Tuple[Dict[str, Any], float]] = deque()
+        self.drained = asyncio.Event()
+        self.drained.set()
+        self._task: Optional[asyncio.Task] = None
+
+    def put(self, frame: Dict[str, Any], pace: float = 0.0):
+        """Queue a frame without waiting (merges token text under backpressure)."""
+        if frame.get("type") == FRAME_TOKEN and len(self.pending) >= self.hub.max_pending:
+            target = self._mergeable_token_frame(frame.get("stream_id"))
+            if target is not None:
+                target["content"] = target.get("content", "") + frame.get("content", "")
+                self.hub.frames_coalesced += 1
+                return
+
+        self.pending.append((frame, pace))
+        self.hub.max_pending_seen = max(self.hub.max_pending_seen, len(self.pending))
+
+        if self._task is None:
+            self.drained.clear()
+            self._task = asyncio.create_task(self._drain())
+
+    def _mergeable_token_frame(self, stream_id: Any) -> Optional[Dict[str, Any]]:
+        """Newest pending token frame of `stream_id`, unless one of its control frames is queued after it."""
+        for pending_frame, _ in reversed(self.pending):
+            if pending_frame.get("stream_id") != stream_id:
+                continue  # Another stream (or a progress frame) - text can be merged past it
+            if pending_frame.get("type") == FRAME_TOKEN:
+                return pending_frame
+            return None
+        return None
+
+    async def _drain(self):
+        try:
+            while self.pending:
+                frame, pace = self.pending.popleft()
+                try:
+                    await self.callback(frame)
+                    self.hub.frames_sent += 1
+                except Exception as e:
+                    self.hub.callback_errors += 1
+                    print(f" Stream delivery to {self.key[0]} failed: {e}")
+                if pace and frame.get("type") == FRAME_TOKEN:
+                    await asyncio.sleep(pace)
+        finally:
+            self._task = None
+            self.pending.clear()
+            self.drained.set()
+            self.hub._release(self)
+
+
+class StreamDeliveryHub:
+    """
+    Owns the delivery channels (one per conversation, callback and request).
+
+    Usage:
+        stream_delivery.put(websocket_callback, conversation_id, frame, request_id=request_id)
+    """
+
+    def __init__(self, max_pending: int = 32):
+        self.max_pending = max(1, max_pending)
+        self._channels: Dict[Tuple[Any, Any, Any], DeliveryChannel] = {}
+
+        # Statistics
+        self.frames_sent = 0
+        self.frames_coalesced = 0
+        self.callback_errors = 0
+        self.max_pending_seen = 0
+
+        print(f" StreamDeliveryHub initialized (max pending frames per channel: {self.max_pending})")
+
+    def put(
+        self,
+        callback: Callable[[Dict], Awaitable[None]],
+        conversation_id: Optional[str],
+        frame: Dict[str, Any],
+        pace: float = 0.0,
+        request_id: Optional[str] = None
+    ):
+        key = (conversation_id, callback, request_id)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = DeliveryChannel(self, key, callback)
+            self._channels[key] = channel
+        channel.put(frame, pace)
+
+    def _release(self, channel: DeliveryChannel):
+        if self._channels.get(channel.key) is channel and not channel.pending:
+            del self._channels[channel.key]
+
+    async def wait_drained(self, conversation_id: str, timeout: float = 5.0) -> bool:
+        """
+        Wait until every queued frame for a conversation has been sent
+        (so later direct messages don't overtake the stream), whichever
+        request queued it.
+
+        Returns:
+            False if the timeout elapsed first
+        """
+        waits = [
+            channel.drained.wait()
+            for key, channel in list(self._channels.items())
+            if key[0] == conversation_id
+        ]
+        if not waits:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get delivery counters (shown in /health)."""
+        return {
+            "active_channels": len(self._channels),
+            "pending_frames": sum(len(channel.pending) for channel in self._channels.values()),
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "frames_sent": self.frames_sent,
+            "frames_coalesced": self.frames_coalesced,
+            "callback_errors": self.callback_errors,
+        }
+
+
+# Create singleton instance
+stream_delivery = StreamDeliveryHub(max_pending=int(os.getenv("STREAM_DELIVERY_MAX_PENDING", "32")))
+
+
+# Export
+__all__ = ['StreamDeliveryHub', 'DeliveryChannel', 'stream_delivery']
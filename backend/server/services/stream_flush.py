@@ -0,0 +1,124 @@
+"""
+Stream Flush Policy and Metrics
+===============================
+Decides when buffered stream text is sent to a client.
+
+Text is flushed when either:
+- the buffer holds at least `max_bytes` bytes, or
+- `frame_interval` seconds have passed since the last flush (one frame)
+
+There is no artificial delay by default. `pacing_delay` can be set for
+human-facing streams that should "type" more slowly; machine consumers
+(structured JSON calls, internal callbacks) are never paced.
+
+StreamMetrics records time to first token and the gaps between chunks
+for one stream, so slow starts and stalls show up per stream.
+
+SERVER SIDE FILE
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+
+@dataclass
+class FlushPolicy:
+    """
+    When to flush buffered stream text.
+    """
+    max_bytes: int = 64             # Flush once this much text is buffered
+    frame_interval: float = 0.024   # ...or once a frame (seconds) has elapsed
+    pacing_delay: float = 0.0       # Optional sleep after each flush (human-facing streams only)
+
+    @classmethod
+    def from_env(cls) -> "FlushPolicy":
+        return cls(
+            max_bytes=int(os.getenv("STREAM_FLUSH_BYTES", "64")),
+            frame_interval=float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "24")) / 1000.0,
+            pacing_delay=float(os.getenv("STREAM_PACING_MS", "0")) / 1000.0
+        )
+
+    def should_flush(self, buffered_bytes: int, since_last_flush: float) -> bool:
+        return buffered_bytes >= self.max_bytes or since_last_flush >= self.frame_interval
+
+
+class StreamBuffer:
+    """
+    Linear-time text buffer: chunks are appended to a list and joined once.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self.byte_count = 0
+
+    def append(self, text: str):
+        self._parts.append(text)
+        self.byte_count += len(text.encode("utf-8"))
+
+    def take(self) -> str:
+        """Return the buffered text and empty the buffer."""
+        text = "".join(self._parts)
+        self._parts = []
+        self.byte_count = 0
+        return text
+
+    def __bool__(self) -> bool:
+        return bool(self._parts)
+
+
+class StreamMetrics:
+    """
+    Timing of one delivered stream.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.gaps: List[float] = []
+        self.chunks = 0
+        self.flushes = 0
+        self.bytes = 0
+
+    def restart(self):
+        """A retry starts a fresh attempt (time to first token still counts from the original start)."""
+        started_at = self.started_at
+        self.__init__()
+        self.started_at = started_at
+
+    def on_chunk(self, text: str):
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        else:
+            self.gaps.append(now - self.last_chunk_at)
+        self.last_chunk_at = now
+        self.chunks += 1
+        self.bytes += len(text.encode("utf-8"))
+
+    def on_flush(self):
+        self.flushes += 1
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        gaps = sorted(self.gaps)
+        return {
+            "time_to_first_token": round(self.time_to_first_token, 4) if self.time_to_first_token is not None else None,
+            "chunks": self.chunks,
+            "flushes": self.flushes,
+            "bytes": self.bytes,
+            "avg_gap": round(sum(gaps) / len(gaps), 4) if gaps else 0.0,
+            "p95_gap": round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))], 4) if gaps else 0.0,
+            "max_gap": round(gaps[-1], 4) if gaps else 0.0,
+            "duration": round(time.perf_counter() - self.started_at, 4),
+        }
+
+
+__all__ = ['FlushPolicy', 'StreamBuffer', 'StreamMetrics']
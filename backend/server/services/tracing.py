@@ -0,0 +1,439 @@
+"""
+Pipeline Tracing - Stage-Level Spans per Request
+================================================
+The print banners show what the pipeline did, not where a slow request
+spent its time. Every message now gets a trace, keyed by its request id
+(the same id the WebSocket messages carry), made of spans:
+
+    chat.turn                     the whole turn (from the moment it was sent)
+      mailbox.wait                waiting for the conversation's previous turn
+      intent                      intent classification
+      planning                    plan generation (runs alongside coding)
+      coding.step                 one per plan step
+        llm.narration             progress narration for the step
+        llm.coding
+      chat                        chat mode answer
+      files.save                  writing generated files to the project
+      db.persist                  storing the messages (after the turn)
+
+Every LLM call is an `llm.<call_type>` span under the stage that made it.
+A span records its start/end, outcome (ok, error, cancelled, skipped),
+`queue_wait_seconds` (time spent waiting before its work could start:
+the mailbox, a free step slot, the rate limiter and scheduler for LLM
+calls) and the tokens and LLM queue time of the calls inside it.
+
+Recent traces are kept in memory (GET /api/traces). Finished spans can
+also be appended to a local file as OTLP JSON (one ExportTraceServiceRequest
+per line, the format of the OpenTelemetry Collector's file exporter),
+written in batches like the usage rows.
+
+Configure with:
+    TRACING_ENABLED=true
+    TRACE_MAX_TRACES=500
+    TRACE_EXPORT_PATH=traces/spans.otlp.jsonl   (unset = no file export)
+    TRACE_EXPORT_BATCH_SIZE=200
+    TRACE_EXPORT_INTERVAL_SECONDS=5
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+from .call_context import get_call_context
+
+
+# Span outcomes
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_CANCELLED = "cancelled"
+OUTCOME_SKIPPED = "skipped"
+
+# Counters that also add up on every enclosing span
+ROLLUP_COUNTERS = ("llm_calls", "prompt_tokens", "completion_tokens", "llm_queue_wait_seconds")
+
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+MAX_SPANS_PER_TRACE = 500
+
+
+def _trace_id_for(request_id: str) -> str:
+    """32 hex chars: the request id itself when it is a UUID."""
+    try:
+        return uuid.UUID(request_id).hex
+    except ValueError:
+        return hashlib.sha256(request_id.encode()).hexdigest()[:32]
+
+
+@dataclass
+class Span:
+    """
+    One timed stage of a request.
+    """
+    name: str
+    request_id: Optional[str]
+    parent: Optional["Span"] = field(default=None, repr=False)
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start_time: float = field(default_factory=time.time)
+    end_time: Optional[float] = None
+    outcome: Optional[str] = None
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def trace_id(self) -> Optional[str]:
+        return _trace_id_for(self.request_id) if self.request_id else None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or time.time()) - self.start_time
+
+    def set(self, **attributes):
+        """Set attributes (model, file path, ...)."""
+        self.attributes.update(attributes)
+
+    def add(self, **counters):
+        """Add to counters; ROLLUP_COUNTERS are added to every enclosing span too."""
+        span = self
+        while span is not None:
+            for key, value in counters.items():
+                if span is self or key in ROLLUP_COUNTERS:
+                    span.attributes[key] = span.attributes.get(key, 0) + value
+            span = span.parent
+
+    def set_outcome(self, outcome: str, error: Optional[str] = None):
+        self.outcome = outcome
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent.span_id if self.parent else None,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": round(self.duration * 1000, 1),
+            "outcome": self.outcome or "running",
+            "error": self.error,
+            "attributes": {
+                key: round(value, 4) if isinstance(value, float) else value
+                for key, value in self.attributes.items()
+            },
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        status = {"code": STATUS_ERROR if self.outcome in (OUTCOME_ERROR, OUTCOME_CANCELLED) else STATUS_OK}
+        if self.error or self.outcome == OUTCOME_CANCELLED:
+            status["message"] = self.error or OUTCOME_CANCELLED
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int((self.end_time or time.time()) * 1e9)),
+            "attributes": [
+                _otlp_attribute(key, value)
+                for key, value in {"request_id": self.request_id, "outcome": self.outcome, **self.attributes}.items()
+                if value is not None
+            ],
+            "status": status,
+        }
+        if self.parent is not None:
+            otlp["parentSpanId"] = self.parent.span_id
+        return otlp
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}  # int64 is a string in OTLP JSON
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Tracer:
+    """
+    Records spans per request and exports finished ones.
+
+    Usage:
+        with tracer.span("intent") as span:       # child of the current span
+            ...
+            span.set(intent="code")
+        tracer.add(prompt_tokens=120)              # counted on the current span
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_traces: int = 500,
+        export_path: Optional[str] = None,
+        max_buffer: int = 200,
+        flush_interval: float = 5.0,
+        service_name: str = "f3-backend"
+    ):
+        self.enabled = enabled
+        self.max_traces = max(1, max_traces)
+        self.export_path = Path(export_path) if export_path else None
+        self.max_buffer = max(1, max_buffer)
+        self.flush_interval = flush_interval
+        self.service_name = service_name
+
+        self._current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()  # request_id -> spans in start order
+        self._aliases: Dict[str, str] = {}                            # request_id -> request_id of its trace
+        self._buffer: List[Span] = []
+        self._oldest_buffered: Optional[float] = None
+
+        # Statistics
+        self.spans_recorded = 0
+        self.spans_dropped = 0
+        self.spans_exported = 0
+        self.export_errors = 0
+
+        if self.enabled:
+            print(f" Tracer initialized (keeping {self.max_traces} traces, "
+                  f"export: {self.export_path or 'off'})")
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        request_id: Optional[str] = None,
+        start_time: Optional[float] = None,
+        **attributes
+    ) -> Iterator[Span]:
+        """
+        Time a block as a span of the current request.
+
+        The parent is the current span; a span for a request whose other
+        spans have already ended (e.g. db.persist) goes under its root.
+        An exception ends the span with outcome "error" ("cancelled" for a
+        cancellation) unless an outcome was already set.
+        """
+        span = self._start(name, request_id, start_time, attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if span.outcome is None:
+                if isinstance(e, asyncio.CancelledError):
+                    span.set_outcome(OUTCOME_CANCELLED)
+                else:
+                    span.set_outcome(OUTCOME_ERROR, str(e) or type(e).__name__)
+            raise
+        finally:
+            self._current.reset(token)
+            self._end(span)
+
+    def record_span(self, name: str, start_time: float, end_time: float, **attributes) -> Span:
+        """Record an interval that has already happened (e.g. a wait) under the current span."""
+        span = self._start(name, None, start_time, attributes)
+        span.end_time = end_time
+        self._end(span)
+        return span
+
+    def current(self) -> Optional[Span]:
+        return self._current.get()
+
+    def add(self, **counters):
+        """Add counters (tokens, waits) to the current span, if any."""
+        span = self._current.get()
+        if span is not None:
+            span.add(**counters)
+
+    def alias(self, request_id: str, trace_request_id: str):
+        """Make a request id find another request's trace (messages answered by a coalesced turn)."""
+        if request_id != trace_request_id:
+            self._aliases[request_id] = trace_request_id
+
+    def _start(self, name: str, request_id: Optional[str], start_time: Optional[float], attributes: Dict[str, Any]) -> Span:
+        parent = self._current.get()
+        request_id = request_id or (parent.request_id if parent else get_call_context().request_id)
+        if parent is not None and parent.request_id != request_id:
+            parent = None
+        if parent is None and request_id in self._traces:
+            parent = self._traces[request_id][0]
+
+        span = Span(name=name, request_id=request_id, parent=parent, attributes=dict(attributes))
+        if start_time is not None:
+            span.start_time = start_time
+        if not self.enabled or not request_id:
+            return span  # Timed, but not part of any trace
+
+        spans = self._traces.get(request_id)
+        if spans is None:
+            spans = self._traces[request_id] = []
+            while len(self._traces) > self.max_traces:
+                evicted, _ = self._traces.popitem(last=False)
+                for alias in [alias for alias, target in self._aliases.items() if target == evicted]:
+                    del self._aliases[alias]
+        if len(spans) < MAX_SPANS_PER_TRACE:
+            spans.append(span)
+            self.spans_recorded += 1
+        else:
+            self.spans_dropped += 1
+        return span
+
+    def _end(self, span: Span):
+        if span.end_time is None:
+            span.end_time = time.time()
+        span.outcome = span.outcome or OUTCOME_OK
+        if not self.enabled or not span.request_id or self.export_path is None:
+            return
+
+        self._buffer.append(span)
+        now = time.time()
+        if self._oldest_buffered is None:
+            self._oldest_buffered = now
+        if len(self._buffer) >= self.max_buffer or now - self._oldest_buffered >= self.flush_interval:
+            self.flush()
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def to_otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        """Spans as an OTLP/JSON ExportTraceServiceRequest."""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "f3.pipeline"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def flush(self) -> int:
+        """Append buffered finished spans to the export file (one line). Returns spans written."""
+        if not self._buffer or self.export_path is None:
+            return 0
+        spans, self._buffer = self._buffer, []
+        self._oldest_buffered = None
+        try:
+            self.export_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.export_path, "a", encoding="utf-8") as export_file:
+                export_file.write(json.dumps(self.to_otlp(spans)) + "\n")
+        except OSError as e:
+            self.export_errors += 1
+            print(f" Could not export {len(spans)} spans to {self.export_path}: {e}")
+            return 0
+        self.spans_exported += len(spans)
+        return len(spans)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _spans_for(self, request_id: str) -> Optional[List[Span]]:
+        return self._traces.get(self._aliases.get(request_id, request_id))
+
+    def get_trace(self, request_id: str, otlp: bool = False) -> Optional[Dict[str, Any]]:
+        """A request's spans (None if it isn't kept), or the OTLP/JSON export of them."""
+        spans = self._spans_for(request_id)
+        if spans is None:
+            return None
+        if otlp:
+            return self.to_otlp(spans)
+        return {
+            **self._summarize(spans),
+            "spans": [span.to_dict() for span in spans],
+        }
+
+    def list_traces(
+        self,
+        conversation_id: Optional[str] = None,
+        min_duration_ms: Optional[float] = None,
+        outcome: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """Summaries of the most recent traces, newest first."""
+        summaries = []
+        for spans in reversed(list(self._traces.values())):
+            summary = self._summarize(spans)
+            if conversation_id and summary["conversation_id"] != conversation_id:
+                continue
+            if min_duration_ms is not None and summary["duration_ms"] < min_duration_ms:
+                continue
+            if outcome and summary["outcome"] != outcome:
+                continue
+            summaries.append(summary)
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def _summarize(self, spans: List[Span]) -> Dict[str, Any]:
+        root = spans[0]
+        end_time = max((span.end_time or time.time()) for span in spans)
+
+        # Where the time went: total time per stage directly under the root
+        breakdown: Dict[str, float] = {}
+        for span in spans[1:]:
+            if span.parent is root:
+                breakdown[span.name] = breakdown.get(span.name, 0.0) + span.duration * 1000
+        slowest = max(breakdown, key=breakdown.get) if breakdown else None
+
+        return {
+            "request_id": root.request_id,
+            "trace_id": root.trace_id,
+            "conversation_id": root.attributes.get("conversation_id"),
+            "name": root.name,
+            "start_time": root.start_time,
+            "duration_ms": round((end_time - root.start_time) * 1000, 1),
+            "outcome": root.outcome or "running",
+            "span_count": len(spans),
+            "llm_calls": root.attributes.get("llm_calls", 0),
+            "prompt_tokens": root.attributes.get("prompt_tokens", 0),
+            "completion_tokens": root.attributes.get("completion_tokens", 0),
+            "slowest_stage": slowest,
+            "stage_ms": {name: round(duration, 1) for name, duration in breakdown.items()},
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get tracing counters (shown in /health)."""
+        return {
+            "enabled": self.enabled,
+            "traces_kept": len(self._traces),
+            "max_traces": self.max_traces,
+            "spans_recorded": self.spans_recorded,
+            "spans_dropped": self.spans_dropped,
+            "export_path": str(self.export_path) if self.export_path else None,
+            "spans_buffered": len(self._buffer),
+            "spans_exported": self.spans_exported,
+            "export_errors": self.export_errors,
+        }
+
+
+# Create singleton instance
+tracer = Tracer(
+    enabled=os.getenv("TRACING_ENABLED", "true").lower() != "false",
+    max_traces=int(os.getenv("TRACE_MAX_TRACES", "500")),
+    export_path=os.getenv("TRACE_EXPORT_PATH") or None,
+    max_buffer=int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("TRACE_EXPORT_INTERVAL_SECONDS", "5"))
+)
+
+
+# Export
+__all__ = ['Tracer', 'Span', 'tracer']
@@ -0,0 +1,141 @@
+"""
+Usage Tracker - Token Accounting for LLM Calls
+==============================================
+Every generation the AI service runs is recorded here: prompt tokens,
+completion tokens, latency, time to first token, model and call type,
+attributed to the user/project/conversation from the call context.
+
+Rows are buffered in memory and written to the `api_usage` table in
+batches (one transaction per flush) instead of one commit per call.
+A flush happens when the buffer is full, when the oldest buffered row
+is older than `flush_interval`, before aggregates are read, and on
+shutdown.
+
+Token counts come from the provider's usage metadata when it reports
+them; otherwise they are estimated locally (~4 characters per token).
+`cached_tokens` is the part of the prompt served from a cached prefix
+(see prompt_cache.py) - those tokens are billed at the reduced rate.
+
+SERVER SIDE FILE
+"""
+
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+from ..models.message_models import LLMCallType
+from ..utils.prompt_budget import estimate_tokens
+from .call_context import LLMCallContext
+
+
+class UsageTracker:
+    """
+    Buffers per-call usage rows and flushes them to api_usage in batches.
+    """
+
+    def __init__(self, max_buffer: int = 50, flush_interval: float = 10.0, enabled: bool = True):
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._oldest_buffered: Optional[float] = None
+
+        # Statistics
+        self.calls_recorded = 0
+        self.rows_flushed = 0
+        self.flushes = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+        print(f" UsageTracker initialized ({'enabled' if self.enabled else 'disabled'}, batch size: {self.max_buffer})")
+
+    def record(
+        self,
+        call_type: LLMCallType,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+        first_token_latency: Optional[float],
+        call_context: LLMCallContext,
+        success: bool = True,
+        cached_tokens: int = 0
+    ):
+        """Buffer one LLM call's usage."""
+        if not self.enabled:
+            return
+
+        self._buffer.append({
+            "user_id": call_context.user_id,
+            "endpoint": f"llm/{call_type.value}",
+            "project_id": call_context.project_id,
+            "conversation_id": call_context.conversation_id,
+            "call_type": call_type.value,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_ms": int(latency * 1000),
+            "first_token_ms": int(first_token_latency * 1000) if first_token_latency is not None else None,
+            "success": success,
+            "cached_tokens": cached_tokens,
+        })
+        self.calls_recorded += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_tokens += cached_tokens
+
+        now = time.time()
+        if self._oldest_buffered is None:
+            self._oldest_buffered = now
+
+        if len(self._buffer) >= self.max_buffer or now - self._oldest_buffered >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every buffered row in one batch. Returns rows written."""
+        if not self._buffer:
+            return 0
+
+        # Imported lazily: the database layer isn't needed until the first flush
+        from ..database.repositories import api_usage_repo
+
+        rows, self._buffer = self._buffer, []
+        self._oldest_buffered = None
+        written = api_usage_repo.log_usage_batch(rows)
+        self.rows_flushed += written
+        self.flushes += 1
+        return written
+
+    def get_usage_summary(self, group_by: str = "call_type", **filters) -> List[Dict[str, Any]]:
+        """Aggregate recorded usage (flushes pending rows first)."""
+        from ..database.repositories import api_usage_repo
+
+        self.flush()
+        return api_usage_repo.get_usage_summary(group_by=group_by, **filters)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get in-process counters (shown in /health)."""
+        return {
+            "enabled": self.enabled,
+            "calls_recorded": self.calls_recorded,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "buffered_rows": len(self._buffer),
+            "rows_flushed": self.rows_flushed,
+            "flushes": self.flushes,
+        }
+
+
+# Create singleton instance
+usage_tracker = UsageTracker(
+    max_buffer=int(os.getenv("USAGE_FLUSH_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "10")),
+    enabled=os.getenv("USAGE_TRACKING_ENABLED", "true").lower() != "false"
+)
+
+
+# Export
+__all__ = ['UsageTracker', 'usage_tracker', 'estimate_tokens']
@@ -5,12 +5,17 @@ Handles real-time AI progress updates and chat communication
 
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import Dict, List, Optional, Any, Callable, Awaitable
+import os
 import json
 import asyncio
 from datetime import datetime
 import time
 from enum import Enum
 
+from ..models.message_models import LLMCallType
+from .call_context import get_call_context
+from .stream_delivery import stream_delivery
+
 
 class AIProgressStatus(str, Enum):
     """AI Processing Status Types"""
@@ -30,8 +35,15 @@ class ConnectionManager:
         self.active_connections: Dict[str, WebSocket] = {}
         self.conversation_connections: Dict[str, List[str]] = {}  # conversation_id -> [client_ids]
         self.streaming_sessions: Dict[str, Dict] = {}  # Track active streaming sessions
+        self.send_timeout = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+        # Set in job worker processes: messages are forwarded to the API process instead of sent here
+        self.relay: Optional[Callable[[Dict[str, Any], Optional[str], Optional[str]], Awaitable[None]]] = None
         print("F3 WebSocket ConnectionManager initialized")
     
+    def set_relay(self, relay: Callable[[Dict[str, Any], Optional[str], Optional[str]], Awaitable[None]]):
+        """Forward every outgoing message to relay(message, conversation_id, client_id)."""
+        self.relay = relay
+    
     async def connect(self, websocket: WebSocket, client_id: str, conversation_id: Optional[str] = None):
         """Connect a client to WebSocket"""
         await websocket.accept()
@@ -47,24 +59,48 @@ class ConnectionManager:
         
         print(f"F3 Client {client_id} connected to conversation {conversation_id}")
     
-    def disconnect(self, client_id: str, conversation_id: Optional[str] = None):
-        """Disconnect a client"""
+    def disconnect(self, client_id: str, conversation_id: Optional[str] = None) -> List[str]:
+        """
+        Disconnect a client (from one conversation, or from all of them if none is given).
+        
+        Returns:
+            Conversations left without any connected client
+        """
         if client_id in self.active_connections:
             del self.active_connections[client_id]
-            
-        # Remove from conversation
-        if conversation_id and conversation_id in self.conversation_connections:
-            if client_id in self.conversation_connections[conversation_id]:
-                self.conversation_connections[conversation_id].remove(client_id)
-            
-            # Clean up empty conversations
-            if not self.conversation_connections[conversation_id]:
-                del self.conversation_connections[conversation_id]
+        
+        conversation_ids = [conversation_id] if conversation_id else [
+            conv_id for conv_id, clients in self.conversation_connections.items() if client_id in clients
+        ]
+        
+        abandoned = []
+        for conv_id in conversation_ids:
+            # Remove from conversation
+            if conv_id in self.conversation_connections:
+                if client_id in self.conversation_connections[conv_id]:
+                    self.conversation_connections[conv_id].remove(client_id)
+                
+                # Clean up empty conversations
+                if not self.conversation_connections[conv_id]:
+                    del self.conversation_connections[conv_id]
+                    abandoned.append(conv_id)
         
         print(f"F3 Client {client_id} disconnected from conversation {conversation_id}")
+        return abandoned
+    
+    def _with_request_id(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Tag a message sent while handling a request with its id (see GET /api/traces/{request_id})."""
+        request_id = get_call_context().request_id
+        if request_id and "request_id" not in message:
+            return {**message, "request_id": request_id}
+        return message
     
     async def send_to_client(self, message: Dict[str, Any], client_id: str):
         """Send message to specific client"""
+        message = self._with_request_id(message)
+        if self.relay is not None:
+            await self.relay(message, None, client_id)
+            return
         if client_id in self.active_connections:
             websocket = self.active_connections[client_id]
             try:
@@ -73,24 +109,37 @@ class ConnectionManager:
                 print(f"Error sending to {client_id}: {e}")
                 self.disconnect(client_id)
     
+    async def _send_with_timeout(self, client_id: str, message: Dict[str, Any]) -> Optional[str]:
+        """Send to one client; returns the client id if the connection is dead or stalled."""
+        websocket = self.active_connections.get(client_id)
+        if websocket is None:
+            return None
+        try:
+            await asyncio.wait_for(websocket.send_json(message), timeout=self.send_timeout)
+            return None
+        except asyncio.TimeoutError:
+            print(f"Client {client_id} did not accept a message within {self.send_timeout:g}s, dropping it")
+            return client_id
+        except Exception as e:
+            print(f"Error sending to client {client_id}: {e}")
+            return client_id
+    
     async def send_to_conversation(self, message: Dict[str, Any], conversation_id: str):
-        """Send message to all clients in a conversation"""
+        """Send message to all clients in a conversation (concurrently, so one slow client can't delay the others)"""
+        message = self._with_request_id(message)
+        if self.relay is not None:
+            await self.relay(message, conversation_id, None)
+            return
         if conversation_id not in self.conversation_connections:
             return
         
-        dead_connections = []
-        
-        for client_id in self.conversation_connections[conversation_id]:
-            if client_id in self.active_connections:
-                try:
-                    await self.active_connections[client_id].send_json(message)
-                except Exception as e:
-                    print(f"Error sending to conversation {conversation_id}, client {client_id}: {e}")
-                    dead_connections.append(client_id)
+        client_ids = list(self.conversation_connections[conversation_id])
+        results = await asyncio.gather(*(self._send_with_timeout(client_id, message) for client_id in client_ids))
         
         # Clean up dead connections
-        for client_id in dead_connections:
-            self.disconnect(client_id, conversation_id)
+        for client_id in results:
+            if client_id:
+                self.disconnect(client_id, conversation_id)
     
     def get_conversation_clients(self, conversation_id: str) -> List[str]:
         """Get all clients in a conversation"""
@@ -108,9 +157,23 @@ class F3WebSocketManager:
         """Initialize the F3 WebSocket Manager."""
         self.manager = ConnectionManager()
         self.message_handlers: Dict[str, Callable[..., Any]] = {}
-        self.streaming_sessions: Dict[str, Dict] = {}  # Track active streaming sessions
+        self.streaming_sessions: Dict[str, Dict] = {}  # Track active streaming sessions (by stream_id)
+        # Called with (conversation_id, reason) to stop a conversation's generation (set by the coordinator)
+        self.cancel_handler: Optional[Callable[[str, str], Awaitable[Dict[str, Any]]]] = None
+        # Same, when the last client of a conversation goes away (only generation someone was watching)
+        self.disconnect_handler: Optional[Callable[[str, str], Awaitable[Dict[str, Any]]]] = None
+        self.cancel_on_disconnect = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() != "false"
+        self._register_handlers()
         print("F3 WebSocketManager initialized with streaming support")
     
+    def set_cancel_handler(self, handler: Callable[[str, str], Awaitable[Dict[str, Any]]]):
+        """Register the function that cancels a conversation's in-flight generation."""
+        self.cancel_handler = handler
+    
+    def set_disconnect_handler(self, handler: Callable[[str, str], Awaitable[Dict[str, Any]]]):
+        """Register the function that cancels generation when a conversation's last client disconnects."""
+        self.disconnect_handler = handler
+    
     async def _silent_callback(self, stream_data: Dict):
         """Silent callback for internal AI processing - doesn't send to users."""
         # Progress updates can happen internally without user-visible streaming
@@ -123,6 +186,7 @@ class F3WebSocketManager:
             "join_conversation": self._handle_join_conversation,
             "leave_conversation": self._handle_leave_conversation,
             "chat_message": self._handle_chat_message,
+            "cancel": self._handle_cancel,
         }
     
     async def handle_connection(self, websocket: WebSocket, client_id: str):
@@ -143,10 +207,21 @@ class F3WebSocketManager:
                 await self._process_message(data, client_id)
         
         except WebSocketDisconnect:
-            self.manager.disconnect(client_id)
+            await self._on_client_gone(client_id)
         except Exception as e:
             print(f"F3 WebSocket error for {client_id}: {e}")
-            self.manager.disconnect(client_id)
+            await self._on_client_gone(client_id)
+    
+    async def _on_client_gone(self, client_id: str):
+        """Drop a closed connection; generation nobody is watching any more is cancelled."""
+        abandoned = self.manager.disconnect(client_id)
+        if not self.cancel_on_disconnect or self.disconnect_handler is None:
+            return
+        for conversation_id in abandoned:
+            try:
+                await self.disconnect_handler(conversation_id, "client disconnected")
+            except Exception as e:
+                print(f"Error cancelling conversation {conversation_id}: {e}")
     
     async def _process_message(self, data: str, client_id: str):
         """Process incoming WebSocket message"""
@@ -226,6 +301,25 @@ class F3WebSocketManager:
                 "timestamp": datetime.now().isoformat()
             }, conversation_id)
     
+    async def _handle_cancel(self, message: Dict, client_id: str):
+        """Handle an explicit request to stop a conversation's generation"""
+        conversation_id = message.get("conversation_id")
+        
+        if not conversation_id or self.cancel_handler is None:
+            await self.manager.send_to_client({
+                "type": "error",
+                "message": "conversation_id required" if not conversation_id else "Cancellation not available"
+            }, client_id)
+            return
+        
+        summary = await self.cancel_handler(conversation_id, "cancelled by client")
+        await self.manager.send_to_client({
+            "type": "cancel_result",
+            "conversation_id": conversation_id,
+            "requests_cancelled": summary.get("requests_cancelled", 0),
+            "timestamp": datetime.now().isoformat()
+        }, client_id)
+    
     # ============================================================================
     # AI PROGRESS TRACKING METHODS...................................................................
     # ============================================================================
@@ -261,6 +355,10 @@ class F3WebSocketManager:
         if details:
             progress_message["details"] = details
         
+        if status in (AIProgressStatus.COMPLETE, AIProgressStatus.ERROR):
+            # Let queued stream frames go out first so the final update isn't overtaken
+            await stream_delivery.wait_drained(conversation_id, timeout=2.0)
+        
         await self.manager.send_to_conversation(progress_message, conversation_id)
     
     async def send_ai_analyzing(self, conversation_id: str, user_prompt: str):
@@ -281,9 +379,9 @@ class F3WebSocketManager:
             message = await ai_service.generate_response(
                 prompt=user_message,
                 system_instruction=system_prompt,
-                temperature=0.7,
                 websocket_callback=self._silent_callback,
-                conversation_id="progress_analyzing"
+                conversation_id="progress_analyzing",
+                call_type=LLMCallType.NARRATION
             )
             
         except Exception as e:
@@ -319,9 +417,9 @@ class F3WebSocketManager:
             message = await ai_service.generate_response(
                 prompt=user_message,
                 system_instruction=system_prompt,
-                temperature=0.7,
                 websocket_callback=self._silent_callback,
-                conversation_id="progress_planning"
+                conversation_id="progress_planning",
+                call_type=LLMCallType.NARRATION
             )
             
         except Exception as e:
@@ -362,9 +460,9 @@ class F3WebSocketManager:
             message = await ai_service.generate_response(
                 prompt=user_message,
                 system_instruction=system_prompt,
-                temperature=0.7,
                 websocket_callback=self._silent_callback,
-                conversation_id="progress_coding"
+                conversation_id="progress_coding",
+                call_type=LLMCallType.NARRATION
             )
             
         except Exception as e:
@@ -443,9 +541,9 @@ class F3WebSocketManager:
             message = await ai_service.generate_response(
                 prompt=user_message,
                 system_instruction=system_prompt,
-                temperature=0.7,
                 websocket_callback=self._silent_callback,
-                conversation_id="progress_completion"
+                conversation_id="progress_completion",
+                call_type=LLMCallType.NARRATION
             )
             
         except Exception as e:
@@ -526,16 +624,22 @@ class F3WebSocketManager:
         """
         Callback function for AI streaming responses.
         Routes streaming tokens to the appropriate conversation.
+        
+        A conversation can have several streams at once (parallel coding
+        steps); sessions are tracked per stream_id and every message
+        carries it, with the step_number/target_file it belongs to.
         """
         conversation_id = stream_data.get("conversation_id")
         if not conversation_id:
             return
         
         stream_type = stream_data.get("type")
+        stream_id = stream_data.get("stream_id") or conversation_id
         
         if stream_type == "stream_start":
             # Initialize streaming session
-            self.streaming_sessions[conversation_id] = {
+            self.streaming_sessions[stream_id] = {
+                "conversation_id": conversation_id,
                 "start_time": time.time(),
                 "tokens_sent": 0,
                 "is_active": True
@@ -544,13 +648,14 @@ class F3WebSocketManager:
             message = {
                 "type": "ai_stream_start",
                 "conversation_id": conversation_id,
+                "queue_wait": stream_data.get("queue_wait", 0.0),
                 "timestamp": time.time()
             }
             
         elif stream_type == "stream_token":
             # Send streaming tokens
-            if conversation_id in self.streaming_sessions:
-                self.streaming_sessions[conversation_id]["tokens_sent"] += 1
+            if stream_id in self.streaming_sessions:
+                self.streaming_sessions[stream_id]["tokens_sent"] += 1
             
             message = {
                 "type": "ai_stream_token",
@@ -560,25 +665,20 @@ class F3WebSocketManager:
             }
             
         elif stream_type == "stream_complete":
-            # Complete streaming session
-            if conversation_id in self.streaming_sessions:
-                session = self.streaming_sessions[conversation_id]
-                session["is_active"] = False
-                session["end_time"] = time.time()
-                session["duration"] = session["end_time"] - session["start_time"]
+            # Complete streaming session (finished streams are forgotten)
+            self.streaming_sessions.pop(stream_id, None)
             
             message = {
                 "type": "ai_stream_complete",
                 "conversation_id": conversation_id,
                 "full_response": stream_data.get("full_response", ""),
+                "metrics": stream_data.get("metrics"),
                 "timestamp": time.time()
             }
             
         elif stream_type == "stream_error":
             # Handle streaming errors
-            if conversation_id in self.streaming_sessions:
-                self.streaming_sessions[conversation_id]["is_active"] = False
-                self.streaming_sessions[conversation_id]["error"] = stream_data.get("error")
+            self.streaming_sessions.pop(stream_id, None)
             
             message = {
                 "type": "ai_stream_error",
@@ -590,6 +690,10 @@ class F3WebSocketManager:
         else:
             return  # Unknown stream type
         
+        for key in ("request_id", "stream_id", "step_number", "target_file"):
+            if stream_data.get(key) is not None:
+                message[key] = stream_data[key]
+        
         # Send message to all clients in the conversation
         await self.manager.send_to_conversation(message, conversation_id)
 
@@ -1,11 +1,14 @@
 from .prompt_templates import *
 from .code_validator import code_validator
 from .error_parser import error_parser
+from .incremental_json import IncrementalArrayParser
+from .prompt_budget import ContextPiece, PromptAssembler, prompt_budget, truncate_to_tokens
 
 __all__ = [
     'INTENT_CLASSIFIER_SYSTEM',
     'PLANNING_AGENT_SYSTEM',
     'CODING_AGENT_SYSTEM',
+    'CODING_AGENT_INSTRUCTIONS',
     'ERROR_RECOVERY_SYSTEM',
     'CHAT_AGENT_SYSTEM',
     'build_intent_prompt',
@@ -14,5 +17,10 @@ __all__ = [
     'build_error_analysis_prompt',
     'build_chat_prompt',
     'code_validator',
-    'error_parser'
+    'error_parser',
+    'IncrementalArrayParser',
+    'ContextPiece',
+    'PromptAssembler',
+    'prompt_budget',
+    'truncate_to_tokens'
     ]
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Incremental JSON - Objects of a Streamed Array as Soon as They Close
+====================================================================
+A plan streams in as one JSON document, but each of its steps is usable
+on its own. IncrementalArrayParser tracks string/bracket state over the
+text seen so far and decodes every object of one top-level array the
+moment its closing brace arrives, so consumers don't wait for the rest
+of the document.
+
+SERVER SIDE FILE
+"""
+
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class IncrementalArrayParser:
+    """
+    Feeds on streamed JSON text and returns each object of one top-level
+    array (e.g. "steps") as soon as that object is syntactically complete.
+
+    Text before the first "{" (such as a ```json fence) is ignored.
+    Each object comes with its 1-based position in the array; items that
+    don't decode (or aren't objects) are skipped but keep their position.
+    """
+
+    def __init__(self, array_key: str = "steps"):
+        self.array_key = array_key
+        self.emitted = 0
+
+        self._stack: List[str] = []  # Open containers: "{" or "["
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._key_chars: Optional[List[str]] = None  # String being read at depth 1
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None  # Stack depth of the target array
+        self._item_chars: Optional[List[str]] = None  # Text of the item being captured
+        self._item_depth = 0
+        self._item_position = 0  # Position of the current array item (commas seen + 1)
+        self._item_start = 0
+
+    def feed(self, text: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """Consume the next piece of text. Returns (position, item) for items completed by it."""
+        completed = []
+        for char in text:
+            if not self._started:
+                if char != "{":
+                    continue
+                self._started = True
+
+            if self._item_chars is not None:
+                self._item_chars.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        self._last_key = "".join(self._key_chars)
+                        self._key_chars = None
+                elif self._key_chars is not None:
+                    self._key_chars.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if len(self._stack) == 1:
+                    self._key_chars = []
+            elif char in "{[":
+                self._stack.append(char)
+                if char == "[" and len(self._stack) == 2 and self._last_key == self.array_key:
+                    self._array_depth = len(self._stack)
+                    self._item_position = 1
+                elif (
+                    char == "{"
+                    and self._array_depth is not None
+                    and len(self._stack) == self._array_depth + 1
+                    and self._item_chars is None
+                ):
+                    self._item_chars = ["{"]
+                    self._item_depth = len(self._stack)
+                    self._item_start = self._item_position
+            elif char == "," and self._array_depth is not None and len(self._stack) == self._array_depth:
+                self._item_position += 1
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                depth = len(self._stack)
+                self._stack.pop()
+                if self._item_chars is not None and char == "}" and depth == self._item_depth:
+                    item = self._parse_item("".join(self._item_chars))
+                    self._item_chars = None
+                    if item is not None:
+                        completed.append((self._item_start, item))
+                elif char == "]" and depth == self._array_depth:
+                    self._array_depth = None
+
+        self.emitted += len(completed)
+        return completed
+
+    def _parse_item(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
+
+
+__all__ = ['IncrementalArrayParser']
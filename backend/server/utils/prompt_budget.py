@@ -0,0 +1,125 @@
+"""
+Prompt Budget
+=============
+Keeps prompts inside a per-call-type token budget.
+
+Prompt builders split the context they want to send (current file,
+recently touched files, other files, conversation history...) into
+ContextPiece objects with a relevance score. PromptAssembler keeps the
+most relevant pieces that fit, falls back to a piece's short summary
+when the full text doesn't fit, and drops the rest - so prompts stop
+growing with project size and conversation length.
+
+Token counts are estimated locally (~4 characters per token); no
+tokenizer round trip is needed.
+
+SERVER SIDE FILE
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from ..models.message_models import LLMCallType
+
+
+CHARS_PER_TOKEN = 4  # Rough average for English prose and Dart code
+
+# Total prompt budget (system instruction excluded) per call type, in tokens.
+# Override with PROMPT_BUDGET_<CALL_TYPE>, e.g. PROMPT_BUDGET_PLAN=6000
+DEFAULT_PROMPT_BUDGETS: Dict[LLMCallType, int] = {
+    LLMCallType.INTENT: 1200,
+    LLMCallType.PLAN: 3000,
+    LLMCallType.CODE: 6000,
+    LLMCallType.ERROR_ANALYSIS: 4000,
+    LLMCallType.NARRATION: 400,
+    LLMCallType.CHAT: 4000,
+}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap local token estimate (no tokenizer round trip)."""
+    if not text:
+        return 0
+    # Round up: many short pieces (file paths, one-line messages) add up otherwise
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def prompt_budget(call_type: LLMCallType) -> int:
+    """Token budget for one call type's prompt."""
+    override = os.getenv(f"PROMPT_BUDGET_{call_type.name}")
+    if override:
+        return int(override)
+    return DEFAULT_PROMPT_BUDGETS[call_type]
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = "\n... [truncated] ...\n") -> str:
+    """Keep the head and tail of a text so it fits max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(marker))
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return text[:head] + marker + (text[-tail:] if tail else "")
+
+
+@dataclass
+class ContextPiece:
+    """
+    One droppable part of a prompt's context.
+    """
+    text: str
+    relevance: float                # Higher = kept first
+    summary: Optional[str] = None   # Shorter stand-in used when the full text doesn't fit
+
+
+class PromptAssembler:
+    """
+    Picks the most relevant context pieces that fit a token budget.
+    """
+
+    def __init__(self, budget_tokens: int):
+        self.budget_tokens = max(0, budget_tokens)
+        self.used_tokens = 0
+        self.summarized = 0
+        self.dropped = 0
+
+    def select(self, pieces: List[ContextPiece]) -> List[str]:
+        """
+        Returns the chosen texts, in the pieces' original order.
+        """
+        chosen: Dict[int, str] = {}
+        ranked = sorted(range(len(pieces)), key=lambda i: pieces[i].relevance, reverse=True)
+
+        for index in ranked:
+            piece = pieces[index]
+            cost = estimate_tokens(piece.text)
+            if self.used_tokens + cost <= self.budget_tokens:
+                chosen[index] = piece.text
+                self.used_tokens += cost
+                continue
+
+            if piece.summary:
+                cost = estimate_tokens(piece.summary)
+                if self.used_tokens + cost <= self.budget_tokens:
+                    chosen[index] = piece.summary
+                    self.used_tokens += cost
+                    self.summarized += 1
+                    continue
+
+            self.dropped += 1
+
+        return [chosen[i] for i in sorted(chosen)]
+
+    def remaining(self) -> int:
+        return max(0, self.budget_tokens - self.used_tokens)
+
+
+__all__ = [
+    'ContextPiece',
+    'PromptAssembler',
+    'estimate_tokens',
+    'prompt_budget',
+    'truncate_to_tokens',
+    'DEFAULT_PROMPT_BUDGETS'
+]
@@ -7,6 +7,17 @@ Keeping prompts in one place makes them easy to update and maintain.
 SERVER SIDE FILE
 """
 
+from typing import Optional
+
+from ..models.message_models import LLMCallType
+from .prompt_budget import (
+    ContextPiece,
+    PromptAssembler,
+    estimate_tokens,
+    prompt_budget,
+    truncate_to_tokens
+)
+
 # ============================================================================
 # INTENT CLASSIFIER PROMPTS...................................................
 # ============================================================================
@@ -232,7 +243,15 @@ CODING_PROMPT = """Generate a WOW-MOMENT Flutter widget that will amaze professi
 **Current Project Context:**
 {context}
 
-**CRITICAL REQUIREMENTS:**
+Follow every requirement in your instructions (file structure, WOW-moment features, technical excellence, code quality, design standards).
+
+Return ONLY the complete, compilable Dart code with all imports."""
+
+
+# Static part of every coding call. It goes out as the system instruction
+# (with CODING_AGENT_SYSTEM) so providers can cache it once per model
+# instead of processing it again for every plan step.
+CODING_REQUIREMENTS = """**CRITICAL REQUIREMENTS:**
 
 1. **File Structure Compliance:**
    - Place widgets in lib/widgets/ directory
@@ -293,9 +312,9 @@ CODING_PROMPT = """Generate a WOW-MOMENT Flutter widget that will amaze professi
 6. Accessibility features
 7. Common use cases and examples (described, not coded)
 
-**Remember:** This widget will be used by professional developers. It must be impressive, production-ready, and create a genuine "wow" moment when they see it.
+**Remember:** This widget will be used by professional developers. It must be impressive, production-ready, and create a genuine "wow" moment when they see it."""
 
-Return ONLY the complete, compilable Dart code with all imports."""
+CODING_AGENT_INSTRUCTIONS = CODING_AGENT_SYSTEM + "\n\n" + CODING_REQUIREMENTS
 
 
 # ============================================================================
@@ -423,9 +442,13 @@ Remember: NO CODE in your response!"""
 # HELPER FUNCTIONS............................................................
 # ============================================================================
 
-def format_context(context: dict) -> str:
+def format_context(context: dict, budget_tokens: Optional[int] = None) -> str:
     """
     Format project context into a readable string for prompts.
+    
+    With a token budget, the current file and recently touched files are
+    kept first; the rest of the file list is summarized per directory or
+    dropped so large projects don't blow up the prompt.
     """
     if not context:
         return "No project context available."
@@ -433,9 +456,33 @@ def format_context(context: dict) -> str:
     formatted = []
     
     if "files" in context:
-        formatted.append(f"Files in project: {len(context['files'])}")
-        for file_path in context["files"].keys():
-            formatted.append(f"  - {file_path}")
+        files = list(context["files"].keys()) if isinstance(context["files"], dict) else list(context["files"])
+        formatted.append(f"Files in project: {len(files)}")
+        
+        if budget_tokens is None:
+            for file_path in files:
+                formatted.append(f"  - {file_path}")
+        else:
+            current = context.get("current_file") or context.get("current_widget")
+            recent = list(context.get("recent_files") or [])
+            pieces = []
+            for file_path in files:
+                if file_path == current:
+                    relevance = 3.0
+                elif file_path in recent:
+                    # recent_files is oldest -> newest; newer ranks higher
+                    relevance = 2.0 + (recent.index(file_path) + 1) / (len(recent) + 1)
+                else:
+                    relevance = 1.0
+                pieces.append(ContextPiece(text=f"  - {file_path}", relevance=relevance))
+            
+            assembler = PromptAssembler(budget_tokens - estimate_tokens(formatted[0]) - 40)
+            kept = assembler.select(pieces)
+            formatted.extend(kept)
+            if assembler.dropped:
+                kept_lines = set(kept)
+                omitted = [p for p in files if f"  - {p}" not in kept_lines]
+                formatted.append(f"  ... and {len(omitted)} more ({_summarize_directories(omitted)})")
     
     if "current_widget" in context:
         formatted.append(f"Current widget: {context['current_widget']}")
@@ -446,23 +493,67 @@ def format_context(context: dict) -> str:
     return "\n".join(formatted)
 
 
-def format_conversation_history(history: list) -> str:
+def _summarize_directories(file_paths: list, limit: int = 5) -> str:
+    """Count files per directory, e.g. "lib/widgets: 40, lib/preview: 12"."""
+    counts = {}
+    for file_path in file_paths:
+        directory = file_path.rsplit("/", 1)[0] if "/" in file_path else "."
+        counts[directory] = counts.get(directory, 0) + 1
+    top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return ", ".join(f"{directory}: {count}" for directory, count in top)
+
+
+def format_conversation_history(history: list, budget_tokens: Optional[int] = None) -> str:
     """
     Format conversation history for prompts.
+    
+    Without a budget, the last 5 messages are shown truncated. With a
+    budget, as many recent messages as fit are kept (newest first); older
+    ones are shortened and then dropped.
     """
     if not history:
         return "No previous conversation."
     
-    formatted = []
-    for msg in history[-5:]:  # Last 5 messages for context
-        role = msg.get("role", "unknown")
+    if budget_tokens is None:
+        formatted = []
+        for msg in history[-5:]:  # Last 5 messages for context
+            role = msg.get("role", "unknown")
+            content = msg.get("content", "")
+            formatted.append(f"{role.upper()}: {content[:100]}...")  # Truncate long messages
+        return "\n".join(formatted)
+    
+    pieces = []
+    for position, msg in enumerate(history):
+        role = msg.get("role", "unknown").upper()
         content = msg.get("content", "")
-        formatted.append(f"{role.upper()}: {content[:100]}...")  # Truncate long messages
+        pieces.append(ContextPiece(
+            text=f"{role}: {content[:1000]}",
+            relevance=float(position),  # Newer messages matter more
+            summary=f"{role}: {content[:100]}..." if len(content) > 100 else None
+        ))
     
-    return "\n".join(formatted)
+    return "\n".join(PromptAssembler(budget_tokens).select(pieces)) or "No previous conversation."
 
 
-from typing import Optional
+def select_history(messages: list, budget_tokens: int) -> list:
+    """
+    Keep the most recent chat messages that fit a token budget (for chat-history APIs).
+    """
+    selected = []
+    used = 0
+    for msg in reversed(messages):
+        cost = estimate_tokens(msg.get("content", ""))
+        if used + cost > budget_tokens:
+            break
+        selected.append(msg)
+        used += cost
+    return list(reversed(selected))
+
+
+def _context_budget(call_type: LLMCallType, *fixed_parts: str) -> int:
+    """What's left of a call type's budget after the fixed parts of its prompt."""
+    return max(0, prompt_budget(call_type) - sum(estimate_tokens(part) for part in fixed_parts))
+
 
 def build_intent_prompt(message: str, context: Optional[dict] = None) -> str:
     """
@@ -470,7 +561,8 @@ def build_intent_prompt(message: str, context: Optional[dict] = None) -> str:
     """
     context_str = ""
     if context and context.get("history"):
-        context_str = f"\n\nConversation Context:\n{format_conversation_history(context['history'])}"
+        budget = _context_budget(LLMCallType.INTENT, INTENT_CLASSIFIER_PROMPT, message)
+        context_str = f"\n\nConversation Context:\n{format_conversation_history(context['history'], budget)}"
     
     return INTENT_CLASSIFIER_PROMPT.format(
         message=message,
@@ -484,7 +576,7 @@ def build_planning_prompt(request: str, context: dict) -> str:
     """
     return PLANNING_PROMPT.format(
         request=request,
-        context=format_context(context)
+        context=format_context(context, _context_budget(LLMCallType.PLAN, PLANNING_PROMPT, request))
     )
 
 
@@ -492,12 +584,13 @@ def build_coding_prompt(step: dict, context: dict) -> str:
     """
     Build the complete coding prompt.
     """
+    step_details = str(step)
     return CODING_PROMPT.format(
-        step_details=str(step),
+        step_details=step_details,
         action_type=step.get("action_type", "unknown"),
         target_file=step.get("target_file", "N/A"),
         description=step.get("description", ""),
-        context=format_context(context)
+        context=format_context(context, _context_budget(LLMCallType.CODE, CODING_PROMPT, step_details))
     )
 
 
@@ -505,9 +598,10 @@ def build_error_analysis_prompt(error: dict, code: str, retry_count: int) -> str
     """
     Build the complete error analysis prompt.
     """
+    error_details = str(error)
     return ERROR_ANALYSIS_PROMPT.format(
-        error_details=str(error),
-        code_context=code,
+        error_details=error_details,
+        code_context=truncate_to_tokens(code, _context_budget(LLMCallType.ERROR_ANALYSIS, ERROR_ANALYSIS_PROMPT, error_details)),
         retry_count=retry_count
     )
 
@@ -516,8 +610,10 @@ def build_chat_prompt(message: str, context: dict, history: list) -> str:
     """
     Build the complete chat response prompt.
     """
+    budget = _context_budget(LLMCallType.CHAT, CHAT_RESPONSE_PROMPT, message)
+    # History is usually worth more than the file list in a conversation
     return CHAT_RESPONSE_PROMPT.format(
         message=message,
-        context=format_context(context),
-        history=format_conversation_history(history)
-    )
\ No newline at end of file
+        context=format_context(context, budget * 2 // 5),
+        history=format_conversation_history(history, budget * 3 // 5)
+    )
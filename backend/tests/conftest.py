@@ -0,0 +1,20 @@
+"""
+Shared test environment: the fake LLM provider, generous rate limits and a
+scratch working directory. Set before any test module imports the server,
+whose services read their configuration at import time.
+
+SERVER SIDE FILE
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ.setdefault("JOB_BACKEND", "memory")
+for name in ("LLM_RATE_LIMIT_RPM", "LLM_TENANT_RATE_LIMIT_RPM"):
+    os.environ.setdefault(name, "6000")
+for name in ("LLM_RATE_LIMIT_BURST", "LLM_TENANT_RATE_LIMIT_BURST"):
+    os.environ.setdefault(name, "1000")
+os.chdir(tempfile.mkdtemp(prefix="f3_tests_"))  # Databases and projects are created in the working directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,60 @@
+"""
+A half-open probe whose cached prefix is rejected retries with the full
+prompt as the same probe.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import importlib
+import time
+
+from server.models.message_models import LLMCallType
+from server.services.ai_service import ai_service
+from server.services.circuit_breaker import CircuitBreaker, STATE_CLOSED
+from server.services.prompt_cache import CachedPrefix
+
+ai_service_module = importlib.import_module("server.services.ai_service")  # The package re-exports the instance under this name
+
+
+def test_probe_retries_rejected_cached_prefix_under_same_admission(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure("timeout")  # Open; the next call is the half-open probe
+    monkeypatch.setattr(ai_service_module, "provider_breaker", breaker)
+
+    prefixes = [CachedPrefix(name="cachedContents/stale", model="fake-model", tokens=5000, expires_at=time.monotonic() + 60)]
+
+    async def get_prefix(provider, model, system_instruction):
+        return prefixes.pop() if prefixes else None
+
+    monkeypatch.setattr(ai_service_module.prompt_cache, "get_prefix", get_prefix)
+
+    requests = []
+
+    async def stream_response(prompt, cached_prefix=None, **kwargs):
+        requests.append(cached_prefix)
+        if cached_prefix is not None:
+            raise Exception("400 Cached content not found")
+        yield "recovered"
+
+    monkeypatch.setattr(ai_service, "stream_response", stream_response)
+
+    async def callback(frame):
+        pass
+
+    response = asyncio.run(ai_service.generate_response(
+        prompt="half-open probe with a stale cached prefix",
+        system_instruction="static instructions",
+        websocket_callback=callback,
+        conversation_id="breaker-test",
+        call_type=LLMCallType.CHAT,
+        paced=False
+    ))
+
+    assert response == "recovered"
+    assert requests == ["cachedContents/stale", None]
+    assert breaker.state == STATE_CLOSED
+    assert breaker.rejected_calls == 0
@@ -0,0 +1,53 @@
+"""
+When coding fails, the turn's planner and progress narration stop with it.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+
+from server.coordinator.agent_coordinator import agent_coordinator
+from server.agents.planning_agent import planning_agent
+from server.agents.coding_agent import coding_agent
+from server.models.message_models import ActionStep, ConversationState, IntentType, ModeType
+
+
+def test_failed_coding_cancels_planner_and_narration(monkeypatch):
+    stopped = []
+
+    async def create_plan(user_request, project_context, on_step=None, **kwargs):
+        await on_step(ActionStep(step_number=1, action_type="create_file", description="Button", target_file="lib/a.dart"))
+        try:
+            await asyncio.sleep(60)  # Still generating the rest of the plan
+        finally:
+            stopped.append("planner")
+
+    async def send_progress_update(conversation_id, status, **kwargs):
+        try:
+            await asyncio.sleep(60)  # Narrating the coding stage
+        finally:
+            stopped.append("narration")
+
+    async def execute_plan_stream(steps, **kwargs):
+        async for step in steps:
+            await asyncio.sleep(0)  # Let the narration task start
+            raise RuntimeError("compile step exploded")
+
+    monkeypatch.setattr(planning_agent, "create_plan", create_plan)
+    monkeypatch.setattr(agent_coordinator, "_send_progress_update", send_progress_update)
+    monkeypatch.setattr(coding_agent, "execute_plan_stream", execute_plan_stream)
+
+    async def scenario():
+        conv_state = ConversationState(conversation_id="code-mode-test", current_mode=ModeType.CODE_MODE, message_history=[])
+        response = await asyncio.wait_for(
+            agent_coordinator._handle_code_mode("make a button", conv_state, IntentType.CODE), timeout=5.0
+        )
+        return response, sorted(stopped)  # Before asyncio.run cancels whatever is left
+
+    response, stopped_on_return = asyncio.run(scenario())
+
+    assert "compile step exploded" in response.content
+    assert stopped_on_return == ["narration", "planner"]
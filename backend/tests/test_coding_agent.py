@@ -0,0 +1,55 @@
+"""
+A failing plan step doesn't throw away the changes of steps that finished.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+
+from server.agents.coding_agent import coding_agent
+from server.models.message_models import ActionStep, CodeChange, CodeGenerationResult
+
+
+async def _execute_step(step, project_context, websocket_callback=None, conversation_id=None):
+    if step.target_file == "lib/broken.dart":
+        await asyncio.sleep(0.05)
+        raise RuntimeError("provider went away")
+    return CodeGenerationResult(
+        success=True,
+        changes=[CodeChange(file_path=step.target_file, operation="create", content="// ok", line_numbers=None)],
+        message="ok"
+    )
+
+
+def _step(target_file: str) -> ActionStep:
+    return ActionStep(step_number=0, action_type="create_file", description=f"Create {target_file}", target_file=target_file)
+
+
+def test_raising_step_keeps_finished_changes(monkeypatch):
+    monkeypatch.setattr(coding_agent, "execute_step", _execute_step)
+
+    async def steps():
+        for target_file in ("lib/good.dart", "lib/broken.dart"):
+            yield _step(target_file)
+
+    result = asyncio.run(coding_agent.execute_plan_stream(steps(), {}))
+    assert not result.success
+    assert "provider went away" in result.message
+    assert [change.file_path for change in result.changes] == ["lib/good.dart"]
+
+
+def test_failing_step_source_keeps_finished_changes(monkeypatch):
+    monkeypatch.setattr(coding_agent, "execute_step", _execute_step)
+
+    async def steps():
+        yield _step("lib/good.dart")
+        await asyncio.sleep(0.05)
+        raise RuntimeError("plan stream broke")
+
+    result = asyncio.run(coding_agent.execute_plan_stream(steps(), {}))
+    assert not result.success
+    assert result.message == "Execution error: plan stream broke"
+    assert [change.file_path for change in result.changes] == ["lib/good.dart"]
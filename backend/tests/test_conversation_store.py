@@ -0,0 +1,45 @@
+"""
+A cleared conversation stays cleared for every process, including after a
+restart, and async code rehydrates conversations in a thread.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import uuid
+
+from server.database.repositories import user_repo, conversation_repo, message_repo
+from server.services.conversation_store import ConversationStore
+
+
+def test_cleared_history_is_not_rehydrated_by_another_process():
+    suffix = uuid.uuid4().hex[:8]
+    user_id = user_repo.create_user(f"{suffix}@example.com", f"user-{suffix}", "hash")
+    conversation_id = f"clear-{suffix}"
+    conv_id = conversation_repo.create_conversation(user_id, conversation_id)
+    message_repo.create_message(conv_id, "user", "make a login page")
+    message_repo.create_message(conv_id, "assistant", "Here is the login page")
+
+    ConversationStore().forget(conversation_id)
+    message_repo.create_message(conv_id, "user", "start over with a signup page")
+
+    other_process = ConversationStore()
+    history = other_process[conversation_id].message_history
+    assert [message.content for message in history] == ["start over with a signup page"]
+
+
+def test_load_rehydrates_off_the_event_loop():
+    suffix = uuid.uuid4().hex[:8]
+    user_id = user_repo.create_user(f"{suffix}@example.com", f"user-{suffix}", "hash")
+    conversation_id = f"load-{suffix}"
+    conv_id = conversation_repo.create_conversation(user_id, conversation_id)
+    message_repo.create_message(conv_id, "user", "make a login page")
+
+    store = ConversationStore()
+    state = asyncio.run(store.load(conversation_id))
+    assert [message.content for message in state.message_history] == ["make a login page"]
+    assert store.peek(conversation_id) is state
+    assert asyncio.run(store.load(f"missing-{suffix}")) is None
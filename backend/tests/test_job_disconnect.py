@@ -0,0 +1,64 @@
+"""
+Async jobs keep running when the conversation's last WebSocket client disconnects.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["JOB_BACKEND"] = "memory"
+os.environ.setdefault("CANCEL_ON_DISCONNECT", "true")
+for name in ("LLM_RATE_LIMIT_RPM", "LLM_TENANT_RATE_LIMIT_RPM"):
+    os.environ.setdefault(name, "6000")
+for name in ("LLM_RATE_LIMIT_BURST", "LLM_TENANT_RATE_LIMIT_BURST"):
+    os.environ.setdefault(name, "1000")
+os.chdir(tempfile.mkdtemp(prefix="f3_tests_"))  # Databases and projects are created in the working directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.testclient import TestClient
+
+from server.main import app
+
+
+def _wait_for_job(client: TestClient, job_id: str, statuses, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} never reached {statuses}")
+
+
+def test_job_survives_websocket_disconnect():
+    with TestClient(app) as client:
+        project = client.post("/api/projects", json={"user_prompt": "button"}).json()
+        conversation_id = project["conversation_id"]
+
+        with client.websocket_connect("/ws/job-watcher") as ws:
+            ws.receive_json()
+            ws.send_json({"type": "join_conversation", "conversation_id": conversation_id})
+            while ws.receive_json()["type"] != "conversation_joined":
+                pass
+
+            submitted = client.post("/api/chat", json={
+                "message": "Create a gradient button widget",
+                "conversation_id": conversation_id,
+                "project_context": {"project_id": project["project_id"]},
+                "async_job": True
+            })
+            assert submitted.status_code == 202
+            job_id = submitted.json()["job_id"]
+            _wait_for_job(client, job_id, ("running", "completed"))
+        # The watcher is gone; the job still runs to the end
+
+        job = _wait_for_job(client, job_id, ("completed", "failed", "cancelled"))
+        assert job["status"] == "completed"
+        assert job["result"]["error"] is None
@@ -0,0 +1,55 @@
+"""
+A conversation runs one turn at a time across the API and worker processes.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import uuid
+
+import pytest
+
+from server.services.job_queue import DurableJobQueue, ConversationBusy
+
+
+def _queue() -> DurableJobQueue:
+    return DurableJobQueue(enabled=True, visibility_timeout=30.0)
+
+
+def test_workers_skip_a_conversation_the_api_is_answering():
+    queue = _queue()
+    conversation_id = f"lease-{uuid.uuid4().hex}"
+
+    async def scenario():
+        async with queue.hold_conversation(conversation_id):
+            queue.submit({"message": "later"}, conversation_id=conversation_id)
+            assert queue.claim("worker-a") is None
+        return queue.claim("worker-a")
+
+    claimed = asyncio.run(scenario())
+    assert claimed is not None
+    job, payload, lease = claimed
+    assert job.conversation_id == conversation_id and payload == {"message": "later"}
+    queue.finish(job, lease, "completed", result={})
+
+
+def test_a_turn_is_refused_while_a_job_of_its_conversation_is_pending():
+    queue = _queue()
+    conversation_id = f"lease-{uuid.uuid4().hex}"
+    queue.submit({"message": "background"}, conversation_id=conversation_id)
+
+    async def enter():
+        async with queue.hold_conversation(conversation_id):
+            pass
+
+    with pytest.raises(ConversationBusy):
+        asyncio.run(enter())  # Queued
+    job, _, lease = queue.claim("worker-a")
+    with pytest.raises(ConversationBusy):
+        asyncio.run(enter())  # Running
+    queue.finish(job, lease, "completed", result={})
+    asyncio.run(enter())
+    assert queue.get_stats()["conversations_busy"] == 2
@@ -0,0 +1,63 @@
+"""
+Plan cache matches rephrasings of a request but not swapped attributes.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+from server.models.message_models import ActionStep, ExecutionPlan
+from server.services.plan_cache import PlanCache
+
+
+def _plan() -> ExecutionPlan:
+    return ExecutionPlan(
+        plan_id="original",
+        steps=[ActionStep(step_number=1, action_type="create_file", description="Button", target_file="lib/button.dart")],
+        estimated_files=["lib/button.dart"]
+    )
+
+
+def test_reordered_adjectives_hit():
+    cache = PlanCache()
+    cache.store("create a blue rounded button", _plan(), {"project_id": "p1"})
+
+    plan = cache.lookup("make a rounded blue button", {"project_id": "p1"})
+    assert plan is not None
+    assert plan.plan_id != "original"
+    assert plan.steps[0].target_file == "lib/button.dart"
+
+
+def test_swapped_attributes_miss():
+    cache = PlanCache()
+    cache.store("red button with blue text", _plan(), {"project_id": "p1"})
+
+    assert cache.lookup("blue button with red text", {"project_id": "p1"}) is None
+    assert cache.lookup("a red button with blue text", {"project_id": "p1"}) is not None
+
+
+def test_scope_is_the_project_not_its_files():
+    cache = PlanCache()
+    cache.store("create a blue rounded button", _plan(), {"project_id": "p1", "files": {}})
+
+    after_first_plan = {"project_id": "p1", "files": {"lib/button.dart": "..."}}
+    assert cache.lookup("make a rounded blue button", after_first_plan) is not None
+    assert cache.lookup("make a rounded blue button", {"project_id": "p2"}) is None
+
+
+def test_rephrasing_with_different_phrases_hits_below_threshold():
+    cache = PlanCache(threshold=0.6)
+    cache.store("create a blue rounded button with a drop shadow", _plan(), {"project_id": "p1"})
+
+    assert cache.lookup("make a rounded blue button with shadow", {"project_id": "p1"}) is not None
+    assert cache.lookup("make a rounded blue button with a red border", {"project_id": "p1"}) is None
+
+
+def test_requests_without_a_project_are_not_cached():
+    cache = PlanCache()
+    cache.store("create a blue rounded button", _plan(), {"user_id": "u1"})
+
+    assert cache.lookup("create a blue rounded button", {"user_id": "u2"}) is None
+    assert cache.lookup("create a blue rounded button") is None
+    assert cache.get_stats()["entries"] == 0
@@ -0,0 +1,118 @@
+"""
+Streamed plan steps from a rejected attempt are replaced by the accepted
+attempt's steps.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import json
+
+from server.agents.planning_agent import planning_agent
+from server.services.ai_service import ai_service
+
+
+def _plan_json(*files):
+    return json.dumps({
+        "plan_id": "plan",
+        "steps": [
+            {"step_number": i, "action_type": "create_file", "description": f"Create {name}", "target_file": name}
+            for i, name in enumerate(files, 1)
+        ],
+        "estimated_files": list(files)
+    })
+
+
+def test_failed_first_attempt_restarts_streamed_steps(monkeypatch):
+    rejected = _plan_json("lib/old_a.dart", "lib/old_b.dart")
+    accepted = _plan_json("lib/new_a.dart", "lib/new_b.dart")
+
+    async def two_attempts(prompt, system_instruction, websocket_callback, conversation_id, response_format="json", call_type=None):
+        # First attempt streams two steps and then breaks off; the retry is accepted
+        await websocket_callback({"type": "stream_start"})
+        await websocket_callback({"type": "stream_token", "content": rejected[:rejected.index("]")]})
+        await websocket_callback({"type": "stream_error", "error": "connection reset"})
+        await websocket_callback({"type": "stream_start"})
+        await websocket_callback({"type": "stream_token", "content": accepted})
+        return json.loads(accepted)
+
+    monkeypatch.setattr(ai_service, "generate_structured_response", two_attempts)
+
+    events = []
+
+    async def on_step(step):
+        events.append(step.target_file)
+
+    async def on_restart():
+        events.append("restart")
+
+    plan = asyncio.run(planning_agent.create_plan(
+        "streamed plan retry test request", {"project_id": "plan-stream-test"},
+        on_step=on_step, on_restart=on_restart
+    ))
+
+    assert events == ["lib/old_a.dart", "lib/old_b.dart", "restart", "lib/new_a.dart", "lib/new_b.dart"]
+    assert [step.target_file for step in plan.steps] == ["lib/new_a.dart", "lib/new_b.dart"]
+
+
+def test_steps_wait_for_the_accepted_plan_without_on_restart(monkeypatch):
+    rejected = _plan_json("lib/old_a.dart")
+    accepted = _plan_json("lib/new_a.dart")
+
+    async def two_attempts(prompt, system_instruction, websocket_callback, conversation_id, response_format="json", call_type=None):
+        await websocket_callback({"type": "stream_start"})
+        await websocket_callback({"type": "stream_token", "content": rejected})
+        await websocket_callback({"type": "stream_start"})
+        await websocket_callback({"type": "stream_token", "content": accepted})
+        return json.loads(accepted)
+
+    monkeypatch.setattr(ai_service, "generate_structured_response", two_attempts)
+
+    events = []
+
+    async def on_step(step):
+        events.append(step.target_file)
+
+    asyncio.run(planning_agent.create_plan(
+        "buffered plan retry test request", {"project_id": "plan-stream-test"}, on_step=on_step
+    ))
+
+    assert events == ["lib/new_a.dart"]
+
+
+def test_failed_step_hand_out_fails_the_plan(monkeypatch):
+    streamed = _plan_json("lib/a.dart", "lib/b.dart")
+    channels = []
+
+    async def one_attempt(prompt, system_instruction, websocket_callback, conversation_id, response_format="json", call_type=None):
+        channels.append(conversation_id)
+        await websocket_callback({"type": "stream_start"})
+        await websocket_callback({"type": "stream_token", "content": streamed})
+        return json.loads(streamed)
+
+    monkeypatch.setattr(ai_service, "generate_structured_response", one_attempt)
+
+    async def on_step(step):
+        raise RuntimeError("coding could not start")
+
+    async def on_restart():
+        pass
+
+    async def two_plans():
+        return await asyncio.gather(*(
+            planning_agent.create_plan(
+                f"failing hand-out test request {i}", {"project_id": "plan-stream-test"},
+                on_step=on_step, on_restart=on_restart
+            )
+            for i in range(2)
+        ))
+
+    plans = asyncio.run(two_plans())
+
+    assert all(plan.steps[0].action_type == "error" for plan in plans)
+    assert "coding could not start" in plans[0].steps[0].description
+    # Each plan streams on its own delivery channel
+    assert len(set(channels)) == 2 and all(channel.startswith("planning_internal:") for channel in channels)
@@ -0,0 +1,66 @@
+"""
+A call that times out because its request's latency budget ran out fails
+with DeadlineExceeded without being charged to the provider.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import importlib
+import time
+
+import pytest
+
+from server.models.message_models import LLMCallType
+from server.services.ai_service import ai_service
+from server.services.call_context import LLMCallContext, set_call_context
+from server.services.circuit_breaker import CircuitBreaker
+from server.services.request_deadline import DeadlineExceeded, deadline_policy
+
+ai_service_module = importlib.import_module("server.services.ai_service")  # The package re-exports the instance under this name
+
+
+def _timing_out(timeouts):
+    async def stream_response(prompt, timeout=None, **kwargs):
+        timeouts.append(timeout)
+        raise asyncio.TimeoutError(f"LLM call timed out after {timeout:g}s")
+        yield
+    return stream_response
+
+
+async def _chat(prompt: str, deadline_in: float):
+    call_context = LLMCallContext(conversation_id="deadline-test")
+    call_context.deadline = time.monotonic() + deadline_in
+    set_call_context(call_context)
+
+    async def callback(frame):
+        pass
+
+    return await ai_service.generate_response(
+        prompt=prompt,
+        websocket_callback=callback,
+        conversation_id="deadline-test",
+        call_type=LLMCallType.CHAT,
+        paced=False
+    )
+
+
+def test_deadline_timeout_is_not_retried_or_held_against_the_provider(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    monkeypatch.setattr(ai_service_module, "provider_breaker", breaker)
+    overloads = []
+    monkeypatch.setattr(ai_service_module.llm_scheduler, "on_overload", overloads.append)
+    timeouts = []
+    monkeypatch.setattr(ai_service, "stream_response", _timing_out(timeouts))
+    out_of_time = deadline_policy.calls_out_of_time
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(_chat("tight budget", deadline_in=1.0))
+
+    assert timeouts == [deadline_policy.min_call_timeout]
+    assert overloads == []
+    assert breaker.consecutive_failures == 0 and breaker.retry_after() == 0
+    assert deadline_policy.calls_out_of_time == out_of_time + 1
@@ -0,0 +1,77 @@
+"""
+Hedge requests take their own scheduler slot and are skipped when none is free.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+
+from server.models.message_models import LLMCallType
+from server.services.llm_scheduler import LLMScheduler
+from server.services.request_hedging import RequestHedger
+
+
+def _hedger() -> RequestHedger:
+    hedger = RequestHedger({LLMCallType.CODE}, min_samples=1, min_delay=0.01, burst=3.0)
+    hedger._observe_first_token(LLMCallType.CODE, 0.01)
+    return hedger
+
+
+def _slow_then_fast():
+    calls = []
+
+    async def start(usage):
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(1.0)  # The primary is stuck before its first token
+        yield "hello"
+
+    return calls, start
+
+
+async def _stream(hedger: RequestHedger, scheduler: LLMScheduler, start):
+    await scheduler.acquire(LLMCallType.CODE)  # The primary's own slot
+    during = []
+    try:
+        async for chunk in hedger.stream(
+            LLMCallType.CODE, start, {},
+            acquire_slot=scheduler.try_acquire,
+            release_slot=scheduler.release
+        ):
+            during.append(scheduler.running)
+    finally:
+        scheduler.release()
+    return during
+
+
+def test_hedge_holds_its_own_slot():
+    async def scenario():
+        scheduler = LLMScheduler(initial_concurrency=2)
+        hedger = _hedger()
+        calls, start = _slow_then_fast()
+        during = await _stream(hedger, scheduler, start)
+        return calls, during, scheduler.running, hedger.get_stats()
+
+    calls, during, running_after, stats = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert during == [2]  # Primary and hedge each held a slot while the hedge streamed
+    assert running_after == 0
+    assert stats["by_call_type"]["code"]["hedge_wins"] == 1
+
+
+def test_no_hedge_without_a_free_slot():
+    async def scenario():
+        scheduler = LLMScheduler(initial_concurrency=1)
+        hedger = _hedger()
+        calls, start = _slow_then_fast()
+        during = await _stream(hedger, scheduler, start)
+        return calls, during, scheduler.running, hedger.get_stats()
+
+    calls, during, running_after, stats = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert during == [1]
+    assert running_after == 0
+    assert stats["by_call_type"]["code"]["slot_denied"] == 1
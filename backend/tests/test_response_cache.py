@@ -0,0 +1,77 @@
+"""
+Structured responses are cached under the cascade that produced them.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+import json
+import time
+
+from server.models.message_models import LLMCallType
+from server.services.ai_service import ai_service
+from server.services.call_context import LLMCallContext, set_call_context
+from server.services.response_cache import response_cache
+
+
+def _escalating_model(calls):
+    async def generate_response(prompt, system_instruction=None, model=None, **kwargs):
+        calls.append(model)
+        confidence = 0.2 if model == "fast" else 0.9  # The cheap model isn't sure: escalate
+        return json.dumps({"intent": "code", "confidence": confidence, "answered_by": model})
+    return generate_response
+
+
+async def _noop(frame):
+    pass
+
+
+async def _structured(prompt: str, deadline_in=None):
+    call_context = LLMCallContext(conversation_id="response-cache-test")
+    if deadline_in is not None:
+        call_context.deadline = time.monotonic() + deadline_in
+    set_call_context(call_context)
+    return await ai_service.generate_structured_response(
+        prompt=prompt,
+        system_instruction="Classify the message.",
+        websocket_callback=_noop,
+        conversation_id="response-cache-test",
+        call_type=LLMCallType.INTENT
+    )
+
+
+def test_escalated_result_is_not_stored_under_the_fast_model(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ai_service, "generate_response", _escalating_model(calls))
+    prompt = "escalated result cache key test"
+
+    first = asyncio.run(_structured(prompt))
+    assert first["answered_by"] == "default"
+    assert calls == ["fast", "default"]
+
+    # The same cascade hits; a plain fast-model key does not
+    assert asyncio.run(_structured(prompt))["answered_by"] == "default"
+    assert calls == ["fast", "default"]
+    full_system = "Classify the message.\n\nIMPORTANT: Respond ONLY with valid JSON. No markdown, no explanations, just the JSON object."
+    route = ai_service.router.route(LLMCallType.INTENT)
+    fast_only_key = response_cache.make_key(ai_service.provider.resolve_model("fast"), full_system, prompt, route.temperature)
+    assert response_cache.get(fast_only_key) is None
+
+
+def test_degraded_cascade_reuses_full_route_but_stores_separately(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ai_service, "generate_response", _escalating_model(calls))
+
+    # A full-route answer serves a deadline-degraded call
+    asyncio.run(_structured("degraded lookup test"))
+    assert asyncio.run(_structured("degraded lookup test", deadline_in=1.0))["answered_by"] == "default"
+    assert calls == ["fast", "default"]
+
+    # A degraded (fast-only) answer is not served to a full-route call
+    calls.clear()
+    assert asyncio.run(_structured("degraded store test", deadline_in=1.0))["answered_by"] == "fast"
+    assert asyncio.run(_structured("degraded store test"))["answered_by"] == "default"
+    assert calls == ["fast", "fast", "default"]
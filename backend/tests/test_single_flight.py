@@ -0,0 +1,94 @@
+"""
+Coalesced generations stay within one conversation, and a cancelled leader
+hands the generation to the next waiter.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+
+from server.models.message_models import LLMCallType
+from server.services.ai_service import ai_service
+from server.services.call_context import LLMCallContext, set_call_context
+from server.services.llm_scheduler import LLMCallCancelled
+from server.services.single_flight import SingleFlight, EVENT_COMPLETE, EVENT_FAILED
+
+
+async def _drain(queue: asyncio.Queue):
+    while True:
+        event_type, payload = await queue.get()
+        if event_type in (EVENT_COMPLETE, EVENT_FAILED):
+            return event_type, payload
+
+
+def test_cancelled_leader_hands_flight_to_next_waiter():
+    async def scenario():
+        single_flight = SingleFlight(reelect_on=(LLMCallCancelled,))
+        ran = []
+
+        async def leader(flight):
+            ran.append("leader")
+            await asyncio.sleep(0.01)
+            raise LLMCallCancelled("LLM call cancelled: conv-a went away")
+
+        async def follower(flight):
+            ran.append("follower")
+            flight.publish(EVENT_COMPLETE, "done")
+
+        _, leader_events = single_flight.join("key", leader)
+        _, follower_events = single_flight.join("key", follower)
+
+        leader_result = await _drain(leader_events)
+        follower_result = await _drain(follower_events)
+        return ran, leader_result, follower_result, single_flight.get_stats()
+
+    ran, leader_result, follower_result, stats = asyncio.run(scenario())
+    assert ran == ["leader", "follower"]
+    assert leader_result[0] == EVENT_FAILED and isinstance(leader_result[1], LLMCallCancelled)
+    assert follower_result == (EVENT_COMPLETE, "done")
+    assert stats["leaders_reelected"] == 1
+
+
+def test_cancelled_leader_without_other_waiters_fails():
+    async def scenario():
+        single_flight = SingleFlight(reelect_on=(LLMCallCancelled,))
+
+        async def leader(flight):
+            raise LLMCallCancelled("LLM call cancelled: conv-a went away")
+
+        _, events = single_flight.join("key", leader)
+        return await _drain(events)
+
+    event_type, payload = asyncio.run(scenario())
+    assert event_type == EVENT_FAILED and isinstance(payload, LLMCallCancelled)
+
+
+def test_identical_prompts_of_different_conversations_are_not_coalesced():
+    async def ask(conversation_id: str):
+        set_call_context(LLMCallContext(conversation_id=conversation_id))
+
+        async def callback(frame):
+            pass
+
+        return await ai_service.generate_response(
+            prompt="Say hello",
+            websocket_callback=callback,
+            conversation_id=conversation_id,
+            call_type=LLMCallType.CHAT,
+            paced=False
+        )
+
+    async def scenario():
+        before = ai_service.single_flight.get_stats()["calls_collapsed"]
+        await asyncio.gather(ask("conv-a"), ask("conv-b"))
+        between = ai_service.single_flight.get_stats()["calls_collapsed"]
+        await asyncio.gather(ask("conv-c"), ask("conv-c"))
+        after = ai_service.single_flight.get_stats()["calls_collapsed"]
+        return between - before, after - between
+
+    across_conversations, within_conversation = asyncio.run(scenario())
+    assert across_conversations == 0
+    assert within_conversation == 1
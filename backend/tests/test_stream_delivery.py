@@ -0,0 +1,95 @@
+"""
+A slow client's delivery queue stays bounded when several streams of one
+conversation interleave.
+
+Run from backend/:
+    python -m pytest -q tests
+
+SERVER SIDE FILE
+"""
+
+import asyncio
+
+from server.services.stream_delivery import StreamDeliveryHub
+
+
+def test_interleaved_streams_are_merged_under_backpressure():
+    async def scenario():
+        hub = StreamDeliveryHub(max_pending=4)
+        release = asyncio.Event()
+        received = []
+
+        async def slow_client(frame):
+            await release.wait()
+            received.append(frame)
+
+        for stream_id in ("a", "b"):
+            hub.put(slow_client, "conv", {"type": "stream_start", "stream_id": stream_id})
+        for i in range(200):
+            stream_id = "a" if i % 2 == 0 else "b"
+            hub.put(slow_client, "conv", {"type": "stream_token", "stream_id": stream_id, "content": f"{i} "})
+            if i % 50 == 0:
+                hub.put(slow_client, "conv", {"type": "ai_progress", "message": "working"})
+        pending = hub.get_stats()["pending_frames"]
+
+        release.set()
+        await hub.wait_drained("conv")
+        return pending, received
+
+    pending, received = asyncio.run(scenario())
+    assert pending <= 10
+
+    for stream_id, numbers in (("a", range(0, 200, 2)), ("b", range(1, 200, 2))):
+        frames = [frame for frame in received if frame.get("stream_id") == stream_id]
+        assert frames[0]["type"] == "stream_start"
+        text = "".join(frame["content"] for frame in frames[1:])
+        assert text == "".join(f"{i} " for i in numbers)
+
+
+def test_token_text_is_not_merged_ahead_of_its_own_control_frame():
+    async def scenario():
+        hub = StreamDeliveryHub(max_pending=1)
+        release = asyncio.Event()
+        received = []
+
+        async def slow_client(frame):
+            await release.wait()
+            received.append(frame)
+
+        hub.put(slow_client, "conv", {"type": "stream_token", "stream_id": "a", "content": "first "})
+        hub.put(slow_client, "conv", {"type": "stream_start", "stream_id": "a"})  # A retry
+        hub.put(slow_client, "conv", {"type": "stream_token", "stream_id": "a", "content": "second"})
+
+        release.set()
+        await hub.wait_drained("conv")
+        return received
+
+    received = asyncio.run(scenario())
+    assert [(frame["type"], frame.get("content")) for frame in received] == [
+        ("stream_token", "first "), ("stream_start", None), ("stream_token", "second")
+    ]
+
+
+def test_requests_sharing_an_internal_id_get_separate_channels():
+    async def scenario():
+        hub = StreamDeliveryHub(max_pending=4)
+        release = asyncio.Event()
+        received = []
+
+        async def client(frame):
+            if frame["request_id"] == "slow":
+                await release.wait()
+            received.append(frame["request_id"])
+
+        hub.put(client, "intent_classification", {"type": "stream_start", "request_id": "slow"}, request_id="slow")
+        hub.put(client, "intent_classification", {"type": "stream_start", "request_id": "fast"}, request_id="fast")
+        await asyncio.sleep(0.01)
+        delivered_while_blocked = list(received)
+
+        release.set()
+        await hub.wait_drained("intent_classification")
+        return delivered_while_blocked, received
+
+    delivered_while_blocked, received = asyncio.run(scenario())
+    assert delivered_while_blocked == ["fast"]
+    assert sorted(received) == ["fast", "slow"]